@@ -261,39 +261,132 @@ def soil_plant_water_balance(
     drainage = xr.full_like(sm, fill_value=np.nan)
     # sm starts with initial condition sminit
     sm = xr.concat([sminit, sm], time_dim)
-    # Filling/emptying bucket day after day
-    for doy in range(0, peffective[time_dim].size):
+    # Filling/emptying bucket day after day, for all grid points and
+    # scenarios (extra dims of the inputs) at once: all arrays are laid
+    # out with time first, then the other dims of sm.
+    dims = [d for d in sm.dims if d != time_dim]
+    ndays = peffective[time_dim].size
+    sm_steps = _time_first(sm, dims, time_dim, copy=True)
+    drainage_steps = _time_first(drainage, dims, time_dim, copy=True)
+    peffective_steps = _time_first(peffective, dims, time_dim)
+    et_steps = _time_first(et, dims, time_dim)
+    taw_steps = _time_first(taw, dims, time_dim)[0]
+    if kc_params is None:
+        et_crop_steps = et_steps
+    else:
+        kc_kwargs = dict(fill_value=1)
+        if planting_date is None:
+            # planted_since is 0 to ndays - 1 days once planted: look
+            # kc up in a table
+            kc_table = _time_first(
+                kc_inflex.interp(
+                    kc_periods=xr.DataArray(
+                        np.arange(ndays).astype("timedelta64[D]"), dims=[time_dim]
+                    ).astype(planted_since.dtype).broadcast_like(
+                        kc_inflex.isel({"kc_periods": 0}, drop=True)
+                    ),
+                    kwargs=kc_kwargs,
+                ).fillna(1).drop_vars("kc_periods"),
+                dims,
+                time_dim,
+            )
+            since_dims = planted_since.dims + tuple(
+                d for d in dims if d not in planted_since.dims
+            )
+            since_steps = _time_first(planted_since, dims, time_dim)[0]
+            sm_threshold_steps = _time_first(
+                xr.DataArray(sm_threshold), dims, time_dim
+            )[0]
+        else:
+            kc_steps = _time_first(
+                kc_inflex.interp(
+                    kc_periods=planted_since + xr.DataArray(
+                        np.arange(ndays) * np.timedelta64(1, "D"), dims=[time_dim]
+                    ),
+                    kwargs=kc_kwargs,
+                ).fillna(1).drop_vars("kc_periods"),
+                dims,
+                time_dim,
+            )
+        if time_dim in et_crop.dims:
+            et_crop_steps = _time_first(et_crop, dims, time_dim, copy=True)
+        else:
+            et_crop_steps = _time_first(et_crop, dims, time_dim)
+    if rho_crop is None:
+        et_crop_red_steps = et_crop_steps
+    else:
+        rho_crop_steps = _time_first(rho_crop, dims, time_dim)[0]
+        if not rho_adj:
+            raw = _time_first(raw, dims, time_dim)[0]
+        et_crop_red_steps = _time_first(et_crop_red, dims, time_dim, copy=True)
+    for doy in range(ndays):
         if kc_params is not None: # interpolate kc value per distance from planting
-            kc = kc_inflex.interp(
-                kc_periods=planted_since, kwargs={"fill_value": 1}
-            ).where(lambda x: x.notnull(), other=1).drop_vars("kc_periods")
+            if planting_date is None:
+                kc = np.where(
+                    np.isnat(since_steps),
+                    1,
+                    np.take_along_axis(
+                        kc_table,
+                        np.nan_to_num(
+                            since_steps / np.timedelta64(1, "D")
+                        ).astype(int)[np.newaxis],
+                        axis=0,
+                    )[0],
+                )
+            else:
+                kc = kc_steps[doy]
             if time_dim in et_crop.dims: # et _crop depends on time_dim but et might not
-                et_crop[{time_dim: doy}] = kc * et.isel({time_dim: doy}, missing_dims='ignore')
+                et_crop_steps[doy] = kc * _day(et_steps, doy)
         if rho_crop is not None: # apply water stress conditions penalization of et_crop
             if rho_adj: # raw depends on et_crop
                 raw = (
-                    rho_crop + 0.04 * (5 - et_crop.isel({time_dim: doy}, missing_dims='ignore'))
-                ).clip(0.1, 0.8) * taw
+                    rho_crop_steps + 0.04 * (5 - _day(et_crop_steps, doy))
+                ).clip(0.1, 0.8) * taw_steps
             # penalization depends on previous day sm
-            ks = (sm.isel({time_dim: doy}, drop=True) / raw).clip(max=1)
-            et_crop_red[{time_dim: doy}] = ks * et_crop.isel({time_dim: doy}, missing_dims='ignore')
+            ks = (sm_steps[doy] / raw).clip(max=1)
+            et_crop_red_steps[doy] = ks * _day(et_crop_steps, doy)
         # water balance step
-        sm[{time_dim: doy+1}], drainage[{time_dim: doy}] = soil_plant_water_step(
-            sm.isel({time_dim: doy}, drop=True),
-            peffective.isel({time_dim: doy}, drop=True),
-            et_crop_red.isel({time_dim: doy}, missing_dims='ignore', drop=True),
-            taw,
+        sm_steps[doy+1], drainage_steps[doy] = soil_plant_water_step(
+            sm_steps[doy],
+            peffective_steps[doy],
+            _day(et_crop_red_steps, doy),
+            taw_steps,
         )
         # Increment planted_since
-        if kc_params is not None:
-            if planting_date is None: # did doy met planting conditions?
-                planted_since = planted_since.where(
-                    lambda x: x.notnull(), # no planting date found yet
-                    other=xr.where( # next day is planting if sm condition met
-                        sm.isel({time_dim: doy+1}) >= sm_threshold, -1, np.nan
-                    ).astype("timedelta64[D]"),
-                )
-            planted_since = planted_since + np.timedelta64(1, "D")
+        if kc_params is not None and planting_date is None:
+            # did doy met planting conditions?
+            since_steps = np.where(
+                np.isnat(since_steps), # no planting date found yet
+                np.where( # next day is planting if sm condition met
+                    sm_steps[doy+1] >= sm_threshold_steps,
+                    np.timedelta64(-1, "D"),
+                    np.timedelta64("NaT", "D"),
+                ),
+                since_steps,
+            ) + np.timedelta64(1, "D")
+    sm = _from_time_first(sm_steps, sm, dims, time_dim)
+    drainage = _from_time_first(drainage_steps, drainage, dims, time_dim)
+    if kc_params is not None and time_dim in et_crop.dims:
+        et_crop = _from_time_first(et_crop_steps, et_crop, dims, time_dim)
+    if rho_crop is None:
+        et_crop_red = et_crop
+    else:
+        et_crop_red = _from_time_first(
+            et_crop_red_steps, et_crop_red, dims, time_dim
+        )
+    if kc_params is not None and planting_date is None:
+        planted_since = xr.DataArray(
+            since_steps,
+            dims=dims,
+            coords={
+                k: v for k, v in sm.coords.items()
+                if time_dim not in v.dims and k != time_dim
+            },
+        ).transpose(*since_dims)
+        if ndays == 1:
+            planted_since = planted_since.assign_coords(
+                {time_dim: peffective[time_dim][0]}
+            )
     # Let's have sm same shape as other variables
     sm = sm.isel({time_dim: slice(1,None)})
     # Let's save planting_date
@@ -310,6 +403,36 @@ def soil_plant_water_balance(
     )
 
 
+def _time_first(x, dims, time_dim, copy=False):
+    """Values of `x` with `time_dim` first, of length 1 if `x` has no
+    `time_dim`, then `dims`, of length 1 where `x` doesn't have them.
+    """
+    x = xr.DataArray(x)
+    missing = set(x.dims) - set(dims) - {time_dim}
+    if missing:
+        raise ValueError(f"unexpected dims {sorted(missing)}")
+    order = [d for d in [time_dim, *dims] if d in x.dims]
+    values = x.transpose(*order).values
+    values = values.reshape([
+        x.sizes[d] if d in x.dims else 1 for d in [time_dim, *dims]
+    ])
+    return np.array(values) if copy else values
+
+
+def _from_time_first(values, template, dims, time_dim):
+    """`template` with `values`, laid out as by `_time_first`."""
+    order = [d for d in [time_dim, *dims] if d in template.dims]
+    values = values.reshape([template.sizes[d] for d in order])
+    return template.copy(
+        data=values.transpose([order.index(d) for d in template.dims])
+    )
+
+
+def _day(steps, doy):
+    """Values on day `doy` of `steps`, laid out as by `_time_first`."""
+    return steps[doy if len(steps) > 1 else 0]
+
+
 def api_runoff(
     daily_rain,
     api,
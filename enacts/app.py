@@ -1,8 +1,9 @@
+import calc
 import flask
 import importlib
 import os
 
-from globals_ import FLASK, GLOBAL_CONFIG
+from globals_ import FLASK, GLOBAL_CONFIG, GEOMETRIES, TILE_CACHE
 import homepage
 import pingrid
 
@@ -19,6 +20,33 @@ def health_endpoint():
     return flask.jsonify({'status': 'healthy', 'name': 'python_maproom'})
 
 
+def adm_geometries(level):
+    shapes_adm = GLOBAL_CONFIG["datasets"]["shapes_adm"]
+    if not 0 <= level < len(shapes_adm):
+        flask.abort(404)
+    return GEOMETRIES.get(shapes_adm[level]["sql"])
+
+
+# Admin boundaries as vector tiles, for clients that can draw them.
+pingrid.add_mvt_route(
+    FLASK,
+    f"{GLOBAL_CONFIG['url_path_prefix']}/tiles/adm/<int:level>/<int:tz>/<int:tx>/<int:ty>",
+    adm_geometries,
+    TILE_CACHE,
+)
+
+
+@FLASK.route(f"{GLOBAL_CONFIG['url_path_prefix']}/stats")
+def stats_endpoint():
+    return flask.jsonify({
+        'tile_cache': TILE_CACHE.stats(),
+        'mask_cache': pingrid.impl.MASK_CACHE.stats(),
+        'db_pool': pingrid.db_pool(GLOBAL_CONFIG["db"]).stats(),
+        'geometries': GEOMETRIES.stats(),
+        'data_cache': calc.data_cache_stats(),
+    })
+
+
 if __name__ == "__main__":
     if GLOBAL_CONFIG["mode"] != "prod":
         import warnings
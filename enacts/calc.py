@@ -2,7 +2,8 @@ import numpy as np
 import pandas as pd
 import xarray as xr
 import datetime
-import psycopg2
+import pingrid
+import runs
 from psycopg2 import sql
 import shapely
 from shapely import wkb
@@ -12,7 +13,65 @@ from shapely.geometry.multipolygon import MultiPolygon
 
 np.random.seed(123)
 
-def get_data(variable, time_res, ds_conf):
+# Data are requested by nearly every callback and tile, so opened
+# datasets and synthesized ones are kept, up to a bound.
+# Opened datasets are opened again when their store changes (see
+# pingrid.path_version); synthetic ones last a day, since they run up to
+# today.
+_DATASETS = pingrid.DatasetRegistry()
+_SYNTHETIC = pingrid.LRUCache(2 * 2 ** 30, sizeof=lambda da: da.nbytes)
+
+
+def configure_data_cache(
+    check_interval=0.0, synthetic_max_bytes=2 * 2 ** 30, max_datasets=128
+):
+    """ Configure the caches of `get_data` and `get_taw`
+
+    Parameters
+    ----------
+    check_interval : real, optional
+        seconds during which an opened dataset is reused without checking
+        whether its store changed (default is 0: checked on every use)
+    synthetic_max_bytes : int, optional
+        maximum total size of the synthetic datasets kept
+        (default is 2 GiB)
+    max_datasets : int, optional
+        maximum number of opened datasets kept (default is 128)
+    
+    See Also
+    --------
+    clear_data_cache, pingrid.DatasetRegistry
+    """
+    global _DATASETS, _SYNTHETIC
+    _DATASETS = pingrid.DatasetRegistry(check_interval, max_datasets)
+    _SYNTHETIC = pingrid.LRUCache(
+        synthetic_max_bytes, sizeof=lambda da: da.nbytes
+    )
+
+
+def clear_data_cache():
+    """ Forget all datasets kept by `get_data` and `get_taw`
+
+    Data are read or synthesized again on their next use.
+    """
+    _DATASETS.clear()
+    _SYNTHETIC.clear()
+
+
+def data_cache_stats():
+    """ Statistics of the caches of `get_data` and `get_taw` """
+    return {"datasets": _DATASETS.stats(), "synthetic": _SYNTHETIC.stats()}
+
+
+def _synthetic(key, synthesize):
+    data = _SYNTHETIC.get(key)
+    if data is None:
+        data = synthesize()
+        _SYNTHETIC.put(key, data)
+    return data
+
+
+def get_data(variable, time_res, ds_conf, resolution=None):
     """ Gets ENACTS data for ENACTS Maprooms, read from files or synthetic
 
      Parameters
@@ -24,6 +83,10 @@ def get_data(variable, time_res, ds_conf):
     ds_conf : dict
         dictionary indicating ENACTS datasets configuration
         (see config)
+    resolution : real, optional
+        size in degrees of the map pixels the data is for, in which case
+        the data is decimated to the coarsest grid at least that fine
+        (default is None: full resolution)
     
     Returns
     -------
@@ -31,15 +94,20 @@ def get_data(variable, time_res, ds_conf):
     
     See Also
     --------
-    read_enacts, synthesize_enacts
+    read_enacts, synthesize_enacts, pingrid.open_overview, clear_data_cache
     """
     if ds_conf[time_res] == "FAKE" :
-        return synthesize_enacts(variable, time_res, ds_conf["bbox"])
+        bbox = tuple(ds_conf["bbox"])
+        data = _synthetic(
+            ("enacts", variable, time_res, bbox, datetime.date.today()),
+            lambda: synthesize_enacts(variable, time_res, bbox),
+        )
+        return pingrid.decimate_to(data, resolution)
     else:
-        return read_enacts(variable, ds_conf[time_res])
+        return read_enacts(variable, ds_conf[time_res], resolution=resolution)
 
 
-def read_enacts(variable, dst_conf):
+def read_enacts(variable, dst_conf, resolution=None):
     """ Read ENACTS data
 
     Parameters
@@ -49,6 +117,10 @@ def read_enacts(variable, dst_conf):
     dst_conf : dict
         dictionary indicating ENACTS zarr paths for a given time resolution
         (see config)
+    resolution : real, optional
+        size in degrees of the map pixels the data is for, in which case
+        the coarsest suitable overview is read (default is None: full
+        resolution)
     
     Returns
     -------
@@ -56,15 +128,63 @@ def read_enacts(variable, dst_conf):
     
     See Also
     --------
-    xr.open_zarr
+    xr.open_zarr, pingrid.open_overview
     """
     data_path = dst_conf['vars'][variable][1]
     if data_path is None:
         data_path = dst_conf['vars'][variable][0]
     zarr_path = f"{dst_conf['zarr_path']}{data_path}"
     var_name = dst_conf['vars'][variable][2]
-    xrds = xr.open_zarr(zarr_path)
-    return xrds[var_name]    
+    full = _DATASETS.get(
+        (zarr_path, var_name, 1),
+        zarr_path,
+        lambda: pingrid.open_overview(zarr_path)[var_name],
+    )
+    if resolution is None:
+        return full
+    # Keyed by overview factor: resolution differs for every tile row
+    factor = pingrid.choose_overview_factor(
+        pingrid.grid_resolution(full), resolution
+    )
+    if factor == 1:
+        return full
+    return _DATASETS.get(
+        (zarr_path, var_name, factor),
+        zarr_path,
+        lambda: pingrid.open_overview(zarr_path, factor=factor)[var_name],
+    )
+
+
+def data_version(variable, time_res, ds_conf):
+    """ Token identifying the current state of ENACTS data
+
+    Parameters
+    ----------
+    variable : str
+        string representing ENACTS variable ("precip", "tmin" or "tmax")
+    time_res : str
+        "daily" or "dekadal" resolution of the desired variable
+    ds_conf : dict
+        dictionary indicating ENACTS datasets configuration
+        (see config)
+
+    Returns
+    -------
+        str that changes whenever the data returned by `get_data` would
+    
+    See Also
+    --------
+    get_data, pingrid.path_version
+    """
+    if ds_conf[time_res] == "FAKE" :
+        # synthetic data runs up to today
+        return f"FAKE {datetime.date.today()}"
+    else:
+        dst_conf = ds_conf[time_res]
+        data_path = dst_conf['vars'][variable][1]
+        if data_path is None:
+            data_path = dst_conf['vars'][variable][0]
+        return pingrid.path_version(f"{dst_conf['zarr_path']}{data_path}")
 
 
 def synthesize_enacts(variable, time_res, bbox):
@@ -199,7 +319,7 @@ def sql2geom(shapes_sql, db_config):
 
     See Also
     --------
-    psycopg2.connect, psycopg2.sql, pandas.read_sql, shapely.wkb,
+    pingrid.db_pool, psycopg2.sql, pandas.read_sql, shapely.wkb,
 
     Examples
     --------
@@ -211,7 +331,7 @@ def sql2geom(shapes_sql, db_config):
         user: ingrid
         dbname: iridb
     """
-    with psycopg2.connect(**db_config) as conn:
+    with pingrid.db_pool(db_config).connection() as conn:
         s = sql.Composed(
             [
                 sql.SQL("with g as ("),
@@ -231,7 +351,7 @@ def sql2geom(shapes_sql, db_config):
     return df
 
 
-def get_taw(ds_conf):
+def get_taw(ds_conf, resolution=None):
     """ Get TAW data for ENACTS Maprooms, read from file or synthetic
 
      Parameters
@@ -239,6 +359,10 @@ def get_taw(ds_conf):
     ds_conf : dict
         dictionary indicating TAW file path configuration
         (see config)
+    resolution : real, optional
+        size in degrees of the map pixels the data is for, in which case
+        the data is decimated to the coarsest grid at least that fine
+        (default is None: full resolution)
     
     Returns
     -------
@@ -246,15 +370,33 @@ def get_taw(ds_conf):
     
     See Also
     --------
-    read_taw, synthesize_taw
+    read_taw, synthesize_taw, clear_data_cache
     """
     if ds_conf["taw_file"] == "FAKE" :
-        return synthesize_taw(ds_conf["bbox"])
+        bbox = tuple(ds_conf["bbox"])
+        taw = _synthetic(("taw", bbox), lambda: synthesize_taw(bbox))
     else:
         # At the moment, it's the only case we have
         # if/when other ways to read taw come up,
         # can reintroduce a more sophisticated read_taw function
-        return xr.open_dataarray(ds_conf["taw_file"])
+        taw_file = ds_conf["taw_file"]
+        taw = _DATASETS.get(
+            taw_file, taw_file, lambda: xr.open_dataarray(taw_file)
+        )
+    return pingrid.decimate_to(taw, resolution)
+
+
+def taw_version(ds_conf):
+    """ Token identifying the current state of TAW data
+
+    See Also
+    --------
+    get_taw, data_version
+    """
+    if ds_conf["taw_file"] == "FAKE" :
+        return "FAKE"
+    else:
+        return pingrid.path_version(ds_conf["taw_file"])
 
 
 def synthesize_taw(bbox):
@@ -336,23 +478,84 @@ def water_balance(
     )
     if not reduce:
         soil_moisture = soil_moisture.broadcast_like(daily_rain[time_dim])
-    # Looping on time_dim
-    for t in daily_rain[time_dim][1:]:
-        sm_t = water_balance_step(
-            soil_moisture.sel({time_dim: t - np.timedelta64(1, "D")}, drop=True),
-            daily_rain.sel({time_dim: t}).expand_dims(dim=time_dim),
-            et,
-            taw,
+    times = daily_rain[time_dim][1:]
+    if times.size > 0:
+        # The first step sets the dims and coords of the result; the
+        # following ones run on arrays with time first.
+        sm_0 = soil_moisture.isel({time_dim: 0}, drop=True)
+        peffective, et_steps, taw_steps = (
+            _time_steps(x, sm_0, times, time_dim)
+            for x in (daily_rain, et, taw)
         )
         if reduce:
-            soil_moisture = sm_t
+            # The last step is done by xarray to shape the result like
+            # previous steps would have.
+            sm_t = sm_0.copy(data=_water_balance_scan(
+                sm_0.values, peffective[:-1], et_steps, taw_steps,
+            ))
+            soil_moisture = water_balance_step(
+                sm_t,
+                daily_rain.sel({time_dim: times[-1]}).expand_dims(dim=time_dim),
+                et,
+                taw,
+            )
         else:
-            soil_moisture.loc[{time_dim: t}] = sm_t.squeeze(time_dim, drop=True)
+            steps = np.empty(
+                (daily_rain[time_dim].size,) + sm_0.shape, soil_moisture.dtype,
+            )
+            steps[0] = sm_0.values
+            _water_balance_scan(
+                sm_0.values, peffective, et_steps, taw_steps, out=steps[1:],
+            )
+            soil_moisture = soil_moisture.copy(data=np.moveaxis(
+                steps, 0, soil_moisture.get_axis_num(time_dim),
+            ))
     soil_moisture.attrs = dict(description="Soil Moisture", units="mm")
     water_balance = xr.Dataset().merge(soil_moisture.rename("soil_moisture"))
     return water_balance
 
 
+def _time_steps(x, grid, times, time_dim):
+    """ Values of `x` for each of `times` on `grid`
+
+    Returns an array with time first, then the dims of `grid`, that has
+    only one step if `x` doesn't vary in time; scalars are kept as is,
+    in a tuple.
+    """
+    if not isinstance(x, xr.DataArray):
+        return (x,)
+    x = xr.align(grid, x, join="left", exclude=[time_dim])[1]
+    x = x.broadcast_like(grid)
+    if time_dim in x.dims:
+        x = x.sel({time_dim: times}).transpose(time_dim, *grid.dims)
+    else:
+        x = x.transpose(*grid.dims).expand_dims(time_dim)
+    return x.values
+
+
+def _water_balance_scan(sm, peffective, et, taw, out=None):
+    """ Run `water_balance_step` along the first axis of `peffective`
+
+    All pixels are processed at each step. `et` and `taw` have either
+    as many steps as `peffective` or a single one. If `out` is given,
+    the soil moisture of every step is written to it.
+
+    Returns
+    -------
+        soil moisture after the last step
+    """
+    for i in range(len(peffective)):
+        sm = water_balance_step(
+            sm,
+            peffective[i],
+            et[i if len(et) > 1 else 0],
+            taw[i if len(taw) > 1 else 0],
+        )
+        if out is not None:
+            out[i] = sm
+    return sm
+
+
 def longest_run_length(flagged_data, dim):
     """ Find the length of the longest run of flagged (0/1) data along a dimension.
     
@@ -376,13 +579,9 @@ def longest_run_length(flagged_data, dim):
     
     Notes
     -----
-    The longest run is the maximum value of the discrete difference
-    of cumulative flags keeping only the unflagged data.
-    Because diff needs at least 2 points,
-    we need to keep (where) the unflagged and first and last
-    with the cumulative value for last and 0 for first.
-    Cumulative flags, where kept, need be propagated by bfill
-    so that diff returns 0 or the length of runs.
+    The longest run is found from the run-length encoding of
+    `flagged_data` along `dim` (see `runs.Runs`).
+    Missing (NaN) data neither count in nor break a run.
     
     I believe that it works for unevenly spaced `dim`,
     only we then don't know what the units of the result are.
@@ -403,14 +602,16 @@ def longest_run_length(flagged_data, dim):
     # Special case coord.size = 1
     lrl = flagged_data
     if lrl[dim].size != 1:
-        # Points to apply diff to
-        unflagged_and_ends = (flagged_data == 0) * 1
-        unflagged_and_ends[{dim: [0, -1]}] = 1
-    
-        lrl = lrl.cumsum(dim=dim).where(unflagged_and_ends, other = np.nan).where(
-            # first cumul point must be set to 0
-            lambda x: x[dim] != lrl[dim][0], other=0
-        ).bfill(dim).diff(dim).max(dim=dim)
+        # NaN neither counts in nor breaks a run
+        lrl = xr.apply_ufunc(
+            lambda flags: runs.Runs(flags != 0).longest(
+                weights=np.nan_to_num(flags)
+            ),
+            flagged_data,
+            input_core_dims=[[dim]],
+        ).astype(
+            flagged_data.dtype if flagged_data.dtype.kind == "f" else np.float64
+        )
     lrl.attrs = dict(description="Longest Run Length")
     return lrl
 
@@ -437,18 +638,10 @@ def following_dry_spell_length(daily_rain, wet_thresh, time_dim="T"):
     
     Notes
     -----
-    Ideally we would want to cumulate count of dry days backwards
-    and reset count to 0 each time a wet day occurs.
-    But that is hard to do vectorially.
-    But we can cumulatively count all dry days backwayds
-    then apply an offset. In more details:
-    Cumulate dry days backwards to get all dry days after a day;
-    Find when to apply new offset (dry days followed by a wet day);
-    Assign cumulated dry days there, Nan elsewhere;
-    Propagate backwards and the 0s at the tail.
-    And that is going to be the offset.
-    Apply offset that is correct for all days followed by dry days.
-    Eventually reset days followed by wet days to 0.
+    The dry spell following each day is the rest of the run of dry days
+    starting the next day, from the run-length encoding of dry days
+    along `time_dim` (see `runs.Runs`). The last day has no next day
+    and is dropped.
 
     Examples
     --------
@@ -463,19 +656,15 @@ def following_dry_spell_length(daily_rain, wet_thresh, time_dim="T"):
     """
 
     # Find dry days
-    dry_day = ~(daily_rain > wet_thresh) * 1
-    # Cumul dry days backwards and shift back to get the count to exclude day of
-    count_dry_days_after_today = dry_day.reindex({time_dim: dry_day[time_dim][::-1]}).cumsum(
-        dim=time_dim
-    ).reindex({time_dim: dry_day[time_dim]}).shift({time_dim: -1})
-    # Find where dry day followed by wet day
-    dry_to_wet_day = dry_day.diff(time_dim, label="lower").where(lambda x : x == -1, other=0)
-    # Record cumul dry days on that day and put nan elsewhere
-    dry_days_offset = (count_dry_days_after_today * dry_to_wet_day).where(lambda x : x != 0, other=np.nan)
-    # Back fill nans and assign 0 to tailing ones
-    dry_days_offset = dry_days_offset.bfill(dim=time_dim).fillna(0)
-    # Subtract offset and shifted wet days are 0.
-    dry_spell_length = (count_dry_days_after_today + dry_days_offset) * dry_day.shift({time_dim: -1})
+    dry_day = ~(daily_rain > wet_thresh)
+    # Count dry days from each day on
+    dry_days_from_today = dry_day.copy(data=runs.Runs(
+        dry_day, axis=dry_day.get_axis_num(time_dim)
+    ).length_from().astype(np.float64))
+    # Shift back to get the count to exclude day of
+    dry_spell_length = dry_days_from_today.shift({time_dim: -1}).isel(
+        {time_dim: slice(None, -1)}
+    )
     return dry_spell_length
 
 
@@ -551,16 +740,8 @@ def onset_date(
     if dry_spell_search == 0:
         dry_spell_ahead = False
     else:
-        dry_day = ~wet_day
-        dry_spell = (
-            (dry_day*1).rolling(**{time_dim: dry_spell_length}).sum() == dry_spell_length
-        )
-        # Note that rolling assigns to the last position of the wet_spell
-        dry_spell_ahead = (
-            (dry_spell*1).rolling(**{time_dim: dry_spell_search})
-            .sum()
-            .shift(**{time_dim: dry_spell_search * -1})
-            != 0
+        dry_spell_ahead = _dry_spell_ahead(
+            ~wet_day, dry_spell_length, dry_spell_search, time_dim
         )
 
     # Create a mask of 1s and nans where onset conditions are met
@@ -590,6 +771,110 @@ def onset_date(
     return onset_delta
 
 
+def _onset_date(
+    season_cube,
+    wet_thresh,
+    wet_spell_length,
+    wet_spell_thresh,
+    min_wet_days,
+    dry_spell_length,
+    dry_spell_search,
+    time_dim="T",
+    day_dim="day_of_season",
+):
+    """ Onset date delta of all seasons of a season cube at once
+
+    Applies the criteria of `onset_date` along `day_dim` of all seasons
+    and grid points in the same operations. Days after the end of
+    shorter seasons are out of the season, as days after the end of the
+    time series are for `onset_date`.
+
+    Parameters
+    ----------
+    season_cube : DataArray
+        Daily rainfall of each season, as returned by `_season_cube`.
+    wet_thresh, wet_spell_length, wet_spell_thresh, min_wet_days,
+    dry_spell_length, dry_spell_search :
+        Onset criteria, see `onset_date`.
+    time_dim : str, optional
+        Seasons coordinate in `season_cube` (default `time_dim`="T").
+    day_dim : str, optional
+        Days of season dimension in `season_cube`
+        (default `day_dim`="day_of_season").
+
+    Returns
+    -------
+    onset_delta : DataArray[np.timedelta64]
+        Difference between the first day of each season and its onset
+        date.
+
+    See Also
+    --------
+    onset_date, _season_cube
+    """
+    wet_day = season_cube > wet_thresh
+    wet_spell = (
+        season_cube.rolling(**{day_dim: wet_spell_length}).sum() >= wet_spell_thresh
+    ) & ((wet_day*1).rolling(**{day_dim: wet_spell_length}).sum() >= min_wet_days)
+    if dry_spell_search == 0:
+        dry_spell_ahead = False
+    else:
+        # The search can't go past the end of the season
+        dry_spell_ahead = _dry_spell_ahead(
+            ~wet_day, dry_spell_length, dry_spell_search, day_dim
+        ) | season_cube["date"].shift(**{day_dim: dry_spell_search * -1}).isnull()
+    onset_mask = wet_spell & ~dry_spell_ahead
+    # Last day of 1st valid wet spell
+    onset_day = onset_mask.argmax(day_dim)
+    # 1st wet day of that wet spell
+    first_wet_day = wet_day.isel({day_dim: (
+        onset_day + xr.DataArray(np.arange(1 - wet_spell_length, 1), dims=["wsl"])
+    ).clip(min=0)}).argmax("wsl")
+    onset_delta = (
+        season_cube["date"].isel({day_dim: onset_day})
+        # offset relative position of first wet day
+        - (wet_spell_length - 1 - first_wet_day).astype("timedelta64[D]")
+        # delta from 1st day of season
+        - season_cube[time_dim]
+    ).where(onset_mask.any(day_dim)).drop_vars("date").rename("onset_delta")
+    return onset_delta
+
+
+def _dry_spell_ahead(dry_day, dry_spell_length, dry_spell_search, time_dim="T"):
+    """ Find days followed by a dry spell
+
+    Parameters
+    ----------
+    dry_day : DataArray[bool]
+        Dry days.
+    dry_spell_length : int
+        Length in days of a dry spell.
+    dry_spell_search : int
+        Number of days following each day to search for the last day of
+        a dry spell.
+    time_dim : str, optional
+        Daily time dimension of `dry_day` (default `time_dim`="T").
+
+    Returns
+    -------
+    DataArray[bool]
+        Whether a dry spell ends within the `dry_spell_search` days
+        following each day, or the search goes past the end of
+        `time_dim`.
+
+    See Also
+    --------
+    runs.Runs.days_to_length
+    """
+    axis = dry_day.get_axis_num(time_dim)
+    days = dry_day[time_dim].size
+    past_end = np.arange(days) + dry_spell_search >= days
+    return dry_day.copy(data=(
+        runs.Runs(dry_day, axis=axis).days_to_length(dry_spell_length)
+        <= dry_spell_search
+    ) | past_end.reshape((days,) + (1,) * (dry_day.ndim - axis - 1)))
+
+
 def cess_date_step(cess_yesterday, dry_spell_length, dry_spell_length_thresh):
     """Updates cessation date delta according to today's soil moisture spell length
 
@@ -656,10 +941,9 @@ def cess_date_from_sm(
     --------
     cess_date_step, cess_date_from_rain
     """
-    def sm_func(_, t):
-        return daily_sm.sel({time_dim: t})
-
-    return _cess_date(dry_thresh, dry_spell_length_thresh, sm_func, daily_sm[time_dim])
+    return _cess_date(
+        daily_sm, dry_thresh, dry_spell_length_thresh, time_dim=time_dim
+    )
 
 
 def cess_date_from_rain(
@@ -717,42 +1001,150 @@ def cess_date_from_rain(
     Using cess_date_from_rain instead would be more efficient
     if the user wishes not to keep the intermediary result of estimated soil moisture.
     """
-    sminit = xr.DataArray(sminit)
-    et = xr.DataArray(et)
-    taw = xr.DataArray(taw)
-
-    def sm_func(sm, t):
-        if sm is None:
-            sm = sminit
-        return water_balance_step(
-            sm, daily_rain.sel({time_dim: t}), et, taw
-        )
+    return _cess_date(
+        daily_rain,
+        dry_thresh,
+        dry_spell_length_thresh,
+        water_balance_params=(et, taw, sminit),
+        time_dim=time_dim,
+    )
+
+
+def _cess_date(
+    daily_data,
+    dry_thresh,
+    dry_spell_length_thresh,
+    water_balance_params=None,
+    seasons=None,
+    time_dim="T",
+):
+    """ Cessation date delta of each season of `daily_data`
+
+    Computes what iterating `cess_date_step` over the days of each
+    season would, for all seasons and grid points at once.
+
+    Parameters
+    ----------
+    daily_data : DataArray
+        Daily soil moisture, or rainfall if `water_balance_params` is given.
+    dry_thresh : float
+        A dry day is when soil mositure is lesser than `dry_thresh` .
+    dry_spell_length_thresh : int
+        A dry spell is at least `dry_spell_length_thresh` dry days.
+    water_balance_params : tuple, optional
+        (`et`, `taw`, `sminit`) of the water balance estimating soil
+        moisture from rainfall (default is None: `daily_data` is soil
+        moisture).
+    seasons : DataArray, optional
+        Label of the season of each day along `time_dim`
+        (default is None: all days are one season).
+    time_dim : str, optional
+        Time coordinate in `daily_data` (default `time_dim` ="T").
+
+    Returns
+    -------
+    cess_delta : DataArray[np.timedelta64]
+        Difference between the first day of each season and its
+        cessation date, with `time_dim` the first day of each season.
 
-    return _cess_date(dry_thresh, dry_spell_length_thresh, sm_func, daily_rain[time_dim])
-
-
-def _cess_date(dry_thresh, dry_spell_length_thresh, sm_func, time_coord):
-    spell_length = np.timedelta64(0)
-    cess_delta = xr.DataArray(np.timedelta64("NaT", "D"))
-    sm = None
-    for t in time_coord:
-        sm = sm_func(sm, t)
-        dry_day = sm < dry_thresh
-        spell_length = (spell_length + dry_day.astype("timedelta64[D]")) * dry_day
-        cess_delta = cess_date_step(
-            cess_delta,
-            spell_length,
-            np.timedelta64(dry_spell_length_thresh, "D"),
+    See Also
+    --------
+    cess_date_step, _cess_scan
+    """
+    if water_balance_params is None:
+        grid = daily_data.isel({time_dim: 0}, drop=True)
+        sm_params = None
+    else:
+        et, taw, sminit = (xr.DataArray(x) for x in water_balance_params)
+        grid = water_balance_step(
+            sminit, daily_data.isel({time_dim: 0}, drop=True), et, taw
         )
-    # Delta reference (and coordinate) back to first time point of daily_data
+        sm_params = tuple(
+            _time_steps(x, grid, daily_data[time_dim], time_dim)[0]
+            for x in (et, taw, sminit)
+        )
+    values = _time_steps(daily_data, grid, daily_data[time_dim], time_dim)
+    if seasons is None:
+        days = np.arange(daily_data[time_dim].size).reshape(1, -1)
+    else:
+        days = _season_days(seasons)
+    first, spell = _cess_scan(
+        values, days, dry_thresh, dry_spell_length_thresh, sm_params
+    )
+    # As cess_date_step would have counted it down to the last day
+    lengths = (days >= 0).sum(axis=1).reshape((-1,) + (1,) * grid.ndim)
+    cess_delta = (1 - spell - (lengths - 1 - first)).astype("timedelta64[D]")
+    cess_delta[first < 0] = np.timedelta64("NaT")
+    # Delta reference (and coordinate) back to first time point of each season
+    time = daily_data[time_dim].values
+    first_day = time[days[:, 0]]
+    last_day = time[days[np.arange(len(days)), lengths.ravel() - 1]]
     cess_delta = (
-        time_coord[-1]
-        + cess_delta
-        - time_coord[0].expand_dims(dim=time_coord.name)
+        last_day.reshape(lengths.shape) + cess_delta
+    ) - first_day.reshape(lengths.shape)
+    cess_delta = xr.DataArray(
+        np.moveaxis(cess_delta, 0, -1),
+        dims=grid.dims + (time_dim,),
+        coords={**grid.coords, time_dim: first_day},
     )
+    if seasons is not None:
+        cess_delta = _transpose_like(cess_delta, daily_data)
     return cess_delta
 
 
+def _cess_scan(
+    data, days, dry_thresh, dry_spell_length_thresh, water_balance_params=None
+):
+    """ Find the first dry spell of each season in one pass over days
+
+    Soil moisture, dry spell length and first cessation are updated
+    together, for all seasons and grid points at each step.
+
+    Parameters
+    ----------
+    data : ndarray
+        Daily soil moisture, or rainfall if `water_balance_params` is
+        given, with time first.
+    days : ndarray[int]
+        Positions in `data` of the days of each season, one row per
+        season, padded with -1.
+    dry_thresh : float
+        A dry day is when soil mositure is lesser than `dry_thresh` .
+    dry_spell_length_thresh : int
+        A dry spell is at least `dry_spell_length_thresh` dry days.
+    water_balance_params : tuple, optional
+        (`et`, `taw`, `sminit`) arrays broadcastable against a day of
+        `data`.
+
+    Returns
+    -------
+    first : ndarray[int]
+        Position in its season of the day a dry spell is first long
+        enough, -1 if none, for each season and grid point.
+    spell : ndarray[int]
+        Length of that dry spell on that day.
+    """
+    shape = (len(days),) + data.shape[1:]
+    first = np.full(shape, -1)
+    spell = np.zeros(shape, int)
+    found_spell = np.zeros(shape, int)
+    if water_balance_params is not None:
+        et, taw, sm = water_balance_params
+    for i in range(days.shape[1]):
+        in_season = (days[:, i] >= 0).reshape((-1,) + (1,) * (data.ndim - 1))
+        today = data[days[:, i]]
+        if water_balance_params is None:
+            sm = today
+        else:
+            sm = water_balance_step(sm, today, et, taw)
+        dry_day = (sm < dry_thresh) & in_season
+        spell = (spell + 1) * dry_day
+        found = (first < 0) & (spell >= dry_spell_length_thresh) & in_season
+        first[found] = i
+        found_spell[found] = spell[found]
+    return first, found_spell
+
+
 # Time functions
 def strftimeb2int(strftimeb):
     """Convert month values to integers (1-12) from strings.
@@ -915,7 +1307,7 @@ def daily_tobegroupedby_season(
         daily_data[time_dim] >= start_edges.rename({time_dim: "group"})
     ) & (daily_data[time_dim] <= end_edges.rename({time_dim: "group"}))
     days_in_season = days_in_season.sum(dim="group")
-    daily_data = daily_data.where(days_in_season == 1, drop=True)
+    daily_data = daily_data.isel({time_dim: days_in_season.values == 1})
     # Creates seasons_starts that will be used for grouping
     # and seasons_ends that is one of the outputs
     seasons_groups = (daily_data[time_dim].dt.day == start_day) & (
@@ -933,6 +1325,97 @@ def daily_tobegroupedby_season(
     return daily_tobegroupedby_season
 
 
+def _season_days(seasons):
+    """ Positions of the days of each season
+
+    Parameters
+    ----------
+    seasons : DataArray
+        Label of the season of each day, such as `seasons_starts` of
+        `daily_tobegroupedby_season`.
+
+    Returns
+    -------
+    days : ndarray[int]
+        Positions in `seasons` of the days of each season, one row per
+        season in the order of their labels, padded with -1 after the
+        last day of seasons shorter than the longest (e.g. without 29
+        Feb).
+    """
+    _, season = np.unique(seasons.values, return_inverse=True)
+    lengths = np.bincount(season)
+    days = np.full((lengths.size, lengths.max()), -1)
+    for s, length in enumerate(lengths):
+        days[s, :length] = np.flatnonzero(season == s)
+    return days
+
+
+def _season_cube(daily_data, seasons, time_dim="T", day_dim="day_of_season"):
+    """ Reshape daily data to one row of days per season
+
+    Parameters
+    ----------
+    daily_data : DataArray
+        Daily data labeled by `seasons`, such as returned by
+        `daily_tobegroupedby_season`.
+    seasons : DataArray
+        Label of the season of each day along `time_dim`.
+    time_dim : str, optional
+        Time coordinate in `daily_data` (default `time_dim`="T").
+    day_dim : str, optional
+        Name of the dimension of days in season
+        (default `day_dim`="day_of_season").
+
+    Returns
+    -------
+    cube : DataArray
+        `daily_data` with `time_dim` the first day of each season,
+        followed by `day_dim`, NaN after the last day of shorter
+        seasons. Coordinate `date`
+        (`time_dim`, `day_dim`) is the date of each day, NaT there.
+
+    See Also
+    --------
+    daily_tobegroupedby_season, _season_days
+    """
+    days = _season_days(seasons)
+    in_season = days >= 0
+    days = np.where(in_season, days, 0)
+    time = daily_data[time_dim].values
+    axis = daily_data.get_axis_num(time_dim)
+    dims = list(daily_data.dims)
+    dims[axis:axis + 1] = [time_dim, day_dim]
+    return xr.DataArray(
+        np.where(
+            in_season.reshape(in_season.shape + (1,) * (len(dims) - axis - 2)),
+            daily_data.values.take(days, axis=axis),
+            np.nan,
+        ),
+        dims=dims,
+        coords={
+            **{k: v for k, v in daily_data.coords.items() if time_dim not in v.dims},
+            time_dim: time[days[:, 0]],
+            "date": (
+                (time_dim, day_dim),
+                np.where(in_season, time[days], np.datetime64("NaT")),
+            ),
+        },
+        name=daily_data.name,
+        attrs=daily_data.attrs,
+    )
+
+
+def _transpose_like(seasonal_data, daily_data):
+    """ Put dims of `seasonal_data` in the order of `daily_data`, as
+    grouping by season would have, with new dims last.
+    """
+    return seasonal_data.transpose(*sorted(
+        seasonal_data.dims,
+        key=lambda d: daily_data.dims.index(d)
+        if d in daily_data.dims else daily_data.ndim,
+    ))
+
+
 # Seasonal Functions
 
 def seasonal_onset_date(
@@ -1024,22 +1507,23 @@ def seasonal_onset_date(
     seasonally_labeled_daily_data = daily_tobegroupedby_season(
         daily_rain, search_start_day, search_start_month, end_day, end_month
     )
-    # Apply onset_date
-    seasonal_data = (
-        seasonally_labeled_daily_data[daily_rain.name]
-        .groupby(seasonally_labeled_daily_data["seasons_starts"])
-        .map(
-            onset_date,
+    # Apply onset_date to all seasons at once
+    seasonal_data = _transpose_like(
+        _onset_date(
+            _season_cube(
+                seasonally_labeled_daily_data[daily_rain.name],
+                seasonally_labeled_daily_data["seasons_starts"],
+                time_dim=time_dim,
+            ),
             wet_thresh=wet_thresh,
             wet_spell_length=wet_spell_length,
             wet_spell_thresh=wet_spell_thresh,
             min_wet_days=min_wet_days,
             dry_spell_length=dry_spell_length,
             dry_spell_search=dry_spell_search,
-        )
-        # This was not needed when applying sum
-        .drop_vars(time_dim)
-        .rename({"seasons_starts": time_dim})
+            time_dim=time_dim,
+        ),
+        daily_rain,
     )
     # Get the seasons ends
     seasons_ends = seasonally_labeled_daily_data["seasons_ends"].rename({"group": time_dim})
@@ -1113,15 +1597,13 @@ def seasonal_cess_date_from_sm(
     seasonally_labeled_daily_data = daily_tobegroupedby_season(
         soil_moisture, search_start_day, search_start_month, end_day, end_month
     )
-    # Apply cess_date
-    seasonal_data = (
-        seasonally_labeled_daily_data[soil_moisture.name]
-        .groupby(seasonally_labeled_daily_data["seasons_starts"])
-        .map(
-            cess_date_from_sm,
-            dry_thresh=dry_thresh,
-            dry_spell_length_thresh=dry_spell_length_thresh,
-        )
+    # Apply cess_date to all seasons at once
+    seasonal_data = _cess_date(
+        seasonally_labeled_daily_data[soil_moisture.name],
+        dry_thresh,
+        dry_spell_length_thresh,
+        seasons=seasonally_labeled_daily_data["seasons_starts"],
+        time_dim=time_dim,
     ).rename("cess_delta")
     # Get the seasons ends
     seasons_ends = seasonally_labeled_daily_data["seasons_ends"].rename({"group": time_dim})
@@ -1166,18 +1648,14 @@ def seasonal_cess_date_from_rain(
     seasonally_labeled_daily_data = daily_tobegroupedby_season(
         daily_rain, search_start_day, search_start_month, end_day, end_month
     )
-    # Apply cess_date
-    seasonal_data = (
-        seasonally_labeled_daily_data[daily_rain.name]
-        .groupby(seasonally_labeled_daily_data["seasons_starts"])
-        .map(
-            cess_date_from_rain,
-            dry_thresh=dry_thresh,
-            dry_spell_length_thresh=dry_spell_length_thresh,
-            et=et,
-            taw=taw,
-            sminit=sminit,
-        )
+    # Apply cess_date to all seasons at once
+    seasonal_data = _cess_date(
+        seasonally_labeled_daily_data[daily_rain.name],
+        dry_thresh,
+        dry_spell_length_thresh,
+        water_balance_params=(et, taw, sminit),
+        seasons=seasonally_labeled_daily_data["seasons_starts"],
+        time_dim=time_dim,
     ).rename("cess_delta")
     # Get the seasons ends
     seasons_ends = seasonally_labeled_daily_data["seasons_ends"].rename({"group": time_dim})
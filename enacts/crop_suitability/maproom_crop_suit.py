@@ -22,7 +22,7 @@ import math
 import datetime
 import xarray as xr
 
-from globals_ import FLASK, GLOBAL_CONFIG
+from globals_ import FLASK, GLOBAL_CONFIG, TILE_CACHE, GEOMETRIES
 
 
 CONFIG = GLOBAL_CONFIG["maprooms"]["onset"]
@@ -160,7 +160,7 @@ def register(FLASK, config):
         ] + [
             mapr_u.make_adm_overlay(
                 adm_name=adm["name"],
-                adm_geojson=calc.sql2GeoJSON(adm["sql"], GLOBAL_CONFIG["db"]),
+                adm_geojson=GEOMETRIES.get(adm["sql"]).geojson(),
                 adm_clor=adm["color"],
                 adm_lev=i+1,
                 adm_weight=len(ADMIN_CONFIG)-i,
@@ -458,7 +458,14 @@ def register(FLASK, config):
         return map_title
 
 
+    def tile_version(**kwargs):
+        return tuple(
+            calc.data_version(**params)
+            for params in (PRECIP_PARAMS, TMIN_PARAMS, TMAX_PARAMS)
+        )
+
     @FLASK.route(f"{TILE_PFX}/<int:tz>/<int:tx>/<int:ty>")
+    @pingrid.cache_tile(TILE_CACHE, tile_version)
     def cropSuit_layers(tz, tx, ty):
         parse_arg = pingrid.parse_arg
         data_choice = parse_arg("data_choice")
@@ -473,10 +480,11 @@ def register(FLASK, config):
         minimum_temp = parse_arg("minimum_temp", float)
         temp_range = parse_arg("temp_range", float)
 
-        # Reads daily data
-        rr_mrg = calc.get_data(**PRECIP_PARAMS)
-        tmin_mrg = calc.get_data(**TMIN_PARAMS)
-        tmax_mrg = calc.get_data(**TMAX_PARAMS) 
+        # Reads daily data, no finer than the tile's pixels
+        resolution = pingrid.tile_resolution(ty, tz)
+        rr_mrg = calc.get_data(**PRECIP_PARAMS, resolution=resolution)
+        tmin_mrg = calc.get_data(**TMIN_PARAMS, resolution=resolution)
+        tmax_mrg = calc.get_data(**TMAX_PARAMS, resolution=resolution)
 
         x_min = pingrid.tile_left(tx, tz)
         x_max = pingrid.tile_left(tx + 1, tz)
@@ -574,9 +582,7 @@ def register(FLASK, config):
         map = map.rename(X="lon", Y="lat")
         map.attrs["scale_min"] = map_min
         map.attrs["scale_max"] = map_max
-        clip_shape = calc.sql2geom(
-            ADMIN_CONFIG[0]['sql'], GLOBAL_CONFIG["db"]
-        )["the_geom"][0]
+        clip_shape = GEOMETRIES.get(ADMIN_CONFIG[0]['sql']).geoms[0]
         result = pingrid.tile(map.astype('float64'), tx, ty, tz, clip_shape)
 
         return result
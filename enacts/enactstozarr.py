@@ -252,3 +252,7 @@ convert(
     chunks=CHUNKS,
 )
 
+
+# Overviews of the previous version of the store no longer match it
+print(f"building overviews for: {TIME_RES} {VARIABLE}")
+pingrid.build_overviews(OUTPUT_PATH)
@@ -14,7 +14,7 @@ from . import cpt
 import maproom_utilities as mapr_u
 import urllib
 import dash_leaflet as dlf
-from globals_ import FLASK, GLOBAL_CONFIG
+from globals_ import FLASK, GLOBAL_CONFIG, TILE_CACHE, GEOMETRIES
 
 ADMIN_CONFIG = GLOBAL_CONFIG["datasets"]["shapes_adm"]
 
@@ -656,7 +656,7 @@ def register(FLASK, config):
         ] + [
             mapr_u.make_adm_overlay(
                 adm_name=adm["name"],
-                adm_geojson=calc.sql2GeoJSON(adm["sql"], GLOBAL_CONFIG["db"]),
+                adm_geojson=GEOMETRIES.get(adm["sql"]).geojson(),
                 adm_clor=adm["color"],
                 adm_lev=i+1,
                 adm_weight=len(ADMIN_CONFIG)-i,
@@ -681,6 +681,10 @@ def register(FLASK, config):
         f"{TILE_PFX}/<int:tz>/<int:tx>/<int:ty>/<proba>/<variable>/<float:percentile>/<float(signed=True):threshold>/<start_date>/<lead_time>",
         endpoint=f"{config['core_path']}"
     )
+    @pingrid.cache_tile(
+        TILE_CACHE,
+        lambda **kwargs: pingrid.path_version(config["forecast_path"]),
+    )
     def fcst_tiles(tz, tx, ty, proba, variable, percentile, threshold, start_date, lead_time):
         # Reading
         
@@ -742,9 +746,7 @@ def register(FLASK, config):
         # probabilities symmetry around percentile threshold
         # choice of colorscale (dry to wet, wet to dry, or correlation)
         fcst_cdf = to_flexible(fcst_cdf, proba, variable, percentile,)
-        clip_shape = calc.sql2geom(
-            ADMIN_CONFIG[0]['sql'], GLOBAL_CONFIG["db"]
-        )["the_geom"][0]
+        clip_shape = GEOMETRIES.get(ADMIN_CONFIG[0]['sql']).geoms[0]
 
         resp = pingrid.tile(fcst_cdf, tx, ty, tz, clip_shape)
         return resp
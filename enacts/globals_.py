@@ -1,3 +1,4 @@
+import calc
 import flask
 import pingrid
 import os
@@ -20,3 +21,11 @@ FLASK = flask.Flask(
     "enactsmaproom",
     static_url_path=f'{GLOBAL_CONFIG["url_path_prefix"]}/static',
 )
+
+TILE_CACHE = pingrid.TileCache(**GLOBAL_CONFIG["tile_cache"])
+pingrid.configure_image_encoding(**GLOBAL_CONFIG["tile_encoding"])
+calc.configure_data_cache(**GLOBAL_CONFIG["data_cache"])
+GEOMETRIES = pingrid.GeometryStore(
+    lambda shapes_sql: calc.sql2geom(shapes_sql, GLOBAL_CONFIG["db"]),
+    **GLOBAL_CONFIG["geometry_store"],
+)
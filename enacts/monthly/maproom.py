@@ -29,7 +29,7 @@ import calc
 import maproom_utilities as mapr_u
 
 from . import layout
-from globals_ import FLASK, GLOBAL_CONFIG
+from globals_ import FLASK, GLOBAL_CONFIG, TILE_CACHE, GEOMETRIES
 
 CONFIG = GLOBAL_CONFIG["maprooms"]["monthly"]
 
@@ -106,7 +106,7 @@ def register(FLASK, config):
         ] + [
             mapr_u.make_adm_overlay(
                 adm_name=adm["name"],
-                adm_geojson=calc.sql2GeoJSON(adm["sql"], GLOBAL_CONFIG["db"]),
+                adm_geojson=GEOMETRIES.get(adm["sql"]).geojson(),
                 adm_clor=adm["color"],
                 adm_lev=i+1,
                 adm_weight=len(ADMIN_CONFIG)-i,
@@ -249,7 +249,12 @@ def register(FLASK, config):
         elif var == "tmean":
             return temp
 
+    def tile_version(**kwargs):
+        var = pingrid.parse_arg("variable")
+        return calc.data_version(config['vars'][var]['id'], **PARAMS)
+
     @FLASK.route(f"{TILE_PFX}/<int:tz>/<int:tx>/<int:ty>")
+    @pingrid.cache_tile(TILE_CACHE, tile_version)
     def tile(tz, tx, ty):
         parse_arg = pingrid.parse_arg
         var = parse_arg("variable")
@@ -262,7 +267,9 @@ def register(FLASK, config):
         y_min = pingrid.tile_top_mercator(ty + 1, tz)
 
         varobj = config['vars'][var]
-        data = calc.get_data(varobj['id'], **PARAMS)
+        data = calc.get_data(
+            varobj['id'], **PARAMS, resolution=pingrid.tile_resolution(ty, tz)
+        )
     
         if (
             x_min > data['X'].max() or
@@ -298,9 +305,7 @@ def register(FLASK, config):
         tile.attrs["scale_min"] = varobj['min']
         tile.attrs["scale_max"] = varobj['max']
     
-        clip_shape = calc.sql2geom(
-            ADMIN_CONFIG[0]['sql'], GLOBAL_CONFIG["db"]
-        )["the_geom"][0]
+        clip_shape = GEOMETRIES.get(ADMIN_CONFIG[0]['sql']).geoms[0]
 
         result = pingrid.tile(tile, tx, ty, tz, clip_shape)
 
@@ -21,7 +21,7 @@ import datetime
 from controls import Block, Sentence, DateNoYear, Number, Select
 
 
-from globals_ import FLASK, GLOBAL_CONFIG
+from globals_ import FLASK, GLOBAL_CONFIG, TILE_CACHE, GEOMETRIES
 
 CONFIG = GLOBAL_CONFIG["maprooms"]["onset"]
 
@@ -249,7 +249,7 @@ def register(FLASK, config):
         ] + [
             mapr_u.make_adm_overlay(
                 adm_name=adm["name"],
-                adm_geojson=calc.sql2GeoJSON(adm["sql"], GLOBAL_CONFIG["db"]),
+                adm_geojson=GEOMETRIES.get(adm["sql"]).geojson(),
                 adm_clor=adm["color"],
                 adm_lev=i+1,
                 adm_weight=len(ADMIN_CONFIG)-i,
@@ -920,6 +920,9 @@ def register(FLASK, config):
 
 
     @FLASK.route(f"{TILE_PFX}/<int:tz>/<int:tx>/<int:ty>")
+    @pingrid.cache_tile(
+        TILE_CACHE, lambda **kwargs: calc.data_version(**PRECIP_PARAMS)
+    )
     def onset_tile(tz, tx, ty):
         parse_arg = pingrid.parse_arg
         map_choice = parse_arg("map_choice")
@@ -947,7 +950,9 @@ def register(FLASK, config):
         y_max = pingrid.tile_top_mercator(ty, tz)
         y_min = pingrid.tile_top_mercator(ty + 1, tz)
 
-        rr_mrg = calc.get_data(**PRECIP_PARAMS)
+        rr_mrg = calc.get_data(
+            **PRECIP_PARAMS, resolution=pingrid.tile_resolution(ty, tz)
+        )
         #Assumes that grid spacing is regular and cells are square. When we
         # generalize this, don't make those assumptions.
         resolution = rr_mrg['X'][1].item() - rr_mrg['X'][0].item()
@@ -1074,9 +1079,7 @@ def register(FLASK, config):
         map_data = map_data.rename(X="lon", Y="lat")
         map_data.attrs["scale_min"] = map_min
         map_data.attrs["scale_max"] = map_max
-        clip_shape = calc.sql2geom(
-            ADMIN_CONFIG[0]['sql'], GLOBAL_CONFIG["db"]
-        )["the_geom"][0]
+        clip_shape = GEOMETRIES.get(ADMIN_CONFIG[0]['sql']).geoms[0]
         result = pingrid.tile(map_data, tx, ty, tz, clip_shape)
         return result
 
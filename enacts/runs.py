@@ -0,0 +1,118 @@
+import numpy as np
+
+
+class Runs:
+    """ Runs of equal flags along an axis
+
+    Runs are encoded in one pass over the raw array, for all series
+    (1-D slices along `axis`) at once, and per day queries are derived
+    from the encoding.
+
+    Parameters
+    ----------
+    flags : array_like
+        Flags, cast to bool. Note that NaN casts to True.
+    axis : int, optional
+        Axis along which to find runs (default `axis`=-1).
+
+    Attributes
+    ----------
+    series : ndarray[int]
+        Flat index of the series of each run, in C order of the other
+        axes of `flags`.
+    start : ndarray[int]
+        Position along `axis` of the first day of each run.
+    length : ndarray[int]
+        Length of each run.
+    value : ndarray[bool]
+        Flag of each run.
+
+    Examples
+    --------
+    >>> runs = Runs([0, 0, 1, 1, 1, 0, 1])
+    >>> runs.start, runs.length, runs.value
+    (array([0, 2, 5, 6]), array([2, 3, 1, 1]), array([False,  True, False,  True]))
+    >>> runs.longest()
+    array(3)
+    >>> runs.length_from()
+    array([0, 0, 3, 2, 1, 0, 1])
+    """
+
+    def __init__(self, flags, axis=-1):
+        flags = np.moveaxis(np.asarray(flags, dtype=bool), axis, -1)
+        self.axis = axis
+        self.shape = flags.shape
+        days = flags.shape[-1]
+        flags = flags.reshape(int(np.prod(flags.shape[:-1])), days)
+        new_run = np.ones(flags.shape, dtype=bool)
+        np.not_equal(flags[:, 1:], flags[:, :-1], out=new_run[:, 1:])
+        self._first = np.flatnonzero(new_run)
+        self.series, self.start = np.divmod(self._first, days)
+        self.length = np.diff(self._first, append=flags.size)
+        self.value = flags.ravel()[self._first]
+
+    def _per_day(self, values):
+        """ Array of the shape of flags with `values` (axis last) """
+        return np.moveaxis(values.reshape(self.shape), -1, self.axis)
+
+    def _offset(self):
+        """ Position of each day in its run """
+        return (
+            np.arange(self.length.sum()) - np.repeat(self._first, self.length)
+        )
+
+    def longest(self, weights=None):
+        """ Length of the longest run of True of each series, 0 if none
+
+        With `weights` (array_like of the shape of flags), largest sum of
+        `weights` over a run of True instead.
+        """
+        if self.length.size == 0:
+            return np.zeros(self.shape[:-1], dtype=int)
+        if weights is None:
+            sums = self.length
+        else:
+            weights = np.moveaxis(np.asarray(weights), self.axis, -1)
+            sums = np.add.reduceat(
+                weights.ravel(), self._first,
+                dtype=np.result_type(weights, np.int_),
+            )
+        return np.maximum.reduceat(
+            np.where(self.value, sums, 0), np.flatnonzero(self.start == 0)
+        ).reshape(self.shape[:-1])
+
+    def length_until(self):
+        """ Length of the run of True up to and including each day,
+        0 on False days
+        """
+        return self._per_day(
+            (self._offset() + 1) * np.repeat(self.value, self.length)
+        )
+
+    def length_from(self):
+        """ Length of the run of True from each day on, 0 on False days """
+        return self._per_day(
+            (np.repeat(self.length, self.length) - self._offset())
+            * np.repeat(self.value, self.length)
+        )
+
+    def days_to_length(self, min_length):
+        """ Number of days after each day to the first following day on
+        which a run of True has lasted `min_length` days
+
+        That is the first day after which the `min_length` previous days
+        are all True. Where there is none, days to one past the end of
+        the series.
+        """
+        days = self.shape[-1]
+        position = np.arange(days)
+        reached = np.where(
+            np.moveaxis(self.length_until(), self.axis, -1) >= min_length,
+            position,
+            days,
+        )
+        # First reaching day from each day on, then strictly after it
+        reached = np.minimum.accumulate(reached[..., ::-1], axis=-1)[..., ::-1]
+        following = np.full_like(reached, days)
+        following[..., :-1] = reached[..., 1:]
+        return np.moveaxis(following - position, -1, self.axis)
@@ -0,0 +1,491 @@
+"""Benchmarks of calc's daily time series computations.
+
+Not collected by pytest; run from the enacts directory with
+
+    PYTHONPATH=. python tests/bench_calc.py
+
+Compares water_balance with the previous implementation, which looped
+over days with label-based xarray selections and assignments, on
+synthetic ENACTS rainfall.
+
+Compares seasonal_cess_date_from_rain with the previous implementation,
+which grouped the data by season and iterated cess_date_step over the
+days of each season with xarray.
+
+Compares agronomy.soil_plant_water_balance with the previous
+implementation, which looped over days with xarray, on a stack of
+planting dates, crop profiles and soils.
+
+Compares seasonal_onset_date with the previous implementation, which
+applied onset_date to each season through groupby, with the season
+cube, over a grid and at one pixel.
+
+Compares longest_run_length, following_dry_spell_length and onset_date
+with the previous implementations, which found runs with cumulative
+sums, rolling sums and shifts, with the run-length encoding of runs.
+"""
+import timeit
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+import agronomy
+import calc
+
+
+def water_balance_loop(daily_rain, et, taw, sminit, reduce=False, time_dim="T"):
+    """water_balance as it was before the array scan."""
+    soil_moisture = calc.water_balance_step(
+        sminit,
+        daily_rain.isel({time_dim: 0}).expand_dims(dim=time_dim),
+        et,
+        taw,
+    )
+    if not reduce:
+        soil_moisture = soil_moisture.broadcast_like(daily_rain[time_dim])
+    for t in daily_rain[time_dim][1:]:
+        sm_t = calc.water_balance_step(
+            soil_moisture.sel({time_dim: t - np.timedelta64(1, "D")}, drop=True),
+            daily_rain.sel({time_dim: t}).expand_dims(dim=time_dim),
+            et,
+            taw,
+        )
+        if reduce:
+            soil_moisture = sm_t
+        else:
+            soil_moisture.loc[{time_dim: t}] = sm_t.squeeze(time_dim, drop=True)
+    soil_moisture.attrs = dict(description="Soil Moisture", units="mm")
+    return xr.Dataset().merge(soil_moisture.rename("soil_moisture"))
+
+
+def cess_date_from_rain_loop(
+    daily_rain, dry_thresh, dry_spell_length_thresh, et, taw, sminit, time_dim="T",
+):
+    """cess_date_from_rain as it was before the fused kernel."""
+    sminit = xr.DataArray(sminit)
+    et = xr.DataArray(et)
+    taw = xr.DataArray(taw)
+    time_coord = daily_rain[time_dim]
+    spell_length = np.timedelta64(0)
+    cess_delta = xr.DataArray(np.timedelta64("NaT", "D"))
+    sm = sminit
+    for t in time_coord:
+        sm = calc.water_balance_step(sm, daily_rain.sel({time_dim: t}), et, taw)
+        dry_day = sm < dry_thresh
+        spell_length = (spell_length + dry_day.astype("timedelta64[D]")) * dry_day
+        cess_delta = calc.cess_date_step(
+            cess_delta,
+            spell_length,
+            np.timedelta64(dry_spell_length_thresh, "D"),
+        )
+    return (
+        time_coord[-1]
+        + cess_delta
+        - time_coord[0].expand_dims(dim=time_coord.name)
+    )
+
+
+def seasonal_cess_date_from_rain_groupby(
+    daily_rain, search_start_day, search_start_month, search_days,
+    dry_thresh, dry_spell_length_thresh, et, taw, sminit, time_dim="T",
+):
+    """seasonal_cess_date_from_rain as it was before the fused kernel."""
+    first_end_date = calc.sel_day_and_month(
+        daily_rain[time_dim], search_start_day, search_start_month
+    )[0] + np.timedelta64(search_days, "D")
+    seasonally_labeled_daily_data = calc.daily_tobegroupedby_season(
+        daily_rain, search_start_day, search_start_month,
+        first_end_date.dt.day.values, first_end_date.dt.month.values,
+    )
+    seasonal_data = (
+        seasonally_labeled_daily_data[daily_rain.name]
+        .groupby(seasonally_labeled_daily_data["seasons_starts"])
+        .map(
+            cess_date_from_rain_loop,
+            dry_thresh=dry_thresh,
+            dry_spell_length_thresh=dry_spell_length_thresh,
+            et=et,
+            taw=taw,
+            sminit=sminit,
+        )
+    ).rename("cess_delta")
+    seasons_ends = seasonally_labeled_daily_data["seasons_ends"].rename({"group": time_dim})
+    return xr.merge([seasonal_data, seasons_ends])
+
+
+def seasonal_onset_date_groupby(
+    daily_rain, search_start_day, search_start_month, search_days,
+    wet_thresh, wet_spell_length, wet_spell_thresh, min_wet_days,
+    dry_spell_length, dry_spell_search, time_dim="T",
+):
+    """seasonal_onset_date as it was before the season cube."""
+    first_end_date = calc.sel_day_and_month(
+        daily_rain[time_dim], search_start_day, search_start_month
+    )[0] + np.timedelta64(search_days - 1 + dry_spell_search + 1, "D")
+    seasonally_labeled_daily_data = calc.daily_tobegroupedby_season(
+        daily_rain, search_start_day, search_start_month,
+        first_end_date.dt.day.values, first_end_date.dt.month.values,
+    )
+    seasonal_data = (
+        seasonally_labeled_daily_data[daily_rain.name]
+        .groupby(seasonally_labeled_daily_data["seasons_starts"])
+        .map(
+            calc.onset_date,
+            wet_thresh=wet_thresh,
+            wet_spell_length=wet_spell_length,
+            wet_spell_thresh=wet_spell_thresh,
+            min_wet_days=min_wet_days,
+            dry_spell_length=dry_spell_length,
+            dry_spell_search=dry_spell_search,
+        )
+        .drop_vars(time_dim)
+        .rename({"seasons_starts": time_dim})
+    )
+    seasons_ends = seasonally_labeled_daily_data["seasons_ends"].rename({"group": time_dim})
+    return xr.merge([seasonal_data, seasons_ends])
+
+
+def soil_plant_water_balance_loop(
+    peffective,
+    et,
+    taw,
+    sminit,
+    kc_params=None,
+    planting_date=None,
+    sm_threshold=None,
+    rho_crop=None,
+    rho_adj=False,
+    time_dim="T",
+):
+    """soil_plant_water_balance as it was before the batched engine."""
+    # If not yet, et, taw and sminit must be DataArrays
+    et = xr.DataArray(et)
+    taw = xr.DataArray(taw)
+    sminit = xr.DataArray(sminit)
+    if kc_params is None:
+        # Setting kc and et_crop
+        if planting_date is not None or sm_threshold is not None:
+            raise Exception(
+                "if Kc is not defined, neither planting_date nor sm_threshold should be"
+            )
+        kc = 1
+        et_crop = et
+    else:
+        # Allocating et_crop
+        # et_crop depends on et, kc and planting_date dims, and time_dim
+        kc_inflex = kc_params.assign_coords(
+            kc_periods=kc_params["kc_periods"].cumsum(dim="kc_periods")
+        )
+        if planting_date is not None: # distance between 1st and planting days
+            if sm_threshold is not None:
+                raise Exception("either planting_date or sm_threshold should be defined")
+            planted_since = peffective[time_dim][0].drop_vars(time_dim) - planting_date
+        else: # 1st day is planting day if sminit met condition
+            if sm_threshold is not None:
+                planted_since = xr.where(
+                    sminit >= sm_threshold, 0, np.nan
+                ).astype("timedelta64[D]")
+            else:
+                raise Exception("if planting_date is not defined, then define a sm_threshold")
+        et_crop = et.broadcast_like(
+            peffective[time_dim]
+        ).broadcast_like(
+            planted_since
+        ).broadcast_like(
+            kc_params.isel({"kc_periods": 0}, drop=True)
+        ) * np.nan
+    # Allocating smimit
+    # sminit depends on peffective, et_crop and taw dims, and the day before time_dim[0]
+    sminit = sminit.broadcast_like(
+        peffective.isel({time_dim: 0})
+    ).broadcast_like(
+        et_crop.isel({time_dim: 0}, missing_dims='ignore', drop=True)
+    ).broadcast_like(
+        taw
+    ).assign_coords({time_dim: peffective[time_dim][0] - np.timedelta64(1, "D")})
+    # Allocating sm
+    # sm depends on sminit dims and time_dim
+    sm = sminit.drop_vars(time_dim).broadcast_like(peffective[time_dim]) * np.nan
+    if rho_crop is None:
+        # Setting ks and et_crop_red
+        ks = 1
+        et_crop_red = et_crop
+    else:
+        # Allocating et_crop_red
+        # et_crop_red depends on sm and rho_crop dims
+        rho_crop = xr.DataArray(rho_crop)
+        if not rho_adj: # raw is constant against time
+            raw = rho_crop * taw
+        et_crop_red = sm.broadcast_like(rho_crop)
+    # Allocating drainage
+    # drainage depends on sm dims
+    drainage = xr.full_like(sm, fill_value=np.nan)
+    # sm starts with initial condition sminit
+    sm = xr.concat([sminit, sm], time_dim)
+    # Filling/emptying bucket day after day
+    for doy in range(0, peffective[time_dim].size):
+        if kc_params is not None: # interpolate kc value per distance from planting
+            kc = kc_inflex.interp(
+                kc_periods=planted_since, kwargs={"fill_value": 1}
+            ).where(lambda x: x.notnull(), other=1).drop_vars("kc_periods")
+            if time_dim in et_crop.dims: # et _crop depends on time_dim but et might not
+                et_crop[{time_dim: doy}] = kc * et.isel({time_dim: doy}, missing_dims='ignore')
+        if rho_crop is not None: # apply water stress conditions penalization of et_crop
+            if rho_adj: # raw depends on et_crop
+                raw = (
+                    rho_crop + 0.04 * (5 - et_crop.isel({time_dim: doy}, missing_dims='ignore'))
+                ).clip(0.1, 0.8) * taw
+            # penalization depends on previous day sm
+            ks = (sm.isel({time_dim: doy}, drop=True) / raw).clip(max=1)
+            et_crop_red[{time_dim: doy}] = ks * et_crop.isel({time_dim: doy}, missing_dims='ignore')
+        # water balance step
+        sm[{time_dim: doy+1}], drainage[{time_dim: doy}] = agronomy.soil_plant_water_step(
+            sm.isel({time_dim: doy}, drop=True),
+            peffective.isel({time_dim: doy}, drop=True),
+            et_crop_red.isel({time_dim: doy}, missing_dims='ignore', drop=True),
+            taw,
+        )
+        # Increment planted_since
+        if kc_params is not None:
+            if planting_date is None: # did doy met planting conditions?
+                planted_since = planted_since.where(
+                    lambda x: x.notnull(), # no planting date found yet
+                    other=xr.where( # next day is planting if sm condition met
+                        sm.isel({time_dim: doy+1}) >= sm_threshold, -1, np.nan
+                    ).astype("timedelta64[D]"),
+                )
+            planted_since = planted_since + np.timedelta64(1, "D")
+    # Let's have sm same shape as other variables
+    sm = sm.isel({time_dim: slice(1,None)})
+    # Let's save planting_date
+    if kc_params is not None and planting_date is None:
+        planting_date = (peffective[time_dim][-1].drop_vars(time_dim)
+            - (planted_since - np.timedelta64(1, "D"))
+        ).rename("planting_date")
+    return (
+        sm.rename("sm"),
+        drainage.rename("drainage"),
+        et_crop.rename("et_crop"),
+        et_crop_red.rename("et_crop_red"),
+        planting_date,
+    )
+
+
+def longest_run_length_cumsum(flagged_data, dim):
+    """longest_run_length as it was before the run-length encoding."""
+    # Special case coord.size = 1
+    lrl = flagged_data
+    if lrl[dim].size != 1:
+        # Points to apply diff to
+        unflagged_and_ends = (flagged_data == 0) * 1
+        unflagged_and_ends[{dim: [0, -1]}] = 1
+
+        lrl = lrl.cumsum(dim=dim).where(unflagged_and_ends, other = np.nan).where(
+            # first cumul point must be set to 0
+            lambda x: x[dim] != lrl[dim][0], other=0
+        ).bfill(dim).diff(dim).max(dim=dim)
+    lrl.attrs = dict(description="Longest Run Length")
+    return lrl
+
+
+def following_dry_spell_length_cumsum(daily_rain, wet_thresh, time_dim="T"):
+    """following_dry_spell_length as it was before the run-length
+    encoding."""
+    # Find dry days
+    dry_day = ~(daily_rain > wet_thresh) * 1
+    # Cumul dry days backwards and shift back to get the count to exclude day of
+    count_dry_days_after_today = dry_day.reindex({time_dim: dry_day[time_dim][::-1]}).cumsum(
+        dim=time_dim
+    ).reindex({time_dim: dry_day[time_dim]}).shift({time_dim: -1})
+    # Find where dry day followed by wet day
+    dry_to_wet_day = dry_day.diff(time_dim, label="lower").where(lambda x : x == -1, other=0)
+    # Record cumul dry days on that day and put nan elsewhere
+    dry_days_offset = (count_dry_days_after_today * dry_to_wet_day).where(lambda x : x != 0, other=np.nan)
+    # Back fill nans and assign 0 to tailing ones
+    dry_days_offset = dry_days_offset.bfill(dim=time_dim).fillna(0)
+    # Subtract offset and shifted wet days are 0.
+    dry_spell_length = (count_dry_days_after_today + dry_days_offset) * dry_day.shift({time_dim: -1})
+    return dry_spell_length
+
+
+def onset_date_rolling(
+    daily_rain, wet_thresh, wet_spell_length, wet_spell_thresh, min_wet_days,
+    dry_spell_length, dry_spell_search, time_dim="T",
+):
+    """onset_date as it was before the run-length encoding of dry
+    spells."""
+    # Find wet days
+    wet_day = daily_rain > wet_thresh
+
+    # Find 1st wet day in wet spells length
+    first_wet_day = wet_day * 1
+    first_wet_day = (
+        first_wet_day.rolling(**{time_dim: wet_spell_length})
+        .construct("wsl")
+        .argmax("wsl")
+    )
+
+    # Find wet spells
+    wet_spell = (
+        daily_rain.rolling(**{time_dim: wet_spell_length}).sum() >= wet_spell_thresh
+    ) & ((wet_day*1).rolling(**{time_dim: wet_spell_length}).sum() >= min_wet_days)
+
+    # Find dry spells following wet spells
+    if dry_spell_search == 0:
+        dry_spell_ahead = False
+    else:
+        dry_day = ~wet_day
+        dry_spell = (
+            (dry_day*1).rolling(**{time_dim: dry_spell_length}).sum() == dry_spell_length
+        )
+        # Note that rolling assigns to the last position of the wet_spell
+        dry_spell_ahead = (
+            (dry_spell*1).rolling(**{time_dim: dry_spell_search})
+            .sum()
+            .shift(**{time_dim: dry_spell_search * -1})
+            != 0
+        )
+
+    # Create a mask of 1s and nans where onset conditions are met
+    onset_mask = (wet_spell & ~dry_spell_ahead) * 1
+    onset_mask = onset_mask.where((onset_mask == 1))
+
+    # Find onset date (or rather last day of 1st valid wet spell)
+    onset_delta = onset_mask.idxmax(dim=time_dim)
+    onset_delta = (
+        onset_delta
+        # offset relative position of first wet day
+        - (
+            wet_spell_length
+            - 1
+            - first_wet_day.where(first_wet_day[time_dim] == onset_delta).max(
+                dim=time_dim
+            )
+        ).astype("timedelta64[D]")
+        # delta from 1st day of time series
+        - daily_rain[time_dim][0]
+    ).rename("onset_delta")
+    return onset_delta
+
+
+def measure(label, f, number=1):
+    seconds = min(timeit.repeat(f, number=number, repeat=3)) / number
+    print(f"{label:<40} {seconds * 1e3:10.1f} ms")
+
+
+def main():
+    # Two years over a 1.5 by 1.5 degree box: 730 days by 40 by 40
+    # pixels.
+    precip = calc.synthesize_enacts("precip", "daily", [0, 0, 1.5, 1.5])
+    precip = precip.isel(T=slice(-730, None))
+    taw = calc.synthesize_taw([0, 0, 1.5, 1.5])
+    print(f"precip: {dict(precip.sizes)}")
+
+    xr.testing.assert_identical(
+        water_balance_loop(precip, 5, taw, 0),
+        calc.water_balance(precip, 5, taw, 0),
+    )
+    measure("water_balance, xarray loop",
+            lambda: water_balance_loop(precip, 5, taw, 0))
+    measure("water_balance, array scan",
+            lambda: calc.water_balance(precip, 5, taw, 0), number=5)
+    measure("water_balance reduce, xarray loop",
+            lambda: water_balance_loop(precip, 5, taw, 0, reduce=True))
+    measure("water_balance reduce, array scan",
+            lambda: calc.water_balance(precip, 5, taw, 0, reduce=True), number=5)
+
+    # Cessation over ten seasons, with the parameters of the onset
+    # maproom.
+    precip = calc.synthesize_enacts("precip", "daily", [0, 0, 1.5, 1.5])
+    precip = precip.sel(T=slice("2010-01-01", "2019-12-31"))
+    args = (precip, 1, 9, 90, 5, 3, 5, 60, 60. / 3.)
+    xr.testing.assert_identical(
+        seasonal_cess_date_from_rain_groupby(*args),
+        calc.seasonal_cess_date_from_rain(*args),
+    )
+    measure("10 seasons of cessation, groupby loop",
+            lambda: seasonal_cess_date_from_rain_groupby(*args))
+    measure("10 seasons of cessation, fused kernel",
+            lambda: calc.seasonal_cess_date_from_rain(*args), number=5)
+
+    # Onset over thirty seasons, with the parameters of the onset
+    # maproom.
+    precip = calc.synthesize_enacts("precip", "daily", [0, 0, 1.5, 1.5])
+    precip = precip.sel(T=slice("1990-01-01", "2019-12-31"))
+    for label, data in [("", precip), (" at one pixel", precip.isel(X=0, Y=0))]:
+        args = (data, 1, 3, 90, 1, 3, 20, 1, 7, 21)
+        xr.testing.assert_identical(
+            seasonal_onset_date_groupby(*args),
+            calc.seasonal_onset_date(*args),
+        )
+        measure(f"30 onsets{label}, groupby",
+                lambda: seasonal_onset_date_groupby(*args))
+        measure(f"30 onsets{label}, season cube",
+                lambda: calc.seasonal_onset_date(*args), number=5)
+
+    # A season of the water balance maproom over 10 by 10 pixels, for 6
+    # planting dates, 2 crops and 2 soils.
+    precip = calc.synthesize_enacts("precip", "daily", [0, 0, 0.375, 0.375])
+    precip = precip.sel(T=slice("2019-03-01", "2019-08-31"))
+    kc_params = xr.DataArray(
+        [[0.2, 0.4, 1.2, 1.2, 0.6], [0.3, 0.5, 1.1, 1.1, 0.5]],
+        dims=["crop", "kc_periods"],
+        coords={
+            "crop": ["maize", "sorghum"],
+            "kc_periods": pd.to_timedelta([0, 45, 47, 45, 45], unit="D"),
+        },
+    )
+    planting_date = xr.DataArray(
+        pd.date_range("2019-03-01", periods=6, freq="10D"), dims=["p_d"]
+    )
+    taw = xr.DataArray([60., 120.], dims=["soil"])
+    kwargs = dict(
+        et=5, taw=taw, sminit=taw / 3., kc_params=kc_params,
+        planting_date=planting_date, rho_crop=0.5,
+    )
+    print(f"precip: {dict(precip.sizes)}, scenarios: 6 x 2 x 2")
+    for old, new in zip(
+        soil_plant_water_balance_loop(precip, **kwargs),
+        agronomy.soil_plant_water_balance(precip, **kwargs),
+    ):
+        xr.testing.assert_identical(old, new)
+    measure("water balance scenarios, xarray loop",
+            lambda: soil_plant_water_balance_loop(precip, **kwargs))
+    measure("water balance scenarios, batched",
+            lambda: agronomy.soil_plant_water_balance(precip, **kwargs), number=5)
+
+    # Dry and wet spells over a season of 184 days by 40 by 40 pixels,
+    # with the parameters of the onset maproom.
+    precip = calc.synthesize_enacts("precip", "daily", [0, 0, 1.5, 1.5])
+    precip = precip.sel(T=slice("2019-03-01", "2019-08-31"))
+    print(f"precip: {dict(precip.sizes)}")
+    dry_day = precip <= 1
+    xr.testing.assert_identical(
+        longest_run_length_cumsum(dry_day, "T"),
+        calc.longest_run_length(dry_day, "T"),
+    )
+    measure("longest dry spell, cumsum",
+            lambda: longest_run_length_cumsum(dry_day, "T"), number=5)
+    measure("longest dry spell, runs",
+            lambda: calc.longest_run_length(dry_day, "T"), number=5)
+    xr.testing.assert_identical(
+        following_dry_spell_length_cumsum(precip, 1),
+        calc.following_dry_spell_length(precip, 1),
+    )
+    measure("following dry spells, cumsum",
+            lambda: following_dry_spell_length_cumsum(precip, 1), number=5)
+    measure("following dry spells, runs",
+            lambda: calc.following_dry_spell_length(precip, 1), number=5)
+    args = (precip, 1, 3, 20, 1, 7, 21)
+    xr.testing.assert_identical(
+        onset_date_rolling(*args), calc.onset_date(*args),
+    )
+    measure("onset, rolling dry spells",
+            lambda: onset_date_rolling(*args), number=5)
+    measure("onset, runs of dry days",
+            lambda: calc.onset_date(*args), number=5)
+
+
+if __name__ == "__main__":
+    main()
@@ -178,6 +178,57 @@ def test_spwba_findpd():
     assert (p_d[1] == precip["T"][0])
 
 
+def test_spwba_scenarios_are_independent_runs():
+    kc_periods = pd.TimedeltaIndex([0, 4, 5, 10, 10], unit="D")
+    kc_params = xr.DataArray(
+        data=[[0.2, 0.4, 1.2, 1.2, 0.6], [0.3, 0.5, 1, 1, 0.5]],
+        dims=["crop", "kc_periods"],
+        coords={"crop": ["a", "b"], "kc_periods": kc_periods},
+    )
+    planting_date = xr.DataArray(
+        pd.DatetimeIndex(data=["2000-05-02", "2000-05-13", "2000-05-20"]),
+        dims=["p_d"],
+        coords={"p_d": [0, 1, 2]},
+    )
+    taw = xr.DataArray([60, 90], dims=["soil"], coords={"soil": ["s", "d"]})
+    t = pd.date_range(start="2000-05-01", end="2000-06-30", freq="1D")
+    precip = xr.DataArray(
+        np.random.default_rng(0).gamma(0.6, 8, t.shape), dims=["T"], coords={"T": t}
+    )
+    sm, drainage, et_crop, et_crop_red, p_d = agronomy.soil_plant_water_balance(
+        precip,
+        et=5,
+        taw=taw,
+        sminit=taw/3.,
+        kc_params=kc_params,
+        planting_date=planting_date,
+        rho_crop=0.5,
+    )
+
+    for crop in kc_params["crop"]:
+        for pd_i in planting_date["p_d"]:
+            for soil in taw["soil"]:
+                one = agronomy.soil_plant_water_balance(
+                    precip,
+                    et=5,
+                    taw=taw.sel(soil=soil),
+                    sminit=taw.sel(soil=soil)/3.,
+                    kc_params=kc_params.sel(crop=crop),
+                    planting_date=planting_date.sel(p_d=pd_i),
+                    rho_crop=0.5,
+                )
+                for batched, single in zip(
+                    (sm, drainage, et_crop, et_crop_red), one
+                ):
+                    scenario = {"crop": crop, "p_d": pd_i, "soil": soil}
+                    assert np.allclose(
+                        batched.sel({
+                            k: v for k, v in scenario.items() if k in batched.dims
+                        }).transpose(*single.dims),
+                        single,
+                    )
+
+
 def test_antedecedent_precip_ind():
     t = pd.date_range(start="2000-05-01", end="2000-05-07", freq="1D")
     x = xr.DataArray(
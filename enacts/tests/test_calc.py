@@ -1,3 +1,4 @@
+import os
 import numpy as np
 import pandas as pd
 import xarray as xr
@@ -75,6 +76,20 @@ def test_longest_run_length_coord_size_1():
     assert lds0 == 0
 
 
+def test_longest_run_length_with_missing_data():
+
+    data_cond = xr.DataArray(
+        [1, np.nan, 1, 0, np.nan, np.nan, 1, 1, 1, np.nan],
+        dims=["T"],
+        coords={"T": pd.date_range(start="2000-05-01", periods=10)},
+    )
+    lds = calc.longest_run_length(data_cond, "T")
+    lds_all_missing = calc.longest_run_length(data_cond * np.nan, "T")
+
+    assert lds == 3
+    assert lds_all_missing == 0
+
+
 def test_following_dry_spell_length():
 
     precip = precip_sample()
@@ -277,6 +292,25 @@ def test_water_balance_et_has_T_reduce_True():
     assert np.array_equal(wb.soil_moisture, expected)
 
 
+def test_water_balance_taw_is_xarray():
+
+    t = pd.date_range(start="2000-05-01", end="2000-05-04", freq="1D")
+    values = [
+        [5.0, 6.0, 3.0, 66.0],
+        [10.0, 12.0, 14.0, 16.0],
+    ]
+    precip = xr.DataArray(values, dims=["X", "T"], coords={"T": t})
+    taw = xr.DataArray([60, 20], dims=["X"])
+    wb = calc.water_balance(precip, 5, taw, 0)
+
+    assert wb.soil_moisture.dims == ("T", "X")
+    expected = np.transpose([
+        [0.0, 1.0, 0.0, 60.0],
+        [5.0, 12.0, 20.0, 20.0],
+    ])
+    assert np.array_equal(wb.soil_moisture, expected)
+
+
 def test_daily_tobegroupedby_season_cuts_on_days():
 
     precip = data_test_calc.multi_year_data_sample()
@@ -311,6 +345,22 @@ def test_daily_tobegroupedby_season_picks_right_end_dates():
     ).all()
 
 
+def test_season_cube_pads_seasons_without_29_feb():
+
+    precip = data_test_calc.multi_year_data_sample()
+    dts = calc.daily_tobegroupedby_season(precip, 29, 11, 29, 2)
+    cube = calc._season_cube(dts.precip, dts.seasons_starts)
+
+    assert cube.dims == ("T", "day_of_season")
+    assert (cube["T"] == cube["date"].isel(day_of_season=0)).all()
+    assert (cube["T"].dt.strftime("%d-%m") == "29-11").all()
+    # 2003-11-29 to 2004-02-29 is the only season with a 29 Feb
+    assert cube["day_of_season"].size == 93
+    assert (cube["date"].notnull().sum("day_of_season") == [92, 92, 92, 93, 92]).all()
+    assert np.isnan(cube.isel(T=0, day_of_season=-1))
+    assert cube.isel(T=3, day_of_season=-1) == dts.precip.sel(T="2004-02-29")
+
+
 def test_seasonal_onset_date_keeps_returning_same_outputs():
 
     precip = data_test_calc.multi_year_data_sample()
@@ -502,6 +552,65 @@ def test_seasonal_cess_date():
     ).all()
 
 
+def test_seasonal_onset_date_is_onset_date_of_each_season():
+    precip = data_test_calc.multi_year_data_sample()
+    precip = xr.concat(
+        [precip, precip.shift(T=40), precip.shift(T=-70)],
+        dim=pd.Index([0, 1, 2], name="X"),
+    ).fillna(0).rename("precip")
+    onsetsds = calc.seasonal_onset_date(
+        daily_rain=precip,
+        search_start_day=1,
+        search_start_month=3,
+        search_days=90,
+        wet_thresh=1,
+        wet_spell_length=3,
+        wet_spell_thresh=20,
+        min_wet_days=1,
+        dry_spell_length=7,
+        dry_spell_search=21,
+    )
+
+    assert onsetsds.onset_delta.dims == ("X", "T")
+    for season_start, season_end in zip(
+        onsetsds["T"].values, onsetsds.seasons_ends.values
+    ):
+        season = precip.sel(T=slice(season_start, season_end))
+        expected = calc.onset_date(season, 1, 3, 20, 1, 7, 21)
+        assert np.array_equal(
+            onsetsds.onset_delta.sel(T=season_start), expected, equal_nan=True
+        )
+
+
+def test_seasonal_cess_date_from_rain_is_cess_date_of_each_season():
+    precip = data_test_calc.multi_year_data_sample()
+    precip = xr.concat(
+        [precip, precip.shift(T=40), precip.shift(T=-70)],
+        dim=pd.Index([0, 1, 2], name="X"),
+    ).fillna(0).rename("precip")
+    cessds = calc.seasonal_cess_date_from_rain(
+        daily_rain=precip,
+        search_start_day=1,
+        search_start_month=9,
+        search_days=90,
+        dry_thresh=5,
+        dry_spell_length_thresh=3,
+        et=5,
+        taw=60,
+        sminit=0,
+    )
+
+    assert cessds.cess_delta.dims == ("X", "T")
+    for season_start in cessds["T"].values:
+        season = precip.sel(T=slice(
+            season_start, season_start + np.timedelta64(90, "D")
+        ))
+        expected = calc.cess_date_from_rain(season, 5, 3, 5, 60, 0)
+        assert np.array_equal(
+            cessds.cess_delta.sel(T=[season_start]), expected, equal_nan=True
+        )
+
+
 def test_seasonal_cess_date_from_rain():
     t = pd.date_range(start="2000-01-01", end="2005-02-28", freq="1D")
     synthetic_precip = xr.DataArray(np.zeros(t.size), dims=["T"], coords={"T": t}) + 1.1
@@ -870,3 +979,71 @@ def test_probExceed():
         0.000000,
     ]
     assert np.allclose(cumsum.probExceed, probExceed_values)
+
+
+def test_get_data_is_cached(tmp_path):
+    data = xr.DataArray(
+        np.arange(12.).reshape(3, 2, 2),
+        coords={
+            "T": pd.date_range("2000-01-01", periods=3),
+            "Y": [0., 1.],
+            "X": [0., 1.],
+        },
+        name="precip",
+    )
+    data.to_dataset().to_zarr(tmp_path / "rr.zarr")
+    ds_conf = {"daily": {
+        "zarr_path": f"{tmp_path}/",
+        "vars": {"precip": ["rr.zarr", None, "precip"]},
+    }}
+    calc.clear_data_cache()
+
+    first = calc.get_data("precip", "daily", ds_conf)
+    assert calc.get_data("precip", "daily", ds_conf) is first
+    np.testing.assert_array_equal(first.values, data.values)
+
+    (data + 1).to_dataset().to_zarr(tmp_path / "rr.zarr", mode="w")
+    os.utime(tmp_path / "rr.zarr", ns=(2 ** 62, 2 ** 62))
+    second = calc.get_data("precip", "daily", ds_conf)
+    assert second is not first
+    np.testing.assert_array_equal(second.values, data.values + 1)
+
+    calc.clear_data_cache()
+    assert calc.get_data("precip", "daily", ds_conf) is not second
+
+
+def test_read_enacts_is_cached_by_overview_factor(tmp_path):
+    data = xr.DataArray(
+        np.zeros((2, 8, 8)),
+        dims=["T", "Y", "X"],
+        coords={
+            "T": pd.date_range("2000-01-01", periods=2),
+            "Y": np.arange(8) * 0.1,
+            "X": np.arange(8) * 0.1,
+        },
+        name="precip",
+    )
+    data.to_dataset().to_zarr(tmp_path / "rr.zarr")
+    ds_conf = {"daily": {
+        "zarr_path": f"{tmp_path}/",
+        "vars": {"precip": ["rr.zarr", None, "precip"]},
+    }}
+    calc.clear_data_cache()
+
+    coarse = calc.get_data("precip", "daily", ds_conf, resolution=0.25)
+    for resolution in np.linspace(0.2, 0.39, 20):
+        assert calc.get_data(
+            "precip", "daily", ds_conf, resolution=resolution
+        ) is coarse
+    assert coarse.sizes["X"] == 4
+    assert calc.data_cache_stats()["datasets"]["entries"] == 2
+
+
+def test_get_taw_synthetic_is_cached():
+    ds_conf = {"taw_file": "FAKE", "bbox": [0, 0, 1, 1]}
+    calc.clear_data_cache()
+
+    taw = calc.get_taw(ds_conf)
+    assert calc.get_taw(ds_conf) is taw
+    calc.clear_data_cache()
+    assert calc.get_taw(ds_conf) is not taw
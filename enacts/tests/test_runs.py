@@ -0,0 +1,76 @@
+import numpy as np
+import runs
+
+
+def test_runs_encoding():
+
+    r = runs.Runs([0, 0, 1, 1, 1, 0, 1])
+
+    assert np.array_equal(r.series, [0, 0, 0, 0])
+    assert np.array_equal(r.start, [0, 2, 5, 6])
+    assert np.array_equal(r.length, [2, 3, 1, 1])
+    assert np.array_equal(r.value, [False, True, False, True])
+
+
+def test_runs_do_not_cross_series():
+
+    r = runs.Runs([[1, 1, 0], [1, 0, 0]])
+
+    assert np.array_equal(r.series, [0, 0, 1, 1])
+    assert np.array_equal(r.start, [0, 2, 0, 1])
+    assert np.array_equal(r.longest(), [2, 1])
+
+
+def test_longest():
+
+    r = runs.Runs([[0, 0, 0], [1, 0, 1], [1, 1, 1]])
+
+    assert np.array_equal(r.longest(), [0, 1, 3])
+
+
+def test_longest_with_weights():
+
+    r = runs.Runs([1, 1, 0, 1, 1, 1])
+
+    assert r.longest(weights=[3, 3, 1, 1, 1, 1]) == 6
+
+
+def test_runs_of_no_days():
+
+    r = runs.Runs(np.zeros((3, 0)))
+
+    assert np.array_equal(r.longest(), [0, 0, 0])
+    assert r.length_until().shape == (3, 0)
+    assert r.days_to_length(2).shape == (3, 0)
+
+
+def test_length_until_and_from():
+
+    r = runs.Runs([1, 1, 0, 1, 1, 1])
+
+    assert np.array_equal(r.length_until(), [1, 2, 0, 1, 2, 3])
+    assert np.array_equal(r.length_from(), [2, 1, 0, 3, 2, 1])
+
+
+def test_days_to_length():
+
+    r = runs.Runs([0, 1, 1, 0, 1, 1, 1, 0])
+
+    assert np.array_equal(r.days_to_length(2), [2, 1, 3, 2, 1, 1, 2, 1])
+    assert np.array_equal(r.days_to_length(3), [6, 5, 4, 3, 2, 1, 2, 1])
+    assert np.array_equal(r.days_to_length(4), [8, 7, 6, 5, 4, 3, 2, 1])
+
+
+def test_runs_along_axis():
+
+    flags = np.random.default_rng(0).random((3, 20, 4)) > 0.3
+    r = runs.Runs(flags, axis=1)
+    length_until = r.length_until()
+    days_to_length = r.days_to_length(3)
+
+    for i in range(3):
+        for j in range(4):
+            series = runs.Runs(flags[i, :, j])
+            assert r.longest()[i, j] == series.longest()
+            assert np.array_equal(length_until[i, :, j], series.length_until())
+            assert np.array_equal(days_to_length[i, :, j], series.days_to_length(3))
@@ -22,7 +22,7 @@ from controls import Sentence, DateNoYear, Number, Select, Text
 import xarray as xr
 import agronomy as ag
 
-from globals_ import GLOBAL_CONFIG, FLASK
+from globals_ import GLOBAL_CONFIG, FLASK, TILE_CACHE, GEOMETRIES
 
 CONFIG = GLOBAL_CONFIG["maprooms"]["wat_bal"]
 
@@ -304,7 +304,7 @@ def register(FLASK, config):
         ] + [
             mapr_u.make_adm_overlay(
                 adm_name=adm["name"],
-                adm_geojson=calc.sql2GeoJSON(adm["sql"], GLOBAL_CONFIG["db"]),
+                adm_geojson=GEOMETRIES.get(adm["sql"]).geojson(),
                 adm_clor=adm["color"],
                 adm_lev=i+1,
                 adm_weight=len(ADMIN_CONFIG)-i,
@@ -704,7 +704,14 @@ def register(FLASK, config):
         return wat_bal_graph
 
 
+    def tile_version(**kwargs):
+        return (
+            calc.data_version(**PRECIP_PARAMS),
+            calc.taw_version(GLOBAL_CONFIG["datasets"]),
+        )
+
     @FLASK.route(f"{TILE_PFX}/<int:tz>/<int:tx>/<int:ty>")
+    @pingrid.cache_tile(TILE_CACHE, tile_version)
     def wat_bal_tile(tz, tx, ty):
         parse_arg = pingrid.parse_arg
         map_choice = parse_arg("map_choice")
@@ -721,7 +728,8 @@ def register(FLASK, config):
         kc_late_length = parse_arg("kc_late_length", int)
         kc_end = parse_arg("kc_end", float)
 
-        rr_mrg = calc.get_data(**PRECIP_PARAMS)
+        tile_resolution = pingrid.tile_resolution(ty, tz)
+        rr_mrg = calc.get_data(**PRECIP_PARAMS, resolution=tile_resolution)
         precip = rr_mrg
         x_min = pingrid.tile_left(tx, tz)
         x_max = pingrid.tile_left(tx + 1, tz)
@@ -740,7 +748,7 @@ def register(FLASK, config):
             return pingrid.image_resp(pingrid.empty_tile())
         _, taw = xr.align(
             precip,
-            calc.get_taw(GLOBAL_CONFIG["datasets"]),
+            calc.get_taw(GLOBAL_CONFIG["datasets"], resolution=tile_resolution),
             join="override",
             exclude="T",
         )
@@ -812,9 +820,7 @@ def register(FLASK, config):
         map = map.rename(X="lon", Y="lat")
         map.attrs["scale_min"] = 0
         map.attrs["scale_max"] = map_max
-        clip_shape = calc.sql2geom(
-            ADMIN_CONFIG[0]['sql'], GLOBAL_CONFIG["db"]
-        )["the_geom"][0]
+        clip_shape = GEOMETRIES.get(ADMIN_CONFIG[0]['sql']).geoms[0]
         return pingrid.tile(map, tx, ty, tz, clip_shape)
 
 
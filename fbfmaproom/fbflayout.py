@@ -205,6 +205,7 @@ def control_layout():
                 id="control_row",
                 children=[
                     dcc.Store(id="geom_key"),
+                    dcc.Store(id="borders_zoom_band"),
                     html.Div(
                         [html.H4("AA Design")],
                         style={
@@ -12,7 +12,6 @@ import numpy as np
 import pandas as pd
 from pathlib import Path
 import xarray as xr
-import cv2
 import flask
 import dash
 from dash import html
@@ -20,9 +19,8 @@ from dash.dependencies import Output, Input, State, ALL
 from dash.exceptions import PreventUpdate
 import shapely
 from shapely import wkb
-from shapely.geometry import Polygon, Point
+from shapely.geometry import Polygon
 from shapely.geometry.multipoint import MultiPoint
-import psycopg2
 from psycopg2 import sql
 import math
 import sys
@@ -30,7 +28,6 @@ import traceback
 import enum
 import itertools
 import uuid
-import warnings
 import yaml
 
 import __about__ as about
@@ -221,6 +218,14 @@ PFX = CONFIG["core_path"]
 TILE_PFX = CONFIG["tile_path"]
 ADMIN_PFX = CONFIG["admin_path"]
 
+TILE_CACHE = pingrid.TileCache(**CONFIG.get("tile_cache", {}))
+pingrid.configure_image_encoding(**CONFIG.get("tile_encoding", {}))
+DB_POOL = pingrid.db_pool(CONFIG["db"])
+DATASETS = pingrid.DatasetRegistry(**CONFIG.get("dataset_registry", {}))
+GEOMETRIES = pingrid.GeometryStore(
+    lambda source: retrieve_shapes(*source), **CONFIG.get("geometry_store", {})
+)
+
 APP = FbfDash(
     __name__,
     external_stylesheets=[dbc.themes.BOOTSTRAP],
@@ -245,19 +250,25 @@ def open_data_array(
     val_min=None,
     val_max=None,
 ):
+    return scaled_data_array(shared_data_array(cfg), cfg, val_min, val_max)
+
+
+def shared_data_array(cfg):
+    """The opened DataArray of `cfg`, which is shared by all callers:
+    don't modify it."""
     path = data_path(cfg.path)
-    try:
-        ds = xr.open_zarr(path, consolidated=False)
-    except Exception as e:
-        raise Exception(f"Couldn't open {path}") from e
-    ds = ds.rename({
-        v: k
-        for k, v in cfg.var_names.items()
-        if v is not None and v != k
-    })
-    da = ds["value"]
+    return DATASETS.get(
+        (path, json.dumps(cfg.var_names, sort_keys=True)),
+        path,
+        lambda: _open_data_array(path, cfg.var_names),
+    )
 
 
+def scaled_data_array(da, cfg, val_min=None, val_max=None):
+    """A copy of the shared DataArray `da` with the attributes used to
+    draw it."""
+    da = da.copy(deep=False)
+
     if val_min is None:
         val_min = cfg.range[0]
     if val_max is None:
@@ -268,6 +279,19 @@ def open_data_array(
     return da
 
 
+def _open_data_array(path, var_names):
+    try:
+        ds = pingrid.open_zarr(path)
+    except Exception as e:
+        raise Exception(f"Couldn't open {path}") from e
+    ds = ds.rename({
+        v: k
+        for k, v in var_names.items()
+        if v is not None and v != k
+    })
+    return ds["value"]
+
+
 def open_forecast(country_key, forecast_key):
     cfg = CONFIG["countries"][country_key]["datasets"]["forecasts"][forecast_key]
     return open_forecast_from_config(cfg)
@@ -277,13 +301,18 @@ def open_forecast_from_config(ds_config):
     return open_data_array(ds_config, val_min=0.0, val_max=100.0)
 
 
-def open_obs(country_key, obs_key):
+def open_obs(country_key, obs_key, target_month0=None):
     cfg = CONFIG["countries"][country_key]["datasets"]["observations"][obs_key]
-    return open_obs_from_config(cfg)
+    return open_obs_from_config(cfg, target_month0)
 
 
-def open_obs_from_config(ds_config):
-    da = open_data_array(ds_config, val_min=0.0, val_max=1000.0)
+def open_obs_from_config(ds_config, target_month0=None):
+    """The observations of `ds_config`, only those of `target_month0`
+    if given."""
+    shared = shared_data_array(ds_config)
+    da = scaled_data_array(shared, ds_config, val_min=0.0, val_max=1000.0)
+    if target_month0 is not None:
+        da = da.isel(time=obs_positions(ds_config, shared, target_month0))
     if da.dtype == 'timedelta64[ns]':
         da = (da / np.timedelta64(1, 'D')).astype(float)
     return da
@@ -307,20 +336,18 @@ def year_label(midpoint, season_length):
     return label
 
 
+def admin_geometries(country_key: str, mode) -> pingrid.GeometrySet:
+    return GEOMETRIES.get((country_key, int(mode)))
+
+
 def geometry_containing_point(
     country_key: str, point: Tuple[float, float], mode: str
 ):
-    df = retrieve_vulnerability(country_key, mode, 2020)  # arbitrary year
-    x, y = point
-    p = Point(x, y)
-    geom, attrs = None, None
-    for _, r in df.iterrows():
-        minx, miny, maxx, maxy = r["the_geom"].bounds
-        if minx <= x <= maxx and miny <= y <= maxy and r["the_geom"].contains(p):
-            geom = r["the_geom"]
-            attrs = {k: v for k, v in r.items() if k not in ("the_geom")}
-            break
-    return geom, attrs
+    gs = admin_geometries(country_key, mode)
+    i = gs.containing(*point)
+    if i is None:
+        return None, None
+    return gs.geoms[i], {"key": gs.keys[i], "label": gs.labels[i]}
 
 
 def retrieve_vulnerability(
@@ -332,7 +359,7 @@ def retrieve_vulnerability(
         "vuln_sql",
         "select cast(null as int) as key, 0 as year, 0 as vuln where 1 = 2"
     )
-    with psycopg2.connect(**CONFIG["db"]) as conn:
+    with DB_POOL.connection() as conn:
         s = sql.Composed(
             [
                 sql.SQL("with v as ("),
@@ -350,7 +377,7 @@ def retrieve_vulnerability(
                         group by key
                     )
                     select
-                        g.label, g.key, g.the_geom,
+                        g.label, g.key,
                         v.year,
                         v.vuln as vulnerability,
                         a.mean as mean,
@@ -372,8 +399,6 @@ def retrieve_vulnerability(
             conn,
             params=dict(year=year),
         )
-    # print("bytes: ", sum(df.the_geom.apply(lambda x: len(x.tobytes()))))
-    df["the_geom"] = df["the_geom"].apply(lambda x: wkb.loads(x.tobytes()))
     return df
 
 
@@ -407,10 +432,10 @@ def region_shape(mode, country_key, geom_key):
         [[y0, x0], [y1, x1]] = json.loads(geom_key)
         shape = Polygon([(x0, y0), (x0, y1), (x1, y1), (x1, y0)])
     else:
-        config = CONFIG["countries"][country_key]
-        base_query = config["shapes"][int(mode)]["sql"]
-        response = subquery_unique(base_query, geom_key, "the_geom")
-        shape = wkb.loads(response.tobytes())
+        try:
+            shape = admin_geometries(country_key, mode).shape(geom_key)
+        except KeyError:
+            raise InvalidRequestError(f"invalid region {geom_key}")
     return shape
 
 
@@ -418,30 +443,82 @@ def region_label(country_key: str, mode: int, region_key: str):
     if mode == "pixel":
         label = None
     else:
-        config = CONFIG["countries"][country_key]
-        base_query = config["shapes"][int(mode)]["sql"]
-        label = subquery_unique(base_query, region_key, "label")
+        try:
+            label = admin_geometries(country_key, mode).label(region_key)
+        except KeyError:
+            raise InvalidRequestError(f"invalid region {region_key}")
     return label
 
 
-def subquery_unique(base_query, key, field):
-    query = sql.Composed(
-        [
-            sql.SQL(
-                "with a as (",
-            ),
-            sql.SQL(base_query),
-            sql.SQL(
-                ") select {} from a where key::text = %(key)s"
-            ).format(sql.Identifier(field)),
-        ]
-    )
-    with psycopg2.connect(**CONFIG["db"]) as conn:
-        df = pd.read_sql(query, conn, params={"key": key})
-    if len(df) == 0:
-        raise InvalidRequestError(f"invalid region {key}")
-    assert len(df) == 1
-    return df.iloc[0][field]
+class ForecastIndex:
+    """The positions of the forecasts of a dataset by issue month and
+    target date, so that they are selected with isel rather than by
+    computing and comparing cftime dates.
+
+    Dates are counted in days since year 0 of the 360-day calendar, so
+    that the target date of a forecast issued on day d with lead l
+    (months) is d + 30 * l.
+
+    Parameters
+    ----------
+    issue : xarray.DataArray
+        issue dates of the forecasts.
+    """
+
+    def __init__(self, issue):
+        self.issue = issue.values
+        months0 = issue.dt.month.values - 1
+        days = (
+            issue.dt.year.values * 360 + months0 * 30 + issue.dt.day.values - 1
+        )
+        self._positions = {
+            m: np.flatnonzero(months0 == m) for m in range(12)
+        }
+        self._by_issue = {
+            (int(m), float(d)): i for i, (m, d) in enumerate(zip(months0, days))
+        }
+        self._target_dates = {}
+
+    def positions(self, issue_month0):
+        """Positions of the forecasts issued in `issue_month0`."""
+        return self._positions[issue_month0]
+
+    def position(self, issue_month0, lead, target_day):
+        """Position of the forecast issued in `issue_month0` for
+        `target_day` with `lead`, or None."""
+        return self._by_issue.get((issue_month0, float(target_day - 30 * lead)))
+
+    def target_date(self, i, lead):
+        return self.issue[i] + datetime.timedelta(days=30 * lead)
+
+    def target_dates(self, issue_month0, lead):
+        """Target dates of the forecasts issued in `issue_month0`,
+        in the order of `positions`."""
+        key = (issue_month0, lead)
+        dates = self._target_dates.get(key)
+        if dates is None:
+            dates = np.array([
+                self.target_date(i, lead) for i in self.positions(issue_month0)
+            ], dtype=object)
+            self._target_dates[key] = dates
+        return dates
+
+
+# Indexes of forecast datasets. They are built again when the store is
+# opened again.
+FORECAST_INDEXES = pingrid.LRUCache(256)
+
+
+def forecast_index(cfg, da):
+    """The ForecastIndex of `da`, the shared DataArray of `cfg`."""
+    key = data_path(cfg.path)
+    da_index = FORECAST_INDEXES.get(key)
+    if da_index is not None and da_index[0] is da:
+        index = da_index[1]
+    else:
+        index = ForecastIndex(da["issue"])
+        FORECAST_INDEXES.put(key, (da, index))
+    return index
 
 
 def select_forecast(country_key, forecast_key, issue_month0, target_month0,
@@ -449,32 +526,28 @@ def select_forecast(country_key, forecast_key, issue_month0, target_month0,
     l = (target_month0 - issue_month0) % 12
 
     cfg = CONFIG["countries"][country_key]["datasets"]["forecasts"][forecast_key]
-    da = open_forecast_from_config(cfg)
-
-    issue_dates = da["issue"].where(da["issue"].dt.month == issue_month0 + 1, drop=True)
-    da = da.sel(issue=issue_dates)
-
-    # Now that we have only one issue month, each target date uniquely
-    # identifies a single forecast, so we can replace the issue date
-    # coordinate with a target_date coordinate.
-    l_delta = pd.Timedelta(l * 30, unit='days')
-    da = da.assign_coords(
-        target_date=("issue", (da["issue"] + l_delta).data)
-    ).swap_dims({"issue": "target_date"}).drop_vars("issue")
+    shared = shared_data_array(cfg)
+    index = forecast_index(cfg, shared)
+    da = scaled_data_array(shared, cfg, val_min=0.0, val_max=100.0)
+
+    if target_year is None:
+        # With only one issue month, each target date uniquely
+        # identifies a single forecast, so we can replace the issue
+        # date coordinate with a target_date coordinate.
+        da = da.isel(issue=index.positions(issue_month0)).assign_coords(
+            target_date=("issue", index.target_dates(issue_month0, l))
+        ).swap_dims({"issue": "target_date"}).drop_vars("issue")
+    else:
+        i = index.position(issue_month0, l, target_year * 360 + target_month0 * 30)
+        if i is None:
+            raise NotFoundError(f'No forecast for issue_month0 {issue_month0} in year {target_year}')
+        da = da.isel(issue=i, drop=True).assign_coords(
+            target_date=index.target_date(i, l)
+        )
 
     if "lead" in da.coords:
         da = da.sel(lead=l)
 
-    if target_year is not None:
-        target_date = (
-            cftime.Datetime360Day(target_year, 1, 1) +
-            pd.Timedelta(target_month0 * 30, unit='days')
-        )
-        try:
-            da = da.sel(target_date=target_date)
-        except KeyError:
-            raise NotFoundError(f'No forecast for issue_month0 {issue_month0} in year {target_year}') from None
-
     if freq is not None:
         if cfg.is_poe:
             # Forecasts are always expressed as the probability of a
@@ -495,10 +568,32 @@ def select_forecast(country_key, forecast_key, issue_month0, target_month0,
 
 
 
+# Positions along time of the observations of a target month, by
+# dataset. They are computed again when the store is opened again.
+OBS_POSITIONS = pingrid.LRUCache(1024)
+
+
+def obs_positions(cfg, da, target_month0):
+    """Positions along time of the values of `da`, the shared DataArray
+    of `cfg`, for `target_month0`."""
+    key = (data_path(cfg.path), target_month0)
+    da_positions = OBS_POSITIONS.get(key)
+    if da_positions is not None and da_positions[0] is da:
+        positions = da_positions[1]
+    else:
+        time = da["time"]
+        positions = np.flatnonzero(
+            (time.dt.month.values == int(target_month0) + 1) &
+            (time.dt.day.values == (target_month0 % 1) * 30 + 1)
+        )
+        OBS_POSITIONS.put(key, (da, positions))
+    return positions
+
+
 def select_obs(country_key, obs_keys, target_month0, target_year=None):
     ds = xr.Dataset(
         data_vars={
-            obs_key: open_obs(country_key, obs_key)
+            obs_key: open_obs(country_key, obs_key, target_month0)
             for obs_key in obs_keys
         }
     )
@@ -512,17 +607,6 @@ def select_obs(country_key, obs_keys, target_month0, target_year=None):
         except KeyError:
             raise NotFoundError(f'No value for {" ".join(obs_keys)} on {target_date}') from None
 
-    target_month = int(target_month0) + 1
-    target_day = (target_month0 % 1) * 30 + 1
-    with warnings.catch_warnings():
-        # ds.where in xarray 2022.3.0 uses deprecated numpy
-        # functionality. A recent change deletes the offending line;
-        # see if this catch_warnings can be removed once that's
-        # released.
-        # https://github.com/pydata/xarray/commit/3a320724100ab05531d8d18ca8cb279a8e4f5c7f
-        warnings.filterwarnings("ignore", category=DeprecationWarning, module='numpy.core.fromnumeric')
-        ds = ds.where(lambda x: (x["time"].dt.month == target_month) & (x["time"].dt.day == target_day), drop=True)
-
     return ds
 
 
@@ -1263,23 +1347,29 @@ def _(year, pathname, mode):
 
 @APP.callback(
     Output("borders", "data"),
+    Output("borders_zoom_band", "data"),
     Input("location", "pathname"),
     Input("mode", "value"),
+    Input("map", "zoom"),
+    State("borders_zoom_band", "data"),
 )
-def borders(pathname, mode):
+def borders(pathname, mode, zoom, current_band):
+    # Borders are simplified to what is visible at the zoom level, and
+    # only sent again when the zoom level leaves its band.
+    band = None if zoom is None else pingrid.zoom_band(zoom)
+    triggers = [t["prop_id"] for t in dash.callback_context.triggered]
+    if triggers == ["map.zoom"] and band == current_band:
+        raise PreventUpdate
     if mode == "pixel":
         shapes = []
+    elif band is None:
+        shapes = admin_geometries(country(pathname), mode).geojson()["features"]
     else:
-        country_key = country(pathname)
-        # TODO We don't actually need vuln data, just reusing an existing
-        # query function as an expediency. Year is arbitrary. Optimize
-        # later.
-        shapes = (
-            retrieve_vulnerability(country_key, mode, 2020)
-            ["the_geom"]
-            .apply(shapely.geometry.mapping)
-        )
-    return {"features": shapes}
+        tolerance = pingrid.simplify_tolerance(band)
+        shapes = admin_geometries(country(pathname), mode).geojson(
+            tolerance, pingrid.tolerance_digits(tolerance)
+        )["features"]
+    return {"features": shapes}, band
 
 
 APP.clientside_callback(
@@ -1445,7 +1535,7 @@ def validate_csv(country, contents):
                 sql.SQL(")")
 
             ])
-            with psycopg2.connect(**CONFIG["db"]) as conn:
+            with DB_POOL.connection() as conn:
                 with conn.cursor() as cursor:
                     # print(query.as_string(cursor))
                     cursor.execute(query, list(regions))
@@ -1470,9 +1560,20 @@ def validate_csv(country, contents):
 # Endpoints
 
 
+def forecast_version(country_key, forecast_key, **kwargs):
+    cfg = CONFIG["countries"][country_key]["datasets"]["forecasts"][forecast_key]
+    return pingrid.path_version(data_path(cfg.path))
+
+
+def obs_version(country_key, obs_key, **kwargs):
+    cfg = CONFIG["countries"][country_key]["datasets"]["observations"][obs_key]
+    return pingrid.path_version(data_path(cfg.path))
+
+
 @SERVER.route(
     f"{TILE_PFX}/forecast/<forecast_key>/<int:tz>/<int:tx>/<int:ty>/<country_key>/<season_id>/<int:target_year>/<int:issue_month0>/<int:freq>"
 )
+@pingrid.cache_tile(TILE_CACHE, forecast_version)
 def forecast_tile(forecast_key, tz, tx, ty, country_key, season_id, target_year, issue_month0, freq):
     config = CONFIG["countries"][country_key]
     season_config = config["seasons"][season_id]
@@ -1491,6 +1592,7 @@ def forecast_tile(forecast_key, tz, tx, ty, country_key, season_id, target_year,
 @SERVER.route(
     f"{TILE_PFX}/obs/<obs_key>/<int:tz>/<int:tx>/<int:ty>/<country_key>/<season_id>/<int:target_year>"
 )
+@pingrid.cache_tile(TILE_CACHE, obs_version)
 def obs_tile(obs_key, tz, tx, ty, country_key, season_id, target_year):
     season_config = CONFIG["countries"][country_key]["seasons"][season_id]
     target_month0 = season_config["target_month"]
@@ -1504,40 +1606,75 @@ def obs_tile(obs_key, tz, tx, ty, country_key, season_id, target_year):
 @SERVER.route(
     f"{TILE_PFX}/vuln/<int:tz>/<int:tx>/<int:ty>/<country_key>/<mode>/<int:year>"
 )
+# Vulnerability comes from the database, which has no cheap version
+# stamp, so these tiles only expire through the cache's max_age.
+@pingrid.cache_tile(TILE_CACHE)
 def vuln_tiles(tz, tx, ty, country_key, mode, year):
-    im = produce_bkg_tile(Color(0, 0, 0, 0))
-    if mode != "pixel":
+    if mode == "pixel":
+        im = produce_bkg_tile(Color(0, 0, 0, 0))
+    else:
+        gs = admin_geometries(country_key, mode)
+        colors = vuln_colors(country_key, mode, year, gs)
+        im = pingrid.produce_choropleth_tile(gs, colors, tx, ty, tz)
+    return pingrid.image_resp(im)
+
+
+def border_geometries(country_key, mode):
+    config = CONFIG["countries"].get(country_key)
+    if config is None or not 0 <= mode < len(config["shapes"]):
+        raise NotFoundError(f"no shapes for {country_key} level {mode}")
+    return admin_geometries(country_key, mode)
+
+
+# Admin boundaries as vector tiles, for clients that can draw them.
+pingrid.add_mvt_route(
+    SERVER,
+    f"{TILE_PFX}/borders/<int:tz>/<int:tx>/<int:ty>/<country_key>/<int:mode>",
+    border_geometries,
+    TILE_CACHE,
+)
+
+
+# Colors of the regions of an admin level for a year of vulnerability,
+# in the order of the geometry store. They are computed again when the
+# geometries are reloaded, and like the vulnerability tiles expire after
+# the tile cache's max_age so that new values in the database show up.
+VULN_COLORS = pingrid.LRUCache(256)
+
+
+def vuln_colors(country_key, mode, year, gs):
+    """The BGRA color of each region, preceded by the transparent
+    background, as expected by pingrid.produce_choropleth_tile."""
+    key = (country_key, int(mode), year)
+    gs_colors = VULN_COLORS.get(key)
+    if (
+        gs_colors is not None
+        and gs_colors[0] is gs
+        and (
+            TILE_CACHE.max_age is None
+            or time.time() - gs_colors[2] < TILE_CACHE.max_age
+        )
+    ):
+        colors = gs_colors[1]
+    else:
         df = retrieve_vulnerability(country_key, mode, year)
         cfg = CONFIG["countries"][country_key]["datasets"]["vuln"]
         scale_min, scale_max = cfg["range"]
-        shapes = [
-            (
-                r["the_geom"],
-                pingrid.impl.DrawAttrs(
-                    Color(255, 0, 0, 255),
-                    pingrid.impl.with_alpha(
-                        CMAPS[cfg["colormap"]].to_rgba_array()[
-                            min(
-                                255,
-                                int(
-                                    (r["normalized"] - scale_min)
-                                    * 255
-                                    / (scale_max - scale_min)
-                                ),
-                            )
-                        ],
-                        255,
-                    )
-                    if r["normalized"] is not None and not np.isnan(r["normalized"])
-                    else Color(0, 0, 0, 0),
-                    1,
-                    cv2.LINE_AA,
-                ),
-            )
-            for _, r in df.iterrows()
-        ]
-        im = pingrid.impl.produce_shape_tile(im, shapes, tx, ty, tz, oper="intersection")
-    return pingrid.image_resp(im)
+        lut = CMAPS[cfg["colormap"]].to_rgba_array()
+        colors = np.zeros((len(gs) + 1, 4), np.uint8)
+        for _, r in df.iterrows():
+            if r["normalized"] is None or np.isnan(r["normalized"]):
+                continue
+            c = lut[
+                min(
+                    255,
+                    int((r["normalized"] - scale_min) * 255 / (scale_max - scale_min)),
+                )
+            ]
+            colors[gs.position(r["key"]) + 1] = [c[2], c[1], c[0], 255]
+        colors.flags.writeable = False
+        VULN_COLORS.put(key, (gs, colors, time.time()))
+    return colors
 
 
 def produce_bkg_tile(
@@ -1568,10 +1705,23 @@ def stats():
         version=about.version,
         timestamp=datetime.datetime.now(datetime.timezone.utc).isoformat(),
         process_stats=ps,
+        tile_cache=TILE_CACHE.stats(),
+        mask_cache=pingrid.impl.MASK_CACHE.stats(),
+        weight_cache=pingrid.impl.WEIGHT_CACHE.stats(),
+        db_pool=DB_POOL.stats(),
+        geometries=GEOMETRIES.stats(),
+        datasets=DATASETS.stats(),
+        label_cache=pingrid.impl.LABEL_CACHE.stats(),
     )
     return yaml_resp(rs)
 
 
+@SERVER.route(f"{ADMIN_PFX}/reload_geometries", methods=["POST"])
+def reload_geometries():
+    GEOMETRIES.reload()
+    return yaml_resp(GEOMETRIES.stats())
+
+
 # Do not imitate this. Use JSON responses, not YAML.
 def yaml_resp(data):
     s = yaml.dump(data, default_flow_style=False, width=120, allow_unicode=True)
@@ -1622,19 +1772,16 @@ def trigger_check():
         geom_key = region
     shape = region_shape(mode, country_key, geom_key)
 
-    if var_is_forecast:
-        data = select_forecast(country_key, var, issue_month0,
-                               target_month0, season_year, freq)
-    else:
-        data = select_obs(
-            country_key, [var], target_month0, season_year
-        )[var]
+    data = select_season_value(
+        country_key, var, var_is_forecast, issue_month0, target_month0,
+        season_year, freq,
+    )
     if 'lon' in data.coords:
         data = pingrid.average_over(data, shape, all_touched=True)
 
 
 
-    value = data.item()
+    value = data.values.item()
     if lower_is_worse:
         triggered = bool(value <= thresh)
     else:
@@ -1647,6 +1794,76 @@ def trigger_check():
     return response
 
 
+@SERVER.route(f"{PFX}/region_values")
+def region_values():
+    """Values of a variable for one season, for all the regions of an
+    admin level."""
+    var = parse_arg("variable")
+    country_key = parse_arg("country_key")
+    mode = parse_arg("mode", int)
+    season = parse_arg("season")
+    issue_month0 = parse_arg("issue_month", int)
+    season_year = parse_arg("season_year", int)
+    freq = parse_arg("freq", float)
+
+    config = CONFIG["countries"][country_key]
+    if var in config["datasets"]["forecasts"]:
+        var_is_forecast = True
+    elif var in config["datasets"]["observations"]:
+        var_is_forecast = False
+    else:
+        raise InvalidRequestError(f"Unknown variable {var}")
+    target_month0 = config["seasons"][season]["target_month"]
+
+    data = select_season_value(
+        country_key, var, var_is_forecast, issue_month0, target_month0,
+        season_year, freq,
+    )
+    gs = admin_geometries(country_key, mode)
+    if 'lon' in data.coords:
+        values = pingrid.average_over_regions(
+            data, dict(zip(gs.keys, gs.geoms)), all_touched=True
+        ).values
+    else:
+        # data has no spatial dimension; it's the same for all regions
+        values = np.full(len(gs), data.values.item())
+    return {
+        "regions": [
+            {
+                "key": key,
+                "label": label,
+                "value": None if np.isnan(value) else float(value),
+            }
+            for key, label, value in zip(gs.keys, gs.labels, values)
+        ]
+    }
+
+
+def select_season_value(country_key, var, var_is_forecast, issue_month0,
+                        target_month0, season_year, freq):
+    if var_is_forecast:
+        data = select_forecast(country_key, var, issue_month0,
+                               target_month0, season_year, freq)
+    else:
+        data = select_obs(
+            country_key, [var], target_month0, season_year
+        )[var]
+    return data
+
+
+def retrieve_shapes(country_key: str, mode: int) -> pd.DataFrame:
+    config = CONFIG["countries"][country_key]
+    query = sql.Composed([
+        sql.SQL("with a as ("),
+        sql.SQL(config["shapes"][mode]["sql"]),
+        sql.SQL(") select key::text as key, label, the_geom from a"),
+    ])
+    with DB_POOL.connection() as conn:
+        df = pd.read_sql(query, conn)
+    df["the_geom"] = df["the_geom"].apply(lambda x: wkb.loads(x.tobytes()))
+    return df
+
+
 @SERVER.route(f"{PFX}/<country_key>/export")
 def export_endpoint(country_key):
     mode = parse_arg("mode", int) # not supporting pixel mode for now
@@ -1748,7 +1965,7 @@ def regions_endpoint():
         sql.SQL(shapes_config["sql"]),
         sql.SQL(") select key, label from a"),
     ])
-    with psycopg2.connect(**CONFIG["db"]) as conn:
+    with DB_POOL.connection() as conn:
         df = pd.read_sql(query, conn)
     d = {'regions': df.to_dict(orient="records")}
     return flask.jsonify(d)
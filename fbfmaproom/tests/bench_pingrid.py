@@ -0,0 +1,236 @@
+"""Benchmarks of pingrid's tile compositing and spatial averaging.
+
+Not collected by pytest; run with
+
+    PYTHONPATH=. python tests/bench_pingrid.py
+
+Compares apply_mask with the previous implementation, which
+composited every pixel of the tile in float64, on masks typical of a
+clipped data tile and of a vulnerability tile with many polygons.
+
+Compares average_over with the previous implementation, which dropped
+the NaNs of the whole dataset before trimming it to the shape, on a
+synthetic forecast cube stored in zarr.
+
+Compares GeometrySet.containing with the previous linear scan over
+bounding boxes, on a grid of admin-2-like regions.
+
+Compares the size of the borders GeoJSON at full resolution and
+simplified for a few zoom bands, on detailed regions.
+
+Compares drawing a vulnerability tile shape by shape, as vuln_tiles
+did, with a choropleth drawn from a label raster, uncached and cached.
+"""
+import json
+import os
+import tempfile
+import timeit
+import tracemalloc
+
+import cv2
+import numpy as np
+import pandas as pd
+import shapely.geometry
+import xarray as xr
+
+from pingrid.impl import (
+    LABEL_CACHE, Color, DrawAttrs, GeometrySet, apply_mask, average_over,
+    flatten, produce_choropleth_tile, produce_shape_tile, shape_key,
+    shape_mask, shape_weights, simplify_tolerance, tolerance_digits,
+    trim_to_bbox,
+)
+
+
+def apply_mask_float(im, mask, mask_color=Color(0, 0, 0, 0)):
+    """apply_mask as it was before the integer fast path."""
+    mask = mask.reshape(mask.shape + (1,)).astype(np.float64) / 255
+    mask_color = np.array(
+        [mask_color.blue, mask_color.green, mask_color.red, mask_color.alpha],
+        np.float64
+    ).reshape((1, 1, 4))
+    im_fg = mask_color * mask
+    im_bg = im * (1.0 - mask)
+    return flatten(im_fg, im_bg)
+
+
+def average_over_drop(ds, s, lon_name="lon", lat_name="lat"):
+    """average_over as it was before trimming to the bbox first."""
+    ds = ds.where(ds.notnull(), drop=True)
+    ds = trim_to_bbox(ds, s, lon_name=lon_name, lat_name=lat_name)
+    lats = ds[lat_name].values
+    lons = ds[lon_name].values
+    r = xr.DataArray(
+        shape_weights(s, shape_key(s), lats, lons, False),
+        coords={lat_name: lats, lon_name: lons},
+        dims=[lat_name, lon_name],
+    )
+    return ds.weighted(r).mean([lat_name, lon_name])
+
+
+def containing_scan(gs, x, y):
+    """GeometrySet.containing as a scan, as geometry_containing_point
+    was before the spatial index."""
+    p = shapely.geometry.Point(x, y)
+    for i, g in enumerate(gs.geoms):
+        minx, miny, maxx, maxy = g.bounds
+        if minx <= x <= maxx and miny <= y <= maxy and g.contains(p):
+            return i
+    return None
+
+
+def regions(n):
+    """An n by n grid of irregular polygons covering 10 by 10 degrees."""
+    step = 10 / n
+    geoms = [
+        shapely.geometry.Point((i + 0.5) * step, (j + 0.5) * step)
+        .buffer(step * 0.7, 16)
+        .intersection(shapely.geometry.box(i * step, j * step, (i + 1) * step, (j + 1) * step))
+        for i in range(n) for j in range(n)
+    ]
+    return GeometrySet(pd.DataFrame({
+        "key": range(len(geoms)), "label": range(len(geoms)), "the_geom": geoms,
+    }))
+
+
+def detailed_regions(n, vertices=2000, seed=0):
+    """n by n wiggly polygons over 10 by 10 degrees, as detailed as
+    admin-2 boundaries digitized at about 50 m."""
+    rng = np.random.default_rng(seed)
+    step = 10 / n
+    theta = np.linspace(0, 2 * np.pi, vertices, endpoint=False)
+    geoms = []
+    for i in range(n):
+        for j in range(n):
+            r = step / 2 * (1 + 0.1 * np.cumsum(rng.normal(0, 0.05, vertices)))
+            r -= np.linspace(0, r[-1] - r[0], vertices)
+            geoms.append(shapely.geometry.Polygon(np.column_stack([
+                (i + 0.5) * step + r * np.cos(theta),
+                (j + 0.5) * step + r * np.sin(theta),
+            ])).buffer(0))
+    return GeometrySet(pd.DataFrame({
+        "key": range(len(geoms)), "label": range(len(geoms)), "the_geom": geoms,
+    }))
+
+
+def polygons(n, seed=0):
+    """`n` small polygons scattered over tile (2, 1, 2)."""
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform([5, 5], [85, 60], (n, 2))
+    return [shapely.geometry.Point(c).buffer(rng.uniform(2, 8)) for c in centers]
+
+
+def forecast_cube(path):
+    """A zarr store of 40 years of 9 percentiles on a 0.1 degree grid of
+    Ethiopia, NaN outside a circle.
+    """
+    lat = np.arange(3, 15, 0.1)
+    lon = np.arange(33, 48, 0.1)
+    rng = np.random.default_rng(0)
+    data = rng.random((40, 9, lat.size, lon.size), np.float32)
+    outside = np.hypot(*np.meshgrid(lat - 9, lon - 40.5, indexing="ij")) > 6
+    data[..., outside] = np.nan
+    xr.DataArray(
+        data,
+        coords={"issue": np.arange(40), "pct": np.arange(10, 100, 10),
+                "lat": lat, "lon": lon},
+        name="prob",
+    ).to_dataset().to_zarr(path, encoding={"prob": {"chunks": (1, 9, 120, 150)}})
+
+
+def measure(label, f, number=50):
+    seconds = min(timeit.repeat(f, number=number, repeat=3)) / number
+    tracemalloc.start()
+    f()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<40} {seconds * 1e3:8.3f} ms {peak / 2 ** 20:8.2f} MiB peak")
+
+
+def main():
+    rng = np.random.default_rng(0)
+    im = rng.integers(0, 256, (256, 256, 4), np.uint8)
+    color = Color(200, 100, 50, 255)
+
+    # A country outline crossing the tile: mostly 0 and 255, with an
+    # antialiased edge.
+    clip = shapely.geometry.Point(45, 30).buffer(30)
+    mask = shape_mask(clip, 2, 1, 2, oper="difference", line_type=cv2.LINE_AA)
+    print(f"clip mask: {np.mean((mask > 0) & (mask < 255)):.1%} edge pixels")
+    measure("clip, float64", lambda: apply_mask_float(im, mask, color))
+    measure("clip, integer fast path", lambda: apply_mask(im, mask, color))
+
+    # A vulnerability tile: one mask per admin polygon.
+    masks = [
+        shape_mask(p, 2, 1, 2, oper="intersection", line_type=cv2.LINE_AA)
+        for p in polygons(40)
+    ]
+    masks = [m for m in masks if m is not None]
+
+    def composite_float():
+        out = im
+        for m in masks:
+            out = apply_mask_float(out, m, color)
+        return out
+
+    def composite():
+        out = im.copy()
+        for m in masks:
+            apply_mask(out, m, color, out=out)
+        return out
+
+    measure(f"{len(masks)} polygons, float64", composite_float)
+    measure(f"{len(masks)} polygons, integer fast path", composite)
+
+    # A district of a forecast cube.
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cube.zarr")
+        forecast_cube(path)
+        ds = xr.open_zarr(path, chunks=None)
+        district = shapely.geometry.Point(38, 8).buffer(0.5)
+        measure("district, drop NaNs first",
+                lambda: average_over_drop(ds, district).compute(), number=2)
+        measure("district, trim first",
+                lambda: average_over(ds, district).compute(), number=2)
+
+    # A click on the map, among 900 regions.
+    gs = regions(30)
+    gs.containing(0, 0)  # build the index
+    measure("900 regions, scan", lambda: containing_scan(gs, 9.9, 9.9), number=200)
+    measure("900 regions, STRtree", lambda: gs.containing(9.9, 9.9), number=200)
+
+    # A vulnerability tile over 900 regions.
+    gs = regions(30)
+    rng = np.random.default_rng(0)
+    colors = np.concatenate([
+        np.zeros((1, 4), np.uint8),
+        rng.integers(0, 256, (len(gs), 4), np.uint8) | np.uint8(255),
+    ])
+    shapes = [
+        (g, DrawAttrs(Color(255, 0, 0), Color(*c[2::-1], 255), 1, cv2.LINE_AA))
+        for g, c in zip(gs.geoms, colors[1:])
+    ]
+    empty = np.zeros((256, 256, 4), np.uint8)
+    # Zoom 5 tile over the regions.
+    measure("900 regions, shape by shape",
+            lambda: produce_shape_tile(empty, shapes, 16, 15, 5), number=1)
+
+    def uncached():
+        LABEL_CACHE.clear()
+        return produce_choropleth_tile(gs, colors, 16, 15, 5)
+
+    measure("900 regions, label raster", uncached, number=5)
+    measure("900 regions, cached label raster",
+            lambda: produce_choropleth_tile(gs, colors, 16, 15, 5))
+
+    # Borders of 100 detailed regions.
+    gs = detailed_regions(10)
+    size = len(json.dumps(gs.geojson()))
+    print(f"{'borders, full resolution':<40} {size / 2 ** 20:8.2f} MiB")
+    for band in [4, 6, 8, 10]:
+        tolerance = simplify_tolerance(band)
+        size = len(json.dumps(gs.geojson(tolerance, tolerance_digits(tolerance))))
+        print(f"{f'borders, zoom band {band}':<40} {size / 2 ** 20:8.2f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -25,6 +25,19 @@ def test_year_label_straddle():
 def test_from_month_since_360Day():
     assert fbfmaproom.from_month_since_360Day(735.5) == DT360(2021, 4, 16)
 
+def test_ForecastIndex():
+    issue = xr.DataArray(
+        [DT360(2000, 2, 1), DT360(2000, 5, 1), DT360(2001, 2, 1)],
+        dims=["issue"],
+    )
+    index = fbfmaproom.ForecastIndex(issue)
+    assert list(index.positions(1)) == [0, 2]
+    assert list(index.positions(0)) == []
+    assert list(index.target_dates(1, 2.5)) == [DT360(2000, 4, 16), DT360(2001, 4, 16)]
+    assert index.position(1, 2.5, 2001 * 360 + 3.5 * 30) == 2
+    assert index.position(4, 1, 2000 * 360 + 5 * 30) == 1
+    assert index.position(4, 1, 2001 * 360 + 5 * 30) is None
+
 def test_table_cb():
     table = fbfmaproom.table_cb.__wrapped__(
         issue_month_abbrev = 'feb',
@@ -234,6 +247,24 @@ def test_trigger_check_region():
     assert np.isclose(d["value"], 9.333)
     assert d["triggered"] is False
 
+def test_region_values():
+    with fbfmaproom.SERVER.test_client() as client:
+        r = client.get(
+            "/fbfmaproom/region_values?country_key=ethiopia"
+            "&variable=pnep"
+            "&mode=1"
+            "&season=season1"
+            "&issue_month=1"
+            "&season_year=2021"
+            "&freq=15"
+        )
+    assert r.status_code == 200
+    regions = r.json["regions"]
+    assert len(regions) == 11
+    assert regions[0]["key"] == "ET0508"
+    assert regions[0]["label"] == "Afder"
+    assert all(isinstance(x["value"], float) for x in regions)
+
 def test_trigger_check_straddle():
     "Lead time spans Jan 1"
     with fbfmaproom.SERVER.test_client() as client:
@@ -1,11 +1,17 @@
 import cftime
 import contextlib
+import cv2
+import flask
 import io
 import numpy as np
 import os
+import pandas as pd
+import psycopg2
 import pytest
 import shapely
 import tempfile
+import threading
+import time
 import xarray as xr
 
 import pingrid
@@ -160,6 +166,67 @@ def test_average_over_nans():
     v = pingrid.average_over(da, shape, all_touched=True)
     assert np.isclose(v.item(), 1.5)
 
+def test_average_over_lazy():
+    da = xr.DataArray(
+        data=np.arange(3 * 4 * 4.).reshape(3, 4, 4),
+        coords={
+            'time': [0, 1, 2],
+            'lat': [0., 1., 2., 3.],
+            'lon': [0., 1., 2., 3.],
+        },
+        name='v',
+    ).chunk({'time': 1})
+    shape = shapely.geometry.box(-0.5, -0.5, 1.5, 1.5)
+    v = pingrid.average_over(da, shape)
+    assert v.chunks is not None
+    assert np.allclose(v, pingrid.average_over(da.compute(), shape))
+
+def test_average_over_uneven_dataset():
+    coarse = xr.DataArray(
+        data=[[1., 1.], [3., 3.]],
+        coords={'lat': [0., 2.], 'lon': [0., 2.]},
+        name='coarse',
+    )
+    fine = xr.DataArray(
+        data=np.full((3, 3), 5.),
+        coords={'lat': [0., 1., 2.], 'lon': [0.5, 1.5, 2.5]},
+        name='fine',
+    )
+    ds = xr.merge([coarse, fine], join='outer').chunk()
+    shape = shapely.geometry.box(-1, -1, 3, 3)
+    v = pingrid.average_over(ds, shape).compute()
+    assert np.isclose(v['coarse'].item(), 2, rtol=1e-3)
+    assert np.isclose(v['fine'].item(), 5)
+
+def test_average_over_regions():
+    da = xr.DataArray(
+        data=np.arange(2 * 4 * 6.).reshape(2, 4, 6),
+        coords={
+            'time': [0, 1],
+            'lat': [0., 1., 2., 3.],
+            'lon': [0., 1., 2., 3., 4., 5.],
+        },
+        name='v',
+    )
+    da[0, 1, 1] = np.nan
+    shapes = {
+        'west': shapely.geometry.box(-0.5, -0.5, 2.5, 3.5),
+        'east': shapely.geometry.box(2.5, -0.5, 5.5, 3.5),
+        'out': shapely.geometry.box(10, 10, 11, 11),
+    }
+    v = pingrid.average_over_regions(da, shapes)
+    assert v.dims == ('time', 'region')
+    assert list(v['region'].values) == ['west', 'east', 'out']
+    for key in ['west', 'east']:
+        expected = pingrid.average_over(da, shapes[key])
+        assert np.allclose(v.sel(region=key), expected)
+    assert np.isnan(v.sel(region='out')).all()
+
+    # Same keys, new geometries, e.g. after the geometries are reloaded.
+    moved = dict(shapes, west=shapely.geometry.box(-0.5, -0.5, 0.5, 3.5))
+    v = pingrid.average_over_regions(da, moved)
+    assert np.allclose(v.sel(region='west'), pingrid.average_over(da, moved['west']))
+
 def test_tile():
     cmap = pingrid.ColorScale(
         'foo',
@@ -292,3 +359,533 @@ def test_ColorScale_to_dash_leaflet():
     assert np.shape(colorbar) == (256,)
     assert colorbar[100] == "#c8c8ffff"
 
+
+def test_LRUCache_evicts_least_recently_used():
+    cache = pingrid.LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 3
+    assert stats["misses"] == 1
+
+def test_TileCache_disk():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = pingrid.TileCache(memory_max_bytes=0, disk_path=tmpdir)
+        assert cache.get("abcd") is None
+        cache.put("abcd", b"tile")
+        assert cache.get("abcd") == b"tile"
+        # shared with another process
+        assert pingrid.TileCache(disk_path=tmpdir).get("abcd") == b"tile"
+        cache.clear()
+        assert cache.get("abcd") is None
+
+def test_TileCache_disk_trim():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = pingrid.TileCache(
+            memory_max_bytes=0, disk_path=tmpdir, disk_max_bytes=100
+        )
+        for i in range(10):
+            cache.put(f"{i:04}", bytes(20))
+        assert cache.stats()["disk"]["size"] <= 100
+        assert cache.get("0009") == bytes(20)
+        assert cache.get("0000") is None
+
+def test_TileCache_max_age():
+    cache = pingrid.TileCache(max_age=-1)
+    cache.put("abcd", b"tile")
+    assert cache.get("abcd") is None
+
+def test_tile_pixel_edges():
+    x, y = pingrid.tile_pixel_edges(1, 0, 1, 4, 2)
+    assert np.allclose(x, [0, 45, 90, 135, 180])
+    assert np.allclose(y, [pingrid.tile_top_mercator(0, 1), 66.51326, 0])
+    assert not y.flags.writeable
+
+def test_tile_pixel_centers():
+    x, y = pingrid.tile_pixel_centers(0, 1, 1, 2, 2)
+    assert np.allclose(x, [-135, -45])
+    top = pingrid.tile_top_mercator(1.5, 1)
+    assert np.allclose(y, [top / 2, (top + pingrid.tile_top_mercator(2, 1)) / 2])
+
+def test_choose_overview_factor():
+    assert pingrid.impl.choose_overview_factor(0.0375, 0.01) == 1
+    assert pingrid.impl.choose_overview_factor(0.0375, 0.1) == 2
+    assert pingrid.impl.choose_overview_factor(0.0375, 0.3) == 8
+    assert pingrid.impl.choose_overview_factor(0.0375, 100) == 64
+
+# zarr 3 warns about consolidated metadata, which xarray writes by default
+@pytest.mark.filterwarnings("ignore:Consolidated metadata:UserWarning")
+def test_overviews():
+    ds = xr.Dataset(
+        {"v": (("T", "Y", "X"), np.arange(2 * 40 * 48.).reshape(2, 40, 48))},
+        coords={"T": [0, 1], "Y": np.arange(40) * 0.5, "X": np.arange(48) * 0.5},
+    ).chunk({"T": 1})
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "ds.zarr")
+        ds.to_zarr(path)
+        pingrid.build_overviews(path, factors=(2, 4))
+        assert pingrid.impl.overview_factors(path) == [2, 4]
+        assert pingrid.open_overview(path, 0.1).sizes["X"] == 48
+        for resolution, size in [(1, 24), (2, 12), (4, 6)]:
+            overview = pingrid.open_overview(path, resolution)
+            assert overview.sizes["X"] == size
+            expected = pingrid.decimate_to(ds, resolution)
+            assert (overview["v"] == expected["v"]).all()
+
+        # Overviews of values rewritten in place are out of date.
+        (ds + 1).to_zarr(path, mode="r+")
+        os.utime(os.path.join(path, "v"), ns=(2 ** 62, 2 ** 62))
+        assert not pingrid.impl.overviews_are_current(path)
+        overview = pingrid.open_overview(path, 1)
+        assert (overview["v"] == pingrid.decimate_to(ds + 1, 1)["v"]).all()
+        pingrid.build_overviews(path, factors=(2, 4))
+        assert pingrid.impl.overviews_are_current(path)
+
+def test_shape_mask_cache_is_bounded_outside_the_shape(monkeypatch):
+    cache = pingrid.LRUCache(
+        100 * pingrid.impl.MASK_ENTRY_BYTES, sizeof=pingrid.impl._mask_size
+    )
+    monkeypatch.setattr(pingrid.impl, "MASK_CACHE", cache)
+    shape = shapely.geometry.box(0, 0, 1, 1)
+    for tx in range(40):
+        for ty in range(10):
+            # All outside the shape, or all inside its difference.
+            assert pingrid.impl.shape_mask(shape, tx, ty, 9) is None
+            mask = pingrid.impl.shape_mask(shape, tx, ty, 9, oper="difference")
+            assert mask is pingrid.impl.full_mask(256, 256)
+    assert cache.stats()["entries"] == 100
+    assert cache.stats()["evictions"] == 700
+
+def test_shape_mask():
+    shape = shapely.geometry.box(-170, -80, 170, 80)
+    # tile fully inside the shape
+    assert pingrid.impl.shape_mask(shape, 1, 1, 2, oper="difference") is None
+    mask = pingrid.impl.shape_mask(shape, 1, 1, 2, oper="intersection")
+    assert (mask == 255).all()
+    # tile straddling the edge of the shape
+    mask = pingrid.impl.shape_mask(shape, 0, 1, 2, oper="intersection")
+    assert mask[:, 0].max() == 0 and mask[:, -1].min() == 255
+    assert not mask.flags.writeable
+    # same geometry, different object
+    same = shapely.geometry.box(-170, -80, 170, 80)
+    assert pingrid.impl.shape_mask(same, 0, 1, 2, oper="intersection") is mask
+
+def test_apply_mask():
+    im = np.full((2, 2, 4), [10, 20, 30, 255], np.uint8)
+    mask = np.array([[0, 255], [128, 0]], np.uint8)
+    out = pingrid.impl.apply_mask(im, mask, pingrid.Color(0, 0, 200, 255))
+    assert (im == [10, 20, 30, 255]).all()
+    assert (out[0, 0] == [10, 20, 30, 255]).all()
+    assert (out[0, 1] == [200, 0, 0, 255]).all()
+    assert (out[1, 0] == [68, 3, 4, 191]).all()
+    pingrid.impl.apply_mask(im, mask, pingrid.Color(0, 0, 0, 0), out=im)
+    assert (im[0, 1] == 0).all()
+    assert (im[1, 1] == [10, 20, 30, 255]).all()
+
+def test_encode_palette_png():
+    im = np.zeros((3, 5, 4), np.uint8)
+    im[0] = [255, 0, 0, 255]
+    im[1] = [0, 255, 0, 128]
+    im[2, :2] = [1, 2, 3, 0]
+    data = pingrid.impl.encode_png(im, palette=True)
+    assert data[25] == 3  # color type: palette
+    decoded = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+    im[2, :2] = 0  # the color of transparent pixels is not preserved
+    assert (decoded == im).all()
+
+def test_encode_palette_png_too_many_colors():
+    im = np.zeros((20, 20, 4), np.uint8)
+    im[..., 0] = np.arange(400).reshape(20, 20) % 256
+    im[..., 1] = np.arange(400).reshape(20, 20) // 256
+    im[..., 3] = 255
+    assert pingrid.impl.encode_palette_png(im) is None
+    assert pingrid.impl.encode_png(im, palette=True)[25] == 6  # RGBA
+
+def test_image_resp_webp():
+    app = flask.Flask(__name__)
+    pingrid.configure_image_encoding(webp=True)
+    try:
+        with app.test_request_context(headers={"Accept": "image/webp,*/*"}):
+            resp = pingrid.image_resp(pingrid.empty_tile())
+            assert resp.mimetype == "image/webp"
+            assert "Accept" in resp.vary
+        with app.test_request_context(headers={"Accept": "*/*"}):
+            assert pingrid.image_resp(pingrid.empty_tile()).mimetype == "image/png"
+    finally:
+        pingrid.configure_image_encoding()
+
+def test_ColorScale_lut_memoized():
+    cs = pingrid.ColorScale(
+        "foo", [pingrid.Color(0, 0, 255), pingrid.Color(255, 0, 0)]
+    )
+    lut = cs.to_rgba_array()
+    assert not lut.flags.writeable
+    same = pingrid.ColorScale(
+        "bar", [pingrid.Color(0, 0, 255), pingrid.Color(255, 0, 0)]
+    )
+    assert same.to_rgba_array() is lut
+    assert cs.reversed().to_rgba_array() is not lut
+    assert cs.to_bgra_array() is cs.to_bgra_array()
+    assert cs.to_dash_leaflet() == cs.to_dash_leaflet()
+
+def test_cache_tile_conditional_get():
+    app = flask.Flask(__name__)
+    calls = []
+    cache = pingrid.TileCache(cache_control="public, max-age=60")
+
+    @app.route("/versioned/<int:tz>")
+    @pingrid.cache_tile(cache, lambda tz: "v1")
+    def versioned(tz):
+        calls.append(tz)
+        return pingrid.image_resp(pingrid.empty_tile())
+
+    @app.route("/unversioned/<int:tz>")
+    @pingrid.cache_tile(None)
+    def unversioned(tz):
+        calls.append(tz)
+        return pingrid.image_resp(pingrid.empty_tile())
+
+    client = app.test_client()
+    resp = client.get("/versioned/1")
+    assert resp.status_code == 200
+    assert resp.headers["Cache-Control"] == "public, max-age=60"
+    etag = resp.headers["ETag"]
+    resp = client.get("/versioned/1", headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+    assert resp.headers["ETag"] == etag
+    assert calls == [1]
+
+    resp = client.get("/unversioned/2")
+    etag = resp.headers["ETag"]
+    resp = client.get("/unversioned/2", headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+    assert resp.data == b""
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.commits = 0
+        self.rollbacks = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commits += 1
+        else:
+            self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+def test_ConnectionPool():
+    opened = []
+    def connect():
+        opened.append(FakeConnection())
+        return opened[-1]
+    pool = pingrid.ConnectionPool(connect, max_size=1, timeout=0.05)
+
+    with pool.connection() as conn:
+        assert conn is opened[0]
+        with pytest.raises(pingrid.PoolTimeout):
+            with pool.connection():
+                pass
+    with pool.connection() as conn:
+        assert conn is opened[0]
+    assert opened[0].commits == 2
+
+    # A connection that fails is replaced.
+    with pytest.raises(psycopg2.OperationalError):
+        with pool.connection() as conn:
+            raise psycopg2.OperationalError()
+    assert opened[0].closed
+    with pool.connection() as conn:
+        assert conn is opened[1]
+
+    # So is one that was closed while idle.
+    opened[1].close()
+    with pool.connection() as conn:
+        assert conn is opened[2]
+
+    stats = pool.stats()
+    assert stats['checkouts'] == 5
+    assert stats['created'] == 3
+    assert stats['discarded'] == 2
+    assert stats['timeouts'] == 1
+    assert stats['size'] == stats['idle'] == 1
+
+def test_GeometryStore():
+    loads = []
+    def load(source):
+        loads.append(source)
+        return pd.DataFrame({
+            'key': [1, 2],
+            'label': ['West', 'East'],
+            'the_geom': [shapely.geometry.box(0, 0, 1, 1), shapely.geometry.box(1, 0, 2, 1)],
+        })
+    store = pingrid.GeometryStore(load)
+    gs = store.get('adm1')
+    assert store.get('adm1') is gs
+    assert loads == ['adm1']
+
+    assert gs.label('2') == 'East'
+    assert gs.shape(1) is gs.geoms[0]
+    with pytest.raises(KeyError):
+        gs.shape(3)
+    assert gs.containing(1.5, 0.5) == 1
+    assert gs.containing(3, 3) is None
+
+    features = gs.geojson()['features']
+    assert [f['label'] for f in features] == ['West', 'East']
+    assert features[0]['type'] == 'MultiPolygon'
+    assert gs.simplified(0.1) is gs.simplified(0.1)
+
+    store.reload()
+    assert store.get('adm1') is not gs
+    assert loads == ['adm1', 'adm1']
+
+def test_GeometrySet_simplified_geojson():
+    circle = shapely.geometry.Point(0.123456789, 0).buffer(1, 256)
+    gs = pingrid.GeometrySet(pd.DataFrame({
+        'key': ['a'], 'label': ['A'], 'the_geom': [circle],
+    }))
+    assert pingrid.zoom_band(5) == pingrid.zoom_band(4) == 4
+    tolerance = pingrid.simplify_tolerance(4)
+    assert np.isclose(tolerance, 360 / 256 / 16 / 2)
+    ndigits = pingrid.tolerance_digits(tolerance)
+    assert ndigits == 3
+
+    full = gs.geojson()['features'][0]
+    simple = gs.geojson(tolerance, ndigits)['features'][0]
+    assert simple['label'] == 'A'
+    full_ring = full['coordinates'][0][0]
+    simple_ring = simple['coordinates'][0][0]
+    assert len(simple_ring) < len(full_ring) / 4
+    assert all(round(x, ndigits) == x for x, _ in simple_ring)
+    assert shapely.geometry.shape(simple).buffer(tolerance * 2).contains(circle)
+
+def test_GeometrySet_simplified_neighbours_share_borders():
+    rng = np.random.default_rng(0)
+    y = np.linspace(0, 1, 500)
+    x = 1 + np.cumsum(rng.normal(0, 0.005, y.size))
+    x -= np.linspace(0, x[-1] - 1, y.size)
+    border = list(zip(x, y))
+    west = shapely.geometry.Polygon([(0, 1), (0, 0)] + border)
+    east = shapely.geometry.Polygon([(2, 0), (2, 1)] + border[::-1])
+    gs = pingrid.GeometrySet(pd.DataFrame({
+        'key': ['w', 'e'], 'label': ['W', 'E'], 'the_geom': [west, east],
+    }))
+    tolerance = pingrid.simplify_tolerance(6)
+    simple_west, simple_east = gs.simplified(tolerance)
+
+    assert len(simple_west.exterior.coords) < len(west.exterior.coords) / 4
+    assert simple_west.intersection(simple_east).area == 0
+    assert np.isclose(simple_west.union(simple_east).area, 2)
+    assert simple_west.hausdorff_distance(west) <= tolerance
+
+def test_GeometrySet_simplified_once_per_tolerance():
+    gs = pingrid.GeometrySet(pd.DataFrame({
+        'key': ['a'], 'label': ['A'],
+        'the_geom': [shapely.geometry.Point(0, 0).buffer(1, 256)],
+    }))
+    assert gs.simplified(pingrid.simplify_tolerance(25)) is gs.geoms
+
+    calls = []
+    simplify_shared = gs._simplify_shared
+    def slow_simplify_shared(tolerance):
+        calls.append(tolerance)
+        time.sleep(0.1)
+        return simplify_shared(tolerance)
+    gs._simplify_shared = slow_simplify_shared
+    tolerance = pingrid.simplify_tolerance(4)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(gs.simplified(tolerance)))
+        for _ in range(4)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert calls == [tolerance]
+    assert all(r is results[0] for r in results)
+
+def test_produce_choropleth_tile():
+    west = shapely.geometry.box(10, -40, 45, 40).difference(
+        shapely.geometry.box(20, -10, 30, 10)
+    )
+    east = shapely.geometry.box(45, -40, 80, 40)
+    gs = pingrid.GeometrySet(pd.DataFrame({
+        'key': ['w', 'e'], 'label': ['W', 'E'], 'the_geom': [west, east],
+    }))
+    colors = np.array(
+        [[0, 0, 0, 0], [255, 0, 0, 255], [0, 0, 255, 255]], np.uint8
+    )
+    im = pingrid.produce_choropleth_tile(gs, colors, 2, 1, 2)
+    assert im.shape == (256, 256, 4)
+
+    # Compare with drawing each shape in turn, away from the edges.
+    expected = np.zeros((256, 256, 4), np.uint8)
+    for s, c in [(west, pingrid.Color(0, 0, 255)), (east, pingrid.Color(255, 0, 0))]:
+        mask = pingrid.impl.shape_mask(s, 2, 1, 2, line_type=cv2.LINE_8)
+        pingrid.impl.apply_mask(expected, mask, c, out=expected)
+    labels = pingrid.impl.label_tile(gs, 2, 1, 2)
+    assert set(np.unique(labels)) == {0, 1, 2}
+    edges = cv2.dilate(
+        cv2.Canny(labels.astype(np.uint8) * 100, 1, 1), np.ones((3, 3), np.uint8)
+    ) > 0
+    assert (im[~edges] == expected[~edges]).all()
+
+    outlined = pingrid.produce_choropleth_tile(
+        gs, colors, 2, 1, 2,
+        outline=pingrid.impl.DrawAttrs(pingrid.Color(0, 0, 0), None, 1, cv2.LINE_AA),
+    )
+    changed = (outlined != im).any(axis=-1)
+    near_edges = cv2.dilate(edges.astype(np.uint8), np.ones((3, 3), np.uint8)) > 0
+    assert changed.any() and (changed <= near_edges).all()
+
+def decode_pb(data):
+    '''(field, value) pairs of a protobuf message: ints for varints,
+    bytes for length-delimited fields.'''
+    def varint(i):
+        n, shift = 0, 0
+        while True:
+            b = data[i]
+            n |= (b & 0x7f) << shift
+            shift += 7
+            i += 1
+            if b < 0x80:
+                return n, i
+    fields = []
+    i = 0
+    while i < len(data):
+        tag, i = varint(i)
+        if tag & 7 == 0:
+            n, i = varint(i)
+            fields.append((tag >> 3, n))
+        else:
+            size, i = varint(i)
+            fields.append((tag >> 3, data[i:i + size]))
+            i += size
+    return fields
+
+def decode_varints(data):
+    ns, n, shift = [], 0, 0
+    for b in data:
+        n |= (b & 0x7f) << shift
+        shift += 7
+        if b < 0x80:
+            ns.append(n)
+            n, shift = 0, 0
+    return ns
+
+def test_encode_mvt_tile():
+    square = shapely.geometry.box(10, 10, 30, 30).difference(
+        shapely.geometry.box(15, 15, 20, 20)
+    )
+    far = shapely.geometry.box(-80, -40, -70, -30)
+    gs = pingrid.GeometrySet(pd.DataFrame({
+        'key': [7, 8], 'label': ['Square', 'Far'], 'the_geom': [square, far],
+    }))
+    data = pingrid.encode_mvt_tile(gs, 1, 0, 1)
+    [(field, layer)] = decode_pb(data)
+    assert field == 3
+    fields = dict(decode_pb(layer))
+    features = [v for f, v in decode_pb(layer) if f == 2]
+    assert fields[15] == 2 and fields[1] == b'admin' and fields[5] == 4096
+    assert len(features) == 1
+    feature = dict(decode_pb(features[0]))
+    assert feature[1] == 1
+    assert feature[3] == 3
+    assert decode_varints(feature[2]) == [0, 0, 1, 1]
+
+    # MoveTo, LineTo 3, ClosePath, for the exterior and the hole.
+    geometry = decode_varints(feature[4])
+    commands = []
+    rings = []
+    x, y = 0, 0
+    i = 0
+    while i < len(geometry):
+        c, count = geometry[i] & 7, geometry[i] >> 3
+        commands.append((c, count))
+        i += 1
+        if c == 1:
+            rings.append([])
+        for _ in range(count if c != 7 else 0):
+            dx, dy = [(n >> 1) ^ -(n & 1) for n in geometry[i:i + 2]]
+            x, y = x + dx, y + dy
+            rings[-1].append((x, y))
+            i += 2
+    assert commands == [(1, 1), (2, 3), (7, 1)] * 2
+    # Exterior rings have positive area in tile coordinates, holes
+    # negative.
+    areas = [
+        sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(r, r[1:] + r[:1]))
+        for r in rings
+    ]
+    assert areas[0] > 0 > areas[1]
+    xs = [x for x, _ in rings[0]]
+    assert min(xs) == round(10 / 180 * 4096) and max(xs) == round(30 / 180 * 4096)
+
+def test_add_mvt_route():
+    gs = pingrid.GeometrySet(pd.DataFrame({
+        'key': ['a'], 'label': ['A'], 'the_geom': [shapely.geometry.box(10, 10, 30, 30)],
+    }))
+    app = flask.Flask(__name__)
+    pingrid.add_mvt_route(
+        app, '/adm/<int:level>/<int:tz>/<int:tx>/<int:ty>', lambda level: gs,
+        pingrid.TileCache(memory_max_bytes=2 ** 20),
+    )
+    client = app.test_client()
+    resp = client.get('/adm/0/1/1/0')
+    assert resp.status_code == 200
+    assert resp.mimetype == 'application/vnd.mapbox-vector-tile'
+    assert resp.data == pingrid.encode_mvt_tile(gs, 1, 0, 1)
+    resp = client.get('/adm/0/1/1/0', headers={'If-None-Match': resp.headers['ETag']})
+    assert resp.status_code == 304
+
+@pytest.mark.filterwarnings("ignore:Consolidated metadata:UserWarning")
+def test_DatasetRegistry():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'data.zarr')
+        xr.Dataset({'v': ('x', [1, 2])}).to_zarr(path, consolidated=True)
+        assert pingrid.impl.has_consolidated_metadata(path)
+
+        registry = pingrid.DatasetRegistry()
+        opened = []
+        def open_fn():
+            opened.append(pingrid.open_zarr(path))
+            return opened[-1]
+        ds = registry.get('data', path, open_fn)
+        assert registry.get('data', path, open_fn) is ds
+        assert len(opened) == 1
+
+        # Rewriting the store reopens it.
+        xr.Dataset({'v': ('x', [1, 2, 3])}).to_zarr(path, mode='w', consolidated=False)
+        os.utime(path, ns=(0, 2 ** 62))
+        ds = registry.get('data', path, open_fn)
+        assert len(opened) == 2
+        assert ds['v'].size == 3
+        assert registry.stats() == {
+            'entries': 1, 'hits': 1, 'opens': 2, 'evictions': 0
+        }
+
+        # The least recently used dataset is forgotten first.
+        registry = pingrid.DatasetRegistry(max_entries=2)
+        for key in ['a', 'b', 'a', 'c']:
+            registry.get(key, path, open_fn)
+        assert registry.stats()['entries'] == 2
+        assert registry.stats()['evictions'] == 1
+        n = len(opened)
+        registry.get('a', path, open_fn)
+        assert len(opened) == n
+        registry.get('b', path, open_fn)
+        assert len(opened) == n + 1
@@ -19,6 +19,13 @@ import xarray as xr
 #-- then maybe some other things to beautify map tbd
 
 
+def data_path(scenario, model, variable):
+    return (
+        f'/Data/data24/ISIMIP3b/InputData/climate/atmosphere/bias-adjusted/global'
+        f'/monthly/{scenario}/{model}/zarr/{variable}'
+    )
+
+
 def read_data(scenario, model, variable, region, unit_convert=False):
     if region == "US-CA":
         xslice = slice(-154, -45)
@@ -33,8 +40,7 @@ def read_data(scenario, model, variable, region, unit_convert=False):
         xslice = slice(85, 115)
         yslice = slice(28, 2)
     data = xr.open_zarr(
-        f'/Data/data24/ISIMIP3b/InputData/climate/atmosphere/bias-adjusted/global'
-        f'/monthly/{scenario}/{model}/zarr/{variable}'
+        data_path(scenario, model, variable)
     )[variable].sel(X=xslice, Y=yslice)
     if unit_convert :
         data = unit_conversion(data)
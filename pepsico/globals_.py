@@ -16,6 +16,9 @@ for k, v in appconfig['maprooms'].items():
         GLOBAL_CONFIG['maprooms'][k] = pingrid.deep_merge(defaultconfig['maprooms'][k], v)
 
 
+TILE_CACHE = pingrid.TileCache(**GLOBAL_CONFIG["tile_cache"])
+pingrid.configure_image_encoding(**GLOBAL_CONFIG["tile_encoding"])
+
 FLASK = flask.Flask(
     "pepsicomaprooms",
     static_url_path=f'{GLOBAL_CONFIG["url_path_prefix"]}/static',
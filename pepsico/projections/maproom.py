@@ -9,12 +9,11 @@ import xarray as xr
 import pandas as pd
 from dateutil.relativedelta import *
 import dash_leaflet as dlf
-import psycopg2
 from psycopg2 import sql
 import shapely
 from shapely import wkb
 from shapely.geometry.multipolygon import MultiPolygon
-from globals_ import FLASK, GLOBAL_CONFIG
+from globals_ import FLASK, GLOBAL_CONFIG, TILE_CACHE
 import app_calc as ac
 import numpy as np
 
@@ -45,7 +44,7 @@ def register(FLASK, config):
     APP.layout = layout.app_layout()
 
     def adm_borders(shapes):
-        with psycopg2.connect(**GLOBAL_CONFIG["db"]) as conn:
+        with pingrid.db_pool(GLOBAL_CONFIG["db"]).connection() as conn:
             s = sql.Composed(
                 [
                     sql.SQL("with g as ("),
@@ -665,6 +664,15 @@ def register(FLASK, config):
         ], send_alarm
 
 
+    def tile_version(scenario, model, variable, **kwargs):
+        model = [model] if model != "Multi-Model-Average" else [
+            "GFDL-ESM4", "IPSL-CM6A-LR", "MPI-ESM1-2-HR","MRI-ESM2-0", "UKESM1-0-LL"
+        ]
+        return pingrid.path_version(*(
+            ac.data_path(s, m, variable)
+            for s in ("historical", scenario) for m in model
+        ))
+
     @FLASK.route(
         (
             f"{TILE_PFX}/<int:tz>/<int:tx>/<int:ty>/<region>/<scenario>/<model>/<variable>/"
@@ -673,6 +681,7 @@ def register(FLASK, config):
         ),
         endpoint=f"{config['core_path']}"
     )
+    @pingrid.cache_tile(TILE_CACHE, tile_version)
     def fcst_tiles(tz, tx, ty,
         region,
         scenario,
@@ -0,0 +1,34 @@
+"""Command line utilities.
+
+    python -m pingrid build-overviews PATH [PATH ...] [--factors 2 4 8]
+"""
+import argparse
+
+from .impl import OVERVIEW_FACTORS, build_overviews
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pingrid")
+    commands = parser.add_subparsers(dest="command", required=True)
+    overviews = commands.add_parser(
+        "build-overviews",
+        help="build the decimated overviews used to draw low zoom tiles",
+    )
+    overviews.add_argument("paths", nargs="+", metavar="PATH", help="zarr store")
+    overviews.add_argument(
+        "--factors", nargs="+", type=int, default=list(OVERVIEW_FACTORS),
+        help="decimation factors, each a multiple of the previous one",
+    )
+    overviews.add_argument(
+        "--dims", nargs=2, default=["X", "Y"], help="spatial dimensions",
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == "build-overviews":
+        for path in args.paths:
+            print(f"building overviews of {path}")
+            build_overviews(path, args.factors, tuple(args.dims))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,54 @@
 __all__ = [
     'boolean',
+    'cache_tile',
+    'choose_overview_factor',
     'CMAPS',
     'ClientSideError',
     'Color',
     'ColorScale',
     'InvalidRequestError',
     'NotFoundError',
+    'add_mvt_route',
     'average_over',
+    'average_over_regions',
+    'build_overviews',
     'client_side_error',
+    'configure_image_encoding',
+    'ConnectionPool',
+    'DatasetRegistry',
+    'db_pool',
+    'decimate_to',
     'deep_merge',
     'empty_tile',
+    'encode_mvt_tile',
     'error_fig',
+    'GeometrySet',
+    'GeometryStore',
+    'grid_resolution',
     'image_resp',
     'load_config',
+    'LRUCache',
     'open_dataset',
     'open_mfdataset',
+    'open_overview',
+    'open_zarr',
     'parse_arg',
     'parse_colormap',
+    'produce_choropleth_tile',
+    'path_version',
+    'PoolTimeout',
     'sel_snap',
+    'simplify_tolerance',
     'tile',
+    'TileCache',
     'tile_left',
+    'tile_pixel_centers',
+    'tile_pixel_edges',
+    'tile_resolution',
     'tile_top_mercator',
     'to_dash_colorscale',
+    'tolerance_digits',
+    'zoom_band',
     'AQUAMARINE',
     'BLACK',
     'BLUE',
@@ -46,8 +73,18 @@ __all__ = [
     'YELLOW',
 ]
 
+import collections
+import contextlib
 import copy
+import functools
+import hashlib
 import io
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
 from typing import Tuple, List, Literal, Optional, Union, Callable, Iterable as Iterable
 from typing import NamedTuple
 import math
@@ -56,13 +93,19 @@ import json
 import numpy as np
 import pandas as pd
 import xarray as xr
+import zarr
 from collections.abc import Iterable as CollectionsIterable
 import cv2
+import psycopg2
 import psycopg2.extensions
 from psycopg2 import sql
 import rasterio.features
 import rasterio.transform
 import shapely.geometry
+import shapely.ops
+import shapely.prepared
+import shapely.strtree
+import shapely.wkb
 from shapely.geometry.multipolygon import MultiPolygon
 from shapely.geometry.polygon import Polygon
 from shapely.geometry.multipoint import MultiPoint
@@ -106,6 +149,80 @@ def error_fig(error_msg="error"):
 FuncInterp2d = Callable[[Iterable[np.ndarray]], np.ndarray]
 
 
+class LRUCache:
+    """A bounded, thread-safe, in-memory least-recently-used cache.
+
+    Parameters
+    ----------
+    max_size : int
+        maximum total size of the cached values, as measured by `sizeof`.
+    sizeof : callable, optional
+        maps a value to its size (default counts every value as 1,
+        in which case `max_size` is a number of entries).
+    """
+
+    def __init__(self, max_size, sizeof=lambda value: 1):
+        self.max_size = max_size
+        self.sizeof = sizeof
+        self._entries = collections.OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        if size > self.max_size:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old[1]
+            self._entries[key] = (value, size)
+            self._size += size
+            while self._size > self.max_size:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+                self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._size -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                entries=len(self._entries),
+                size=self._size,
+                max_size=self.max_size,
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+            )
+
+
+# Lookup tables of ColorScales, which are small but slow to compute.
+_LUTS = LRUCache(256)
+
+
 class ColorScale:
     """A class to define and manipulate colorscales.
 
@@ -199,6 +316,28 @@ class ColorScale:
         --------
         to_bgra_array 
         """
+        return self._lut("rgba", lutsize, self._rgba_array)
+
+    def _lut(self, kind, lutsize, compute):
+        # Memoized on the values that determine the result, so that
+        # ColorScales created on the fly with the same colors and scale
+        # (e.g. by rescaled) share lookup tables.
+        key = (
+            kind,
+            self.colors.tobytes(),
+            self.colors.shape,
+            tuple(float(x) for x in self.scale),
+            lutsize,
+        )
+        lut = _LUTS.get(key)
+        if lut is None:
+            lut = compute(lutsize)
+            if isinstance(lut, np.ndarray):
+                lut.flags.writeable = False
+            _LUTS.put(key, lut)
+        return lut
+
+    def _rgba_array(self, lutsize):
         cs = self.rescaled(0, lutsize-1)
         n_anchors =  len(cs.scale)
         # append output is not used but saves writing a condition dedicated to last color
@@ -256,7 +395,10 @@ class ColorScale:
         --------
         to_rgba_array 
         """
-        return self.to_rgba_array(lutsize=lutsize)[:,[2, 1, 0, 3]]
+        return self._lut(
+            "bgra", lutsize,
+            lambda lutsize: self.to_rgba_array(lutsize=lutsize)[:,[2, 1, 0, 3]],
+        )
 
     def to_dash_leaflet(self, lutsize=256):
         """A hexadecimal `lutsize` array representation of a ColorScale instance.
@@ -275,7 +417,12 @@ class ColorScale:
         --------
         Color.to_hex_rgba
         """
-        return [Color(*x).to_hex_rgba() for x in self.to_rgba_array(lutsize=lutsize)]
+        return list(self._lut(
+            "dash_leaflet", lutsize,
+            lambda lutsize: tuple(
+                Color(*x).to_hex_rgba() for x in self.to_rgba_array(lutsize=lutsize)
+            ),
+        ))
 
 
 class Color(NamedTuple):
@@ -428,18 +575,50 @@ def tile_top_mercator(ty: int, tz: int) -> float:
     return np.rad2deg(mercator_to_rad(a))
 
 
-def pixel_extents(g: Callable[[int, int], float], tx: int, tz: int, n: int = 1):
-    """Given a function that maps a tile coordinate (row or column number)
-    to the start of that tile (top or left edge) in degrees, returns
-    the bounds of each pixel within the tile along that dimension.
-
+def tile_left_edges(tx: int, tz: int, n: int = 1) -> np.ndarray:
+    """Longitudes of the `n` + 1 edges of the pixels across column `tx`
+    of the tile grid at scale `tz`, from west to east.
     """
     assert n >= 1 and tz >= 0 and 0 <= tx < 2 ** tz
-    a = g(tx, tz)
-    for i in range(1, n + 1):
-        b = g(tx + i / n, tz)
-        yield a, b
-        a = b
+    return tile_left(tx + np.arange(n + 1) / n, tz)
+
+
+@functools.lru_cache(maxsize=4096)
+def tile_top_mercator_edges(ty: int, tz: int, n: int = 1) -> np.ndarray:
+    """Latitudes of the `n` + 1 edges of the pixels down row `ty` of the
+    spherical Mercator tile grid at scale `tz`, from north to south.
+
+    A row is shared by all the tiles across it, so the result is
+    memoized; it is returned read-only.
+    """
+    assert n >= 1 and tz >= 0 and 0 <= ty < 2 ** tz
+    edges = tile_top_mercator(ty + np.arange(n + 1) / n, tz)
+    edges.flags.writeable = False
+    return edges
+
+
+def tile_pixel_edges(
+    tx: int, ty: int, tz: int, tile_width: int = 256, tile_height: int = 256
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Longitudes and latitudes of the pixel edges of a tile."""
+    return (
+        tile_left_edges(tx, tz, tile_width),
+        tile_top_mercator_edges(ty, tz, tile_height),
+    )
+
+
+def tile_pixel_centers(
+    tx: int, ty: int, tz: int, tile_width: int = 256, tile_height: int = 256
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Longitudes and latitudes of the pixel centers of a tile.
+
+    Centers are halfway between edges in degrees, not in Mercator
+    units.
+    """
+    return tuple(
+        a[:-1] + (a[1:] - a[:-1]) / 2.0
+        for a in tile_pixel_edges(tx, ty, tz, tile_width, tile_height)
+    )
 
 
 def tile(da, tx, ty, tz, clipping=None):
@@ -492,14 +671,7 @@ def produce_data_tile(
     tile_width: int = 256,
     tile_height: int = 256,
 ) -> np.ndarray:
-    x = np.fromiter(
-        (a + (b - a) / 2.0 for a, b in pixel_extents(tile_left, tx, tz, tile_width)),
-        np.double,
-    )
-    y = np.fromiter(
-        (a + (b - a) / 2.0 for a, b in pixel_extents(tile_top_mercator, ty, tz, tile_height)),
-        np.double,
-    )
+    x, y = tile_pixel_centers(tx, ty, tz, tile_width, tile_height)
     tile_bbox = shapely.geometry.box(x[0], y[0], x[-1], y[-1])
     lon = da['lon']
     lat = da['lat']
@@ -512,14 +684,141 @@ def produce_data_tile(
     return z
 
 
+class ImageEncoding(NamedTuple):
+    """How image_resp encodes tiles.
+
+    Parameters
+    ----------
+    palette : bool
+        encode tiles that have at most 256 distinct colors, which is
+        most of them since they are drawn from a colormap, as 8-bit
+        palette PNGs.
+    png_compression : int, optional
+        zlib compression level of PNGs, 0 to 9 (None is the encoder's
+        default).
+    webp : bool
+        send WebP to clients that explicitly accept it.
+    webp_quality : int
+        WebP quality, 1 to 100, or above 100 for lossless.
+    """
+    palette: bool = False
+    png_compression: Optional[int] = None
+    webp: bool = False
+    webp_quality: int = 101
+
+
+IMAGE_ENCODING = ImageEncoding()
+
+
+def configure_image_encoding(**kwargs):
+    """Sets the `ImageEncoding` used by image_resp."""
+    global IMAGE_ENCODING
+    IMAGE_ENCODING = ImageEncoding(**kwargs)
+
+
+def negotiate_image_format() -> str:
+    """"webp" if enabled and accepted by the client, otherwise "png"."""
+    if (
+        IMAGE_ENCODING.webp
+        and flask.has_request_context()
+        # Only an explicit mention counts: */* doesn't mean that the
+        # client can decode WebP.
+        and any(
+            m == "image/webp" and q > 0
+            for m, q in flask.request.accept_mimetypes
+        )
+    ):
+        return "webp"
+    return "png"
+
+
 def image_resp(im):
-    cv2_imencode_success, buffer = cv2.imencode(".png", im)
-    assert cv2_imencode_success
-    io_buf = io.BytesIO(buffer)
-    resp = flask.send_file(io_buf, mimetype="image/png")
+    """Encodes `im` as an HTTP response. ETags are set by `cache_tile`."""
+    fmt = negotiate_image_format()
+    if fmt == "webp":
+        cv2_imencode_success, buffer = cv2.imencode(
+            ".webp",
+            np.asarray(im, np.uint8),
+            [cv2.IMWRITE_WEBP_QUALITY, IMAGE_ENCODING.webp_quality],
+        )
+        assert cv2_imencode_success
+        data = buffer.tobytes()
+    else:
+        data = encode_png(
+            im, IMAGE_ENCODING.png_compression, IMAGE_ENCODING.palette
+        )
+    resp = flask.Response(data, mimetype=f"image/{fmt}")
+    if IMAGE_ENCODING.webp:
+        resp.vary.add("Accept")
     return resp
 
 
+def encode_png(
+    im: np.ndarray, compression: Optional[int] = None, palette: bool = False
+) -> bytes:
+    """Encodes a BGR(A) or grayscale image as PNG, as a palette PNG if
+    `palette` and it has no more than 256 colors.
+    """
+    im = np.ascontiguousarray(im, np.uint8)
+    if palette and im.ndim == 3 and im.shape[2] == 4:
+        data = encode_palette_png(im, compression)
+        if data is not None:
+            return data
+    params = [] if compression is None else [cv2.IMWRITE_PNG_COMPRESSION, compression]
+    cv2_imencode_success, buffer = cv2.imencode(".png", im, params)
+    assert cv2_imencode_success
+    return buffer.tobytes()
+
+
+def encode_palette_png(
+    im: np.ndarray, compression: Optional[int] = None
+) -> Optional[bytes]:
+    """Encodes a BGRA uint8 image as an 8-bit palette PNG, or returns
+    None if it has more than 256 colors.
+    """
+    height, width = im.shape[:2]
+    pixels = im.reshape(-1, 4)
+    # The color of fully transparent pixels doesn't matter, so they all
+    # get the same palette entry.
+    packed = np.where(pixels[:, 3] == 0, 0, pixels.view(np.uint32)[:, 0])
+    codes, colors = pd.factorize(packed)
+    if len(colors) > 256:
+        return None
+    colors = np.asarray(colors, np.uint32).view(np.uint8).reshape(-1, 4)
+    # Put translucent colors first, so that the tRNS chunk, which may
+    # omit trailing opaque entries, is as short as possible.
+    order = np.argsort(colors[:, 3] == 255, kind="stable")
+    colors = colors[order]
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    indices = rank.astype(np.uint8)[codes].reshape(height, width)
+    num_translucent = np.count_nonzero(colors[:, 3] != 255)
+
+    # Each row of the image data starts with its filter type, 0 (none).
+    scanlines = np.zeros((height, width + 1), np.uint8)
+    scanlines[:, 1:] = indices
+    level = -1 if compression is None else compression
+
+    def chunk(kind, data):
+        return (
+            struct.pack(">I", len(data)) + kind + data
+            + struct.pack(">I", zlib.crc32(kind + data))
+        )
+
+    png = [
+        b"\x89PNG\r\n\x1a\n",
+        # width, height, bit depth, color type (palette), compression,
+        # filter and interlace methods
+        chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 3, 0, 0, 0)),
+        chunk(b"PLTE", colors[:, [2, 1, 0]].tobytes()),
+    ]
+    if num_translucent > 0:
+        png.append(chunk(b"tRNS", colors[:num_translucent, 3].tobytes()))
+    png.append(chunk(b"IDAT", zlib.compress(scanlines.tobytes(), level)))
+    png.append(chunk(b"IEND", b""))
+    return b"".join(png)
+
+
 def to_multipolygon(p: Union[Polygon, MultiPolygon]) -> MultiPolygon:
     if not isinstance(p, MultiPolygon):
         p = MultiPolygon([p])
@@ -584,19 +883,44 @@ def flatten(im_fg: np.ndarray, im_bg: np.ndarray) -> np.ndarray:
 
 
 def apply_mask(
-    im: np.ndarray, mask: np.ndarray, mask_color: Color = Color(0, 0, 0, 0)
+    im: np.ndarray,
+    mask: np.ndarray,
+    mask_color: Color = Color(0, 0, 0, 0),
+    out: Optional[np.ndarray] = None,
 ) -> np.ndarray:
-    h = im.shape[0]
-    w = im.shape[1]
-    mask = mask.reshape(mask.shape + (1,)).astype(np.float64) / 255
-    mask_color = np.array(
+    """Paints `mask_color` over `im` with opacity `mask` (0 to 255).
+
+    Pixels where the mask is 0 or 255, which is all of them but the
+    antialiased edges of a shape, are copied as is or set to
+    `mask_color` in uint8; only the others are alpha-composited, in
+    floating point. The result is written to `out` (a C-contiguous
+    array, which may be `im`), or to a new array.
+    """
+    if out is None:
+        out = im.copy()
+    elif out is not im:
+        out[...] = im
+    color = np.array(
         [mask_color.blue, mask_color.green, mask_color.red, mask_color.alpha],
-        np.float64
-    ).reshape((1, 1, 4))
-    im_fg = mask_color * mask
-    im_bg = im * (1.0 - mask)
-    im_comp = flatten(im_fg, im_bg)
-    return im_comp
+        np.uint8,
+    )
+    if mask_color.alpha == 0:
+        # as flatten does for fully transparent pixels
+        color[:3] = 0
+    # Shapes usually cover a small part of the tile, so work on the
+    # indices of the pixels they cover.
+    flat_mask = mask.reshape(-1)
+    flat_out = out.reshape(-1, 4)
+    covered = np.flatnonzero(flat_mask)
+    is_full = flat_mask[covered] == 255
+    flat_out[covered[is_full]] = color
+    partial = covered[~is_full]
+    if partial.size > 0:
+        m = flat_mask[partial].reshape((1, -1, 1)).astype(np.float64) / 255
+        im_fg = color.astype(np.float64) * m
+        im_bg = flat_out[partial].reshape((1, -1, 4)) * (1.0 - m)
+        flat_out[partial] = flatten(im_fg, im_bg)[0]
+    return out
 
 
 def produce_shape_tile(
@@ -610,34 +934,128 @@ def produce_shape_tile(
     tile_height = im.shape[0]
     tile_width = im.shape[1]
 
-    x0, x1 = list(pixel_extents(tile_left, tx, tz, 1))[0]
-    y0, y1 = list(pixel_extents(tile_top_mercator, ty, tz, 1))[0]
+    out = None
+    for s, a in shapes:
+        mask = shape_mask(
+            s, tx, ty, tz, tile_width, tile_height, oper, a.line_type
+        )
+        if mask is not None:
+            if out is None:
+                out = im.copy()
+            apply_mask(out, mask, a.background_color, out=out)
+
+    return im if out is None else out
+
+
+# Rasterized shapes only depend on the geometry and the tile, not on
+# the data drawn under them, so they are cached. Geometries are
+# identified by a digest of their WKB, which is memoized by object
+# identity (holding a reference, so that ids are not reused) because
+# the same object is typically used for many tiles. Every entry is
+# charged for its key and bookkeeping, so that tiles with no mask (None)
+# or the shared full mask still count towards the bound.
+MASK_ENTRY_BYTES = 512
+
+
+def _mask_size(mask) -> int:
+    if mask is None or mask is full_mask(mask.shape[1], mask.shape[0]):
+        return MASK_ENTRY_BYTES
+    return MASK_ENTRY_BYTES + mask.nbytes
+
+
+MASK_CACHE = LRUCache(64 * 2 ** 20, sizeof=_mask_size)
+_SHAPE_KEYS = LRUCache(256)
+_PREPARED_SHAPES = LRUCache(256)
+_MISSING = object()
+
+
+def shape_key(shape) -> str:
+    """A digest of the geometry of `shape`."""
+    entry = _SHAPE_KEYS.get(id(shape))
+    if entry is not None and entry[0] is shape:
+        return entry[1]
+    key = hashlib.sha1(shapely.wkb.dumps(shape)).hexdigest()
+    _SHAPE_KEYS.put(id(shape), (shape, key))
+    return key
+
+
+def prepared_shape(shape, key: Optional[str] = None):
+    """`shape` prepared for repeated predicates, memoized by digest."""
+    if key is None:
+        key = shape_key(shape)
+    prepared = _PREPARED_SHAPES.get(key)
+    if prepared is None:
+        prepared = shapely.prepared.prep(shape)
+        _PREPARED_SHAPES.put(key, prepared)
+    return prepared
+
+
+@functools.lru_cache(maxsize=16)
+def full_mask(tile_width: int, tile_height: int) -> np.ndarray:
+    mask = np.full((tile_height, tile_width), 255, np.uint8)
+    mask.flags.writeable = False
+    return mask
 
-    x_ratio = tile_width / (x1 - x0)
-    y0_mercator = deg_to_mercator(y0)
-    y_ratio_mercator = tile_height / (deg_to_mercator(y1) - y0_mercator)
 
-    tile_bounds = (x0, y0, x1, y1)
+def shape_mask(
+    shape,
+    tx: int,
+    ty: int,
+    tz: int,
+    tile_width: int = 256,
+    tile_height: int = 256,
+    oper: Literal["intersection", "difference"] = "intersection",
+    line_type: int = cv2.LINE_AA,
+) -> Optional[np.ndarray]:
+    """Read-only uint8 mask of the pixels of a tile covered by the
+    intersection of `shape` with the tile, or by its difference from
+    the tile, or None if there are none.
+    """
+    key = shape_key(shape)
+    cache_key = (key, oper, tx, ty, tz, tile_width, tile_height, line_type)
+    mask = MASK_CACHE.get(cache_key, _MISSING)
+    if mask is _MISSING:
+        mask = _shape_mask(
+            shape, key, tx, ty, tz, tile_width, tile_height, oper, line_type
+        )
+        if mask is not None:
+            mask.flags.writeable = False
+        MASK_CACHE.put(cache_key, mask)
+    return mask
+
+
+def _shape_mask(shape, key, tx, ty, tz, tile_width, tile_height, oper, line_type):
+    (x0, x1), (y0, y1) = tile_pixel_edges(tx, ty, tz, 1, 1)
     tile = MultiPoint([(x0, y0), (x1, y1)]).envelope
 
-    for s, a in shapes:
-        mask = np.zeros(im.shape[:2], np.uint8)
-        if oper == "difference":
-            if tile.intersects(s):
-                mp = to_multipolygon(tile.difference(s))
-            else:
-                mp = to_multipolygon(tile)
-        elif oper == "intersection":
-            if tile.intersects(s):
-                mp = to_multipolygon(tile.intersection(s))
-            else:
-                continue
-        fxs = lambda xs: (xs - x0) * x_ratio
-        fys = lambda ys: (deg_to_mercator(ys) - y0_mercator) * y_ratio_mercator
-        rasterize_multipolygon(mask, mp, fxs, fys, a.line_type, 255, 0)
-        im = apply_mask(im, mask, a.background_color)
+    # Tiles entirely inside or outside the shape need no geometry
+    # operation.
+    prepared = prepared_shape(shape, key)
+    if prepared.contains(tile):
+        inside = True
+    elif not prepared.intersects(tile):
+        inside = False
+    else:
+        inside = None
+    if inside is not None:
+        if inside == (oper == "intersection"):
+            return full_mask(tile_width, tile_height)
+        else:
+            return None
 
-    return im
+    if oper == "difference":
+        mp = to_multipolygon(tile.difference(shape))
+    elif oper == "intersection":
+        mp = to_multipolygon(tile.intersection(shape))
+
+    x_ratio = tile_width / (x1 - x0)
+    y0_mercator = deg_to_mercator(y0)
+    y_ratio_mercator = tile_height / (deg_to_mercator(y1) - y0_mercator)
+    fxs = lambda xs: (xs - x0) * x_ratio
+    fys = lambda ys: (deg_to_mercator(ys) - y0_mercator) * y_ratio_mercator
+    mask = np.zeros((tile_height, tile_width), np.uint8)
+    rasterize_multipolygon(mask, mp, fxs, fys, line_type, 255, 0)
+    return mask
 
 
 AQUAMARINE = Color(127, 255, 212)
@@ -1073,12 +1491,25 @@ def with_alpha(c: Color, alpha) -> Color:
 #
 
 
+def grid_spacing(values: np.ndarray) -> Optional[float]:
+    """The spacing of evenly spaced coordinate `values`, or None if they
+    aren't.
+    """
+    if values.size < 2:
+        return None
+    deltas = np.diff(values)
+    if not np.allclose(deltas, deltas[0], rtol=1e-3, atol=0):
+        return None
+    return deltas[0]
+
+
 def trim_to_bbox(ds, s, lon_name="lon", lat_name="lat"):
     """Given a Dataset and a shape, return the subset of the Dataset that
     intersects the shape's bounding box.
     """
-    lon_res = ds[lon_name].values[1] - ds[lon_name].values[0]
-    lat_res = ds[lat_name].values[1] - ds[lat_name].values[0]
+    # Use the largest spacing as margin, in case the grid is uneven.
+    lon_res = np.diff(ds[lon_name].values).max()
+    lat_res = np.diff(ds[lat_name].values).max()
 
     lon_min, lat_min, lon_max, lat_max = s.bounds
     # print("*** shape bounds:", lon_min, lat_min, lon_max, lat_max)
@@ -1093,49 +1524,57 @@ def trim_to_bbox(ds, s, lon_name="lon", lat_name="lat"):
     )
 
 
-def average_over(ds, s, lon_name="lon", lat_name="lat", all_touched=False):
-    """Average a Dataset over a shape"""
+def average_over(
+    ds, s, lon_name="lon", lat_name="lat", all_touched=False, key=None
+):
+    """Average a Dataset over a shape
+
+    `key` identifies the shape in the cache of weights; by default it
+    is a digest of the geometry.
+
+    Only the part of `ds` within the shape's bounding box is read, and
+    the result is as lazy as `ds`.
+    """
     # This function assumes that the lat and lon coordinates are
     # evenly spaced, but when we combine DataArrays with different lat
     # and lon coordinates into a single Dataset, they can end up with
     # non-evenly-spaced coordinates, because the Dataset coordinates
-    # are the union of the individual DataArray coordinates. Drop
-    # empty coordinate values to get back to the original
-    # evenly-spaced one. (TODO we really shouldn't be combining
-    # variables with different resolutions into the same Dataset.)
-    ds = ds.where(ds.notnull(), drop=True)
-
-    lon_res = ds[lon_name].values[1] - ds[lon_name].values[0]
-    lat_res = ds[lat_name].values[1] - ds[lat_name].values[0]
-
-    ds = trim_to_bbox(ds, s, lon_name=lon_name, lat_name=lat_name)
-
-    lon_min = ds[lon_name].values[0] - 0.5 * lon_res
-    lon_max = ds[lon_name].values[-1] + 0.5 * lon_res
-    lat_min = ds[lat_name].values[0] - 0.5 * lat_res
-    lat_max = ds[lat_name].values[-1] + 0.5 * lat_res
-
-    lon_size = ds.sizes[lon_name]
-    lat_size = ds.sizes[lat_name]
-
-    t = rasterio.transform.Affine(
-        (lon_max - lon_min) / lon_size,
-        0,
-        lon_min,
-        0,
-        (lat_max - lat_min) / lat_size,
-        lat_min,
+    # are the union of the individual DataArray coordinates. In that
+    # case, average each variable separately, after dropping the
+    # empty coordinate values that came from the other variables.
+    # (TODO we really shouldn't be combining variables with different
+    # resolutions into the same Dataset.)
+    evenly_spaced = (
+        grid_spacing(ds[lon_name].values) is not None
+        and grid_spacing(ds[lat_name].values) is not None
     )
+    if not evenly_spaced and isinstance(ds, xr.Dataset) and len(ds.data_vars) > 1:
+        return xr.merge([
+            average_over(ds[k], s, lon_name, lat_name, all_touched, key)
+            for k in ds.data_vars
+        ])
 
-    r0 = rasterio.features.rasterize(
-        [s], out_shape=(lat_size, lon_size), transform=t, all_touched=all_touched
+    ds = trim_to_bbox(ds, s, lon_name=lon_name, lat_name=lat_name)
+    if not evenly_spaced:
+        # Only evaluates the data within the bounding box.
+        notnull = ds.notnull()
+        if isinstance(notnull, xr.Dataset):
+            notnull = notnull.to_array().any("variable")
+        ds = ds.isel({
+            dim: notnull.any([d for d in notnull.dims if d != dim]).values
+            for dim in (lat_name, lon_name)
+        })
+
+    if key is None:
+        key = shape_key(s)
+    r = shape_weights(
+        s, key, ds[lat_name].values, ds[lon_name].values, all_touched
     )
-    r0 = xr.DataArray(
-        r0,
+    r = xr.DataArray(
+        r,
         dims=(lat_name, lon_name),
         coords={lat_name: ds[lat_name], lon_name: ds[lon_name]},
     )
-    r = r0 * np.cos(np.deg2rad(ds[lat_name]))
 
     res = ds.weighted(r).mean([lat_name, lon_name], skipna=True)
 
@@ -1147,6 +1586,177 @@ def average_over(ds, s, lon_name="lon", lat_name="lat", all_touched=False):
     return res
 
 
+# Weights and label rasters depend only on the shapes and the grid, and
+# the same regions are averaged over again and again, so they are
+# cached.
+WEIGHT_CACHE = LRUCache(64 * 2 ** 20, sizeof=lambda a: a.nbytes)
+
+
+def grid_signature(lats: np.ndarray, lons: np.ndarray) -> Tuple:
+    return (lats[0], lats[-1], lats.size, lons[0], lons[-1], lons.size)
+
+
+def grid_transform(lats: np.ndarray, lons: np.ndarray):
+    """The affine transform from array indices to the edges of the grid
+    cells of evenly spaced `lats` and `lons`.
+    """
+    lon_res = lons[1] - lons[0]
+    lat_res = lats[1] - lats[0]
+    lon_min = lons[0] - 0.5 * lon_res
+    lon_max = lons[-1] + 0.5 * lon_res
+    lat_min = lats[0] - 0.5 * lat_res
+    lat_max = lats[-1] + 0.5 * lat_res
+    return rasterio.transform.Affine(
+        (lon_max - lon_min) / lons.size,
+        0,
+        lon_min,
+        0,
+        (lat_max - lat_min) / lats.size,
+        lat_min,
+    )
+
+
+def shape_weights(
+    s, key, lats: np.ndarray, lons: np.ndarray, all_touched: bool = False
+) -> np.ndarray:
+    """Read-only area weights of the cells of a grid inside shape `s`,
+    identified in the cache by `key`.
+    """
+    cache_key = ("weights", key, grid_signature(lats, lons), all_touched)
+    weights = WEIGHT_CACHE.get(cache_key)
+    if weights is None:
+        r0 = rasterio.features.rasterize(
+            [s],
+            out_shape=(lats.size, lons.size),
+            transform=grid_transform(lats, lons),
+            all_touched=all_touched,
+        )
+        weights = r0 * np.cos(np.deg2rad(lats))[:, np.newaxis]
+        weights.flags.writeable = False
+        WEIGHT_CACHE.put(cache_key, weights)
+    return weights
+
+
+def label_raster(
+    shapes, lats: np.ndarray, lons: np.ndarray, all_touched: bool = False
+) -> np.ndarray:
+    """Read-only raster of the 1-based index in `shapes` of the shape each
+    cell of a grid is in, or 0. Where shapes overlap, the last one wins.
+    """
+    cache_key = (
+        "labels",
+        tuple(shape_key(s) for s in shapes),
+        grid_signature(lats, lons),
+        all_touched,
+    )
+    labels = WEIGHT_CACHE.get(cache_key)
+    if labels is None:
+        labels = rasterio.features.rasterize(
+            ((s, i + 1) for i, s in enumerate(shapes) if not s.is_empty),
+            out_shape=(lats.size, lons.size),
+            transform=grid_transform(lats, lons),
+            all_touched=all_touched,
+            fill=0,
+            dtype=np.int32,
+        )
+        labels.flags.writeable = False
+        WEIGHT_CACHE.put(cache_key, labels)
+    return labels
+
+
+def average_over_regions(
+    ds, shapes, lon_name="lon", lat_name="lat", all_touched=False,
+    dim="region",
+):
+    """Average a Dataset over each of several non-overlapping shapes.
+
+    Costs about as much as a single average_over, whatever the number of
+    shapes: every cell is labelled with the shape it's in, then weighted
+    sums are accumulated per label in one pass.
+
+    Parameters
+    ----------
+    ds : xr.Dataset or xr.DataArray
+        data on an evenly spaced `lat_name` x `lon_name` grid.
+    shapes : dict
+        shapes, keyed by region.
+    lon_name, lat_name : str, optional
+        names of the spatial dimensions.
+    all_touched : bool, optional
+        whether cells touched by a shape count as inside it. Cells
+        touched by several shapes are attributed to only one of them,
+        which is where results differ from average_over.
+    dim : str, optional
+        name of the new dimension of the result, of which the
+        coordinate is the keys of `shapes` (default is "region").
+
+    Returns
+    -------
+    Same type as `ds`, without the spatial dimensions, with `dim` instead.
+
+    See Also
+    --------
+    average_over
+    """
+    keys = list(shapes.keys())
+    geoms = [shapes[k] for k in keys]
+    bounds = np.array([g.bounds for g in geoms])
+    bbox = shapely.geometry.box(
+        *bounds[:, :2].min(axis=0), *bounds[:, 2:].max(axis=0)
+    )
+    ds = trim_to_bbox(ds, bbox, lon_name=lon_name, lat_name=lat_name)
+    lats = ds[lat_name].values
+    lons = ds[lon_name].values
+    labels = label_raster(geoms, lats, lons, all_touched).reshape(-1)
+    cos_lat = np.broadcast_to(
+        np.cos(np.deg2rad(lats))[:, np.newaxis], (lats.size, lons.size)
+    ).reshape(-1)
+
+    def zonal_mean(da):
+        other_dims = [d for d in da.dims if d not in (lat_name, lon_name)]
+        values = da.transpose(*other_dims, lat_name, lon_name).values
+        lead_shape = values.shape[:-2]
+        values = values.reshape(int(np.prod(lead_shape)), labels.size)
+        valid = ~np.isnan(values)
+        weights = np.where(valid, cos_lat, 0)
+        # Offset the labels of each row, so that one bincount does all
+        # rows at once.
+        nbins = len(keys) + 1
+        bins = labels + nbins * np.arange(values.shape[0])[:, np.newaxis]
+        sums = np.bincount(
+            bins.reshape(-1),
+            weights=(np.where(valid, values, 0) * weights).reshape(-1),
+            minlength=nbins * values.shape[0],
+        )
+        totals = np.bincount(
+            bins.reshape(-1),
+            weights=weights.reshape(-1),
+            minlength=nbins * values.shape[0],
+        )
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = sums / totals
+        means = means.reshape(lead_shape + (nbins,))[..., 1:]
+        return xr.DataArray(
+            means,
+            dims=other_dims + [dim],
+            coords={
+                **{
+                    k: c for k, c in da.coords.items()
+                    if lat_name not in c.dims and lon_name not in c.dims
+                },
+                dim: keys,
+            },
+            name=da.name,
+        )
+
+    if isinstance(ds, xr.DataArray):
+        return zonal_mean(ds)
+    return xr.Dataset({
+        k: zonal_mean(v) if lat_name in v.dims and lon_name in v.dims else v
+        for k, v in ds.data_vars.items()
+    })
+
+
 #
 # Functions to deal with periodic dimension (e.g. longitude)
 #
@@ -1244,6 +1854,1341 @@ def sel_periodic(ds, dim, vals, period=360.0):
 
 
 
+#
+# Overviews
+#
+# An overview is a copy of a gridded dataset decimated by an integer
+# factor along its spatial dimensions, i.e. keeping every factor-th
+# grid cell. Decimation rather than averaging matches the
+# nearest-neighbour sampling done by produce_data_tile, so a tile
+# drawn from an overview looks the same as one drawn from the full
+# resolution data, and quantities derived non-linearly from the data
+# (e.g. onset dates) keep their meaning. Overviews are stored as
+# zarr groups inside the store they are built from.
+
+
+OVERVIEW_FACTORS = (2, 4, 8, 16, 32, 64)
+
+
+def overview_group(factor: int) -> str:
+    return f"overviews/{factor}"
+
+
+def overviews_source_version(path) -> str:
+    """A token that changes whenever the zarr store at `path` is
+    modified, leaving out its overviews (see `path_version`).
+    """
+    return path_version(
+        *sorted(e.path for e in os.scandir(path) if e.name != "overviews")
+    )
+
+
+def overviews_are_current(path) -> bool:
+    """Whether the overviews of the zarr store at `path` were built
+    from the store as it is now."""
+    if not overview_factors(path):
+        return False
+    overviews = zarr.open_group(path, path="overviews", mode="r")
+    return overviews.attrs.get("source_version") == overviews_source_version(path)
+
+
+def overview_factors(path) -> List[int]:
+    """Factors of the overviews stored in the zarr store at `path`."""
+    try:
+        entries = os.listdir(os.path.join(path, "overviews"))
+    except (FileNotFoundError, NotADirectoryError):
+        return []
+    return sorted(int(e) for e in entries if e.isdigit())
+
+
+def tile_resolution(ty: int, tz: int, tile_size: int = 256) -> float:
+    """Size in degrees of the smallest pixel side in row `ty` of the
+    tile grid at scale `tz`.
+    """
+    dy = -np.diff(tile_top_mercator_edges(ty, tz, tile_size)).min()
+    return min(360 / 2 ** tz / tile_size, dy)
+
+
+def choose_overview_factor(
+    native_resolution: float, resolution: float, factors=OVERVIEW_FACTORS
+) -> int:
+    """The largest of `factors` at which data at `native_resolution` is
+    still at least as fine as `resolution`, or 1.
+    """
+    return max(
+        (f for f in factors if f * native_resolution <= resolution), default=1
+    )
+
+
+def grid_resolution(ds, dim: str = "X") -> float:
+    return abs(ds[dim][1].item() - ds[dim][0].item())
+
+
+def decimate(ds, factor: int, dims=("X", "Y")):
+    """Keeps every `factor`-th element of `ds` along `dims`."""
+    if factor == 1:
+        return ds
+    return ds.isel({d: slice(None, None, factor) for d in dims})
+
+
+def decimate_to(ds, resolution: Optional[float], dims=("X", "Y")):
+    """Decimates `ds` by the largest of `OVERVIEW_FACTORS` that keeps it
+    at least as fine as `resolution` (None leaves `ds` alone).
+    """
+    if resolution is None:
+        return ds
+    factor = choose_overview_factor(grid_resolution(ds, dims[0]), resolution)
+    return decimate(ds, factor, dims)
+
+
+def open_overview(
+    path,
+    resolution: Optional[float] = None,
+    dims=("X", "Y"),
+    factor: Optional[int] = None,
+    **kwargs,
+):
+    """Opens the zarr store at `path` decimated to `resolution`.
+
+    The coarsest stored overview that is compatible with `resolution`
+    is read, and decimated further on the fly if needed. Overviews that
+    were built before the store was last modified are ignored.
+
+    Parameters
+    ----------
+    path : str
+        path of the zarr store.
+    resolution : float, optional
+        size in degrees of the pixels the data is going to be drawn on
+        (default is None, full resolution).
+    dims : tuple of str, optional
+        spatial dimensions (default is ("X", "Y")).
+    factor : int, optional
+        decimation factor, in place of `resolution` (see
+        `choose_overview_factor`).
+    **kwargs
+        passed on to `xr.open_zarr`.
+
+    See Also
+    --------
+    build_overviews, tile_resolution
+    """
+    ds = xr.open_zarr(path, **kwargs)
+    if factor is None:
+        if resolution is None:
+            return ds
+        factor = choose_overview_factor(grid_resolution(ds, dims[0]), resolution)
+    if factor == 1:
+        return ds
+    stored = [f for f in overview_factors(path) if factor % f == 0]
+    if stored and overviews_are_current(path):
+        ds = xr.open_zarr(path, group=overview_group(stored[-1]), **kwargs)
+        factor //= stored[-1]
+    return decimate(ds, factor, dims)
+
+
+def build_overviews(path, factors=OVERVIEW_FACTORS, dims=("X", "Y")):
+    """Builds (or rebuilds) the overviews of the zarr store at `path`.
+
+    Must be run again whenever the store is modified, otherwise its
+    overviews are ignored.
+
+    Parameters
+    ----------
+    path : str
+        path of the zarr store.
+    factors : sequence of int, optional
+        decimation factors, each a multiple of the previous one
+        (default is `OVERVIEW_FACTORS`).
+    dims : tuple of str, optional
+        spatial dimensions (default is ("X", "Y")).
+
+    See Also
+    --------
+    open_overview
+    """
+    ds = xr.open_zarr(path)
+    chunks = {d: c[0] for d, c in ds.chunks.items()}
+    level, previous = ds, 1
+    for factor in sorted(factors):
+        assert factor % previous == 0, "each factor must divide the next"
+        # Build each level from the previous one to read less data.
+        level = decimate(level, factor // previous, dims).chunk(chunks)
+        for v in level.variables.values():
+            v.encoding.pop("chunks", None)
+            v.encoding.pop("preferred_chunks", None)
+        level.to_zarr(path, group=overview_group(factor), mode="w")
+        level = xr.open_zarr(path, group=overview_group(factor))
+        previous = factor
+    # Record what the overviews were built from, once they all are, for
+    # open_overview to tell whether they are current. Writing them
+    # updates the store's metadata, so this can't be recorded before.
+    overviews = zarr.open_group(path, path="overviews", mode="r+")
+    overviews.attrs["source_version"] = overviews_source_version(path)
+
+
+#
+# Tile caching
+#
+
+
+class TileCache:
+    """A two-tier cache of rendered tiles.
+
+    The memory tier is a per-process LRU. The optional disk tier is a
+    directory that can be shared by all the worker processes of the
+    application; it is trimmed, least recently used files first, when
+    it grows beyond `disk_max_bytes`.
+
+    Parameters
+    ----------
+    memory_max_bytes : int, optional
+        size of the memory tier (default is 64 MiB; 0 disables it).
+    disk_path : str, optional
+        directory of the disk tier (default is None, no disk tier).
+    disk_max_bytes : int, optional
+        size of the disk tier (default is 1 GiB).
+    max_age : float, optional
+        number of seconds after which an entry is stale and treated as
+        missing (default is None, entries never go stale).
+    cache_control : str, optional
+        Cache-Control header of the tiles served through the cache
+        (default is None, no header).
+    """
+
+    _HEADER = struct.Struct("<d")
+
+    def __init__(
+        self,
+        memory_max_bytes=64 * 2 ** 20,
+        disk_path=None,
+        disk_max_bytes=2 ** 30,
+        max_age=None,
+        cache_control=None,
+    ):
+        self.cache_control = cache_control
+        self.memory = LRUCache(
+            memory_max_bytes, sizeof=lambda entry: len(entry[1])
+        )
+        self.disk_path = disk_path
+        self.disk_max_bytes = disk_max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_evictions = 0
+        self.disk_errors = 0
+        if disk_path is not None:
+            os.makedirs(disk_path, exist_ok=True)
+            self._disk_bytes = sum(size for _, _, size in self._disk_files())
+
+    def _is_fresh(self, created):
+        return self.max_age is None or time.time() - created < self.max_age
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Returns the data cached under `key`, or None."""
+        entry = self.memory.get(key)
+        if entry is not None:
+            created, data = entry
+            if self._is_fresh(created):
+                return data
+            self.memory.pop(key)
+        if self.disk_path is not None:
+            entry = self._disk_get(key)
+            if entry is not None:
+                self.memory.put(key, entry)
+                with self._lock:
+                    self.disk_hits += 1
+                return entry[1]
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, data: bytes):
+        entry = (time.time(), data)
+        self.memory.put(key, entry)
+        if self.disk_path is not None:
+            self._disk_put(key, entry)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk_path is not None:
+            for path, _, _ in self._disk_files():
+                self._remove(path)
+            with self._lock:
+                self._disk_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            disk = None
+            if self.disk_path is not None:
+                disk = dict(
+                    path=self.disk_path,
+                    size=self._disk_bytes,
+                    max_size=self.disk_max_bytes,
+                    hits=self.disk_hits,
+                    evictions=self.disk_evictions,
+                    errors=self.disk_errors,
+                )
+            return dict(
+                memory=self.memory.stats(),
+                disk=disk,
+                misses=self.misses,
+            )
+
+    def _file_path(self, key):
+        return os.path.join(self.disk_path, key[:2], key)
+
+    def _disk_get(self, key):
+        path = self._file_path(key)
+        try:
+            with open(path, "rb") as f:
+                blob = f.read()
+            # Record the access so that eviction is least recently used
+            # first rather than oldest first.
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except OSError:
+            with self._lock:
+                self.disk_errors += 1
+            return None
+        (created,) = self._HEADER.unpack_from(blob)
+        if not self._is_fresh(created):
+            self._remove(path)
+            return None
+        return created, blob[self._HEADER.size:]
+
+    def _disk_put(self, key, entry):
+        created, data = entry
+        path = self._file_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temporary file and rename it, so that other
+            # processes never see a partially written tile.
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as f:
+                f.write(self._HEADER.pack(created))
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            with self._lock:
+                self.disk_errors += 1
+            return
+        with self._lock:
+            self._disk_bytes += self._HEADER.size + len(data)
+            must_trim = self._disk_bytes > self.disk_max_bytes
+        if must_trim:
+            self._trim_disk()
+
+    def _disk_files(self):
+        for d in os.scandir(self.disk_path):
+            if not d.is_dir():
+                continue
+            for f in os.scandir(d.path):
+                try:
+                    st = f.stat()
+                except FileNotFoundError:
+                    # removed by another process
+                    continue
+                yield f.path, st.st_mtime, st.st_size
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _trim_disk(self):
+        # Other processes write to the same directory, so start from
+        # what's actually on disk rather than from our own estimate.
+        files = sorted(self._disk_files(), key=lambda f: f[1])
+        total = sum(size for _, _, size in files)
+        target = 0.9 * self.disk_max_bytes
+        evicted = 0
+        for path, _, size in files:
+            if total <= target:
+                break
+            self._remove(path)
+            total -= size
+            evicted += 1
+        with self._lock:
+            self._disk_bytes = total
+            self.disk_evictions += evicted
+
+
+def path_version(*paths) -> str:
+    """A token that changes whenever one of `paths` is modified.
+
+    For a directory (e.g. a zarr store), the directory itself and its
+    immediate children are considered, which catches both rewritten
+    metadata and added or removed variables.
+    """
+    stamps = []
+    for path in paths:
+        path = os.fspath(path)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            stamps.append((path, None))
+            continue
+        stamp = (st.st_mtime_ns, st.st_size)
+        if os.path.isdir(path):
+            for entry in os.scandir(path):
+                est = entry.stat()
+                stamp = max(stamp, (est.st_mtime_ns, est.st_size))
+        stamps.append((path, stamp))
+    return hashlib.sha1(repr(stamps).encode()).hexdigest()
+
+
+def tile_cache_key(*parts) -> str:
+    return hashlib.sha256(
+        json.dumps(parts, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def canonical_args(args) -> List[Tuple[str, str]]:
+    """Query arguments in a canonical order, so that requests that differ
+    only in the order of their arguments share cache entries."""
+    return sorted(args.items(multi=True))
+
+
+def cache_tile(cache: Optional[TileCache], version=None):
+    """Decorator that serves a Flask tile route from `cache`, with
+    HTTP validators.
+
+    The cache key is made of the request path, its canonicalized query
+    arguments, the negotiated image format and a data version token.
+    Responses get an ETag and, if the cache has one, a Cache-Control
+    header. With a `version`, the ETag is derived from the key, so that
+    a matching If-None-Match is answered with 304 before doing anything
+    else; without one, it is a digest of the tile.
+
+    Parameters
+    ----------
+    cache : TileCache
+        where rendered tiles are kept (None disables caching).
+    version : callable, optional
+        called with the route's arguments, returns a token that changes
+        whenever the data behind the tile changes, e.g. `path_version`
+        of the dataset's store (default is None, in which case tiles
+        only expire through the cache's `max_age`).
+    """
+    def decorator(route):
+        @functools.wraps(route)
+        def wrapper(**kwargs):
+            cache_control = None if cache is None else cache.cache_control
+            token = None if version is None else version(**kwargs)
+            key = tile_cache_key(
+                token,
+                flask.request.path,
+                canonical_args(flask.request.args),
+                negotiate_image_format(),
+            )
+            etag = None
+            if version is not None:
+                etag = key[:32]
+                if flask.request.if_none_match.contains(etag):
+                    resp = flask.Response(status=304)
+                    return tile_headers(resp, etag, cache_control)
+            blob = None if cache is None else cache.get(key)
+            if blob is not None:
+                mimetype, _, data = blob.partition(b"\0")
+                resp = flask.Response(data, mimetype=mimetype.decode())
+            else:
+                resp = route(**kwargs)
+                if resp.status_code != 200:
+                    return resp
+                resp.direct_passthrough = False
+                if cache is not None:
+                    cache.put(key, resp.mimetype.encode() + b"\0" + resp.get_data())
+            if etag is None:
+                etag = hashlib.sha256(resp.get_data()).hexdigest()[:32]
+            tile_headers(resp, etag, cache_control)
+            return resp.make_conditional(flask.request)
+        return wrapper
+    return decorator
+
+
+def tile_headers(resp, etag, cache_control=None):
+    resp.set_etag(etag)
+    if cache_control is not None:
+        resp.headers["Cache-Control"] = cache_control
+    if IMAGE_ENCODING.webp:
+        resp.vary.add("Accept")
+    return resp
+
+
+# Opened datasets
+
+# Opening a zarr store reads its metadata, which without consolidated
+# metadata is one small file per array. Opened datasets are kept and
+# only opened again when their store changes.
+
+
+def has_consolidated_metadata(path) -> bool:
+    """Whether the zarr store at `path` has consolidated metadata."""
+    path = os.fspath(path)
+    if os.path.exists(os.path.join(path, ".zmetadata")):
+        return True
+    try:
+        with open(os.path.join(path, "zarr.json")) as f:
+            return json.load(f).get("consolidated_metadata") is not None
+    except (OSError, ValueError):
+        return False
+
+
+def open_zarr(path, **kwargs):
+    """Open a zarr store with xarray, using consolidated metadata if the
+    store has it."""
+    kwargs.setdefault("consolidated", has_consolidated_metadata(path))
+    return xr.open_zarr(path, **kwargs)
+
+
+class DatasetRegistry:
+    """Keeps opened datasets, opening one again when its store changes,
+    as per `path_version`.
+
+    Parameters
+    ----------
+    check_interval : float, optional
+        seconds during which a dataset is reused without checking its
+        store (default 0, i.e. the store is checked on every use).
+    max_entries : int, optional
+        maximum number of datasets kept, the least recently used being
+        forgotten first (default 128).
+    """
+
+    def __init__(self, check_interval: float = 0.0, max_entries: int = 128):
+        self.check_interval = check_interval
+        self._entries = LRUCache(max_entries)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.opens = 0
+
+    def get(self, key, path, open_fn: Callable):
+        """The dataset for `key`, calling `open_fn()` to open it if it
+        hasn't been opened since `path` last changed.
+        """
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and now - entry[2] < self.check_interval:
+            with self._lock:
+                self.hits += 1
+            return entry[0]
+        version = path_version(path)
+        if entry is not None and entry[1] == version:
+            with self._lock:
+                entry[2] = now
+                self.hits += 1
+            return entry[0]
+        ds = open_fn()
+        self._entries.put(key, [ds, version, now])
+        with self._lock:
+            self.opens += 1
+        return ds
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        entries = self._entries.stats()
+        with self._lock:
+            return dict(
+                entries=entries["entries"],
+                hits=self.hits,
+                opens=self.opens,
+                evictions=entries["evictions"],
+            )
+
+
+# Admin geometries
+
+# Admin boundaries change rarely but are used by many tiles and
+# callbacks: to clip data tiles, to draw borders and to find the region
+# under the cursor. They are loaded from the database once, and the
+# objects are kept so that the geometry digests and prepared geometries
+# computed from them (see shape_key) are reused too.
+
+
+class GeometrySet:
+    """The geometries of one admin level and forms derived from them.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        with columns "key", "label" and "the_geom" (shapely geometries).
+    """
+
+    def __init__(self, df):
+        self.keys = list(df["key"])
+        self.labels = list(df["label"])
+        self.geoms = list(df["the_geom"])
+        self._positions = {str(k): i for i, k in enumerate(self.keys)}
+        self._prepared = None
+        self._tree = None
+        self._simplified = LRUCache(16)
+        self._simplifying = {}
+        self._geojson = LRUCache(16)
+        self._key = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.geoms)
+
+    def key(self) -> str:
+        """A digest of the geometries, in order."""
+        with self._lock:
+            if self._key is None:
+                h = hashlib.sha1()
+                for g in self.geoms:
+                    h.update(shape_key(g).encode())
+                self._key = h.hexdigest()
+            return self._key
+
+    def position(self, key) -> int:
+        """The position of the geometry with `key` (compared as a
+        string), or KeyError.
+        """
+        return self._positions[str(key)]
+
+    def shape(self, key):
+        return self.geoms[self.position(key)]
+
+    def label(self, key):
+        return self.labels[self.position(key)]
+
+    def prepared(self) -> List:
+        with self._lock:
+            if self._prepared is None:
+                self._prepared = [
+                    prepared_shape(g, shape_key(g)) for g in self.geoms
+                ]
+            return self._prepared
+
+    def tree(self) -> shapely.strtree.STRtree:
+        with self._lock:
+            if self._tree is None:
+                self._tree = shapely.strtree.STRtree(self.geoms)
+            return self._tree
+
+    def candidates(self, geom) -> List[int]:
+        """The positions of the geometries whose bounding boxes intersect
+        that of `geom`, in order.
+        """
+        tree = self.tree()
+        # Shapely < 2 returns geometries from query and positions from
+        # query_items; shapely 2 returns positions from query.
+        query = getattr(tree, "query_items", tree.query)
+        return sorted(int(i) for i in query(geom))
+
+    def containing(self, x: float, y: float) -> Optional[int]:
+        """The position of the first geometry that contains the point
+        (x, y), or None.
+        """
+        p = shapely.geometry.Point(x, y)
+        prepared = self.prepared()
+        for i in self.candidates(p):
+            if prepared[i].contains(p):
+                return i
+        return None
+
+    def simplified(self, tolerance: Optional[float] = None) -> List:
+        """The geometries simplified to within `tolerance` degrees,
+        preserving topology.
+
+        Borders shared by neighbouring geometries are simplified once,
+        together, so that neighbours still meet without gaps or
+        overlaps. A geometry whose faces all collapse is simplified on
+        its own. Tolerances finer than at `SIMPLIFY_MAX_ZOOM` leave the
+        geometries alone. Each tolerance is simplified by one thread
+        at a time, the others waiting for its result.
+        """
+        if not tolerance or tolerance < simplify_tolerance(SIMPLIFY_MAX_ZOOM):
+            return self.geoms
+        geoms = self._simplified.get(tolerance)
+        if geoms is not None:
+            return geoms
+        with self._lock:
+            lock = self._simplifying.setdefault(tolerance, threading.Lock())
+        with lock:
+            geoms = self._simplified.get(tolerance)
+            if geoms is None:
+                geoms = self._simplify_shared(tolerance)
+                self._simplified.put(tolerance, geoms)
+        with self._lock:
+            self._simplifying.pop(tolerance, None)
+        return geoms
+
+    def _simplify_shared(self, tolerance: float) -> List:
+        # Node the borders of all geometries, merge them into arcs
+        # between junctions, and simplify the arcs together, which keeps
+        # their ends and keeps them from crossing one another.
+        arcs = shapely.ops.unary_union([g.boundary for g in self.geoms])
+        if arcs.geom_type == "MultiLineString":
+            arcs = shapely.ops.linemerge(arcs)
+        arcs = arcs.simplify(tolerance, preserve_topology=True)
+        # Rebuild the faces between the arcs and give each one to the
+        # geometry it came from. Borders moved by at most `tolerance`,
+        # so a point further than that inside a face is inside its
+        # geometry; thinner faces go to the geometry that overlaps them
+        # most. Holes and gaps between geometries belong to none.
+        prepared = self.prepared()
+        faces = [[] for _ in self.geoms]
+        for face in shapely.ops.polygonize(arcs):
+            p = face.representative_point()
+            if face.boundary.distance(p) > tolerance:
+                for i in self.candidates(p):
+                    if prepared[i].contains(p):
+                        faces[i].append(face)
+            else:
+                area, i = max(
+                    ((face.intersection(self.geoms[i]).area, i)
+                     for i in self.candidates(face)),
+                    default=(0, None),
+                )
+                if area > 0:
+                    faces[i].append(face)
+        return [
+            shapely.ops.unary_union(f) if f else g.simplify(tolerance)
+            for g, f in zip(self.geoms, faces)
+        ]
+
+    def geojson(
+        self, tolerance: Optional[float] = None, ndigits: Optional[int] = None
+    ) -> dict:
+        """A GeoJSON-like dict of the (simplified) geometries, each
+        feature carrying its label, suitable for a dash_leaflet GeoJSON
+        component. Coordinates are rounded to `ndigits` decimals if
+        given.
+        """
+        if tolerance and tolerance < simplify_tolerance(SIMPLIFY_MAX_ZOOM):
+            tolerance = None
+        features = self._geojson.get((tolerance, ndigits))
+        if features is None:
+            features = []
+            for label, g in zip(self.labels, self.simplified(tolerance)):
+                feature = shapely.geometry.mapping(to_multipolygon(g))
+                if ndigits is not None:
+                    feature = dict(
+                        feature,
+                        coordinates=round_coordinates(feature["coordinates"], ndigits),
+                    )
+                feature["label"] = label
+                features.append(feature)
+            self._geojson.put((tolerance, ndigits), features)
+        return {"features": features}
+
+
+def round_coordinates(coords, ndigits: int):
+    """Round the nested coordinates of a GeoJSON geometry."""
+    if len(coords) == 0:
+        return []
+    if isinstance(coords[0], (int, float)):
+        return [round(c, ndigits) for c in coords]
+    return [round_coordinates(c, ndigits) for c in coords]
+
+
+def zoom_band(zoom: float, width: int = 2) -> int:
+    """The first zoom level of the band of `width` levels containing
+    `zoom`. Borders are simplified once per band rather than per level.
+    """
+    return int(zoom // width * width)
+
+
+# Beyond this zoom level geometries are drawn as they are: a screen
+# pixel is then about 20 m, as fine as admin boundaries are digitized.
+SIMPLIFY_MAX_ZOOM = 12
+
+
+def simplify_tolerance(zoom: float, tile_size: int = 256) -> float:
+    """Half the width in degrees of a screen pixel at `zoom`, i.e. a
+    simplification tolerance that is invisible at that zoom level.
+    """
+    return 360 / (tile_size * 2 ** zoom) / 2
+
+
+def tolerance_digits(tolerance: float) -> int:
+    """Enough decimals to represent coordinates to within `tolerance`."""
+    return max(0, math.ceil(-math.log10(tolerance))) + 1
+
+
+class GeometryStore:
+    """Loads sets of admin geometries on demand and keeps them.
+
+    Parameters
+    ----------
+    load : callable
+        maps a source, e.g. an SQL query, to a DataFrame as expected by
+        `GeometrySet`.
+    ttl : float, optional
+        seconds after which a set is loaded again on its next use
+        (default: kept until `reload`).
+    """
+
+    def __init__(self, load, ttl: Optional[float] = None):
+        self.load = load
+        self.ttl = ttl
+        self._sets = {}
+        self._lock = threading.Lock()
+        self._loading = collections.defaultdict(threading.Lock)
+        self.loads = 0
+        self.hits = 0
+
+    def get(self, source) -> GeometrySet:
+        with self._lock:
+            entry = self._sets.get(source)
+            if entry is not None and not self._expired(entry):
+                self.hits += 1
+                return entry[0]
+            loading = self._loading[source]
+        # Load each source once even if many requests need it at once.
+        with loading:
+            with self._lock:
+                entry = self._sets.get(source)
+                if entry is not None and not self._expired(entry):
+                    self.hits += 1
+                    return entry[0]
+            gs = GeometrySet(self.load(source))
+            with self._lock:
+                self._sets[source] = (gs, time.monotonic())
+                self.loads += 1
+            return gs
+
+    def _expired(self, entry) -> bool:
+        return self.ttl is not None and time.monotonic() - entry[1] > self.ttl
+
+    def reload(self, source=None):
+        """Forget `source`, or all sources, so that they are loaded again
+        on their next use.
+        """
+        with self._lock:
+            if source is None:
+                self._sets.clear()
+            else:
+                self._sets.pop(source, None)
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                sets=len(self._sets),
+                geometries=sum(len(gs) for gs, _ in self._sets.values()),
+                loads=self.loads,
+                hits=self.hits,
+            )
+
+
+# Choropleths
+
+# A choropleth tile is drawn by rasterizing all the geometries of a set
+# once into a raster of labels, then looking up the color of each label.
+# The labels and outlines only depend on the geometries and the tile,
+# so they are cached and reused whatever the values being mapped.
+
+LABEL_CACHE = LRUCache(64 * 2 ** 20, sizeof=lambda a: a.nbytes)
+
+
+def polygons_of(geom) -> List[Polygon]:
+    """The non-empty polygons of a geometry, e.g. of an intersection,
+    which can be a collection including points and lines."""
+    if isinstance(geom, Polygon):
+        return [] if geom.is_empty else [geom]
+    return [p for g in getattr(geom, "geoms", []) for p in polygons_of(g)]
+
+
+def lines_of(geom) -> List:
+    """The non-empty lines of a geometry, e.g. of an intersection."""
+    if isinstance(geom, (shapely.geometry.LineString, LinearRing)):
+        return [] if geom.is_empty else [geom]
+    return [l for g in getattr(geom, "geoms", []) for l in lines_of(g)]
+
+
+def tile_to_pixels(tx, ty, tz, tile_width, tile_height, shift):
+    """The bounding box of tile (tx, ty, tz) and a function mapping a
+    line or ring to fixed-point pixel coordinates within the tile, as
+    expected by cv2 drawing functions with the given `shift`.
+    """
+    (x0, x1), (y0, y1) = tile_pixel_edges(tx, ty, tz, 1, 1)
+    tile = shapely.geometry.box(x0, min(y0, y1), x1, max(y0, y1))
+    x_ratio = tile_width / (x1 - x0)
+    y0_mercator = deg_to_mercator(y0)
+    y_ratio_mercator = tile_height / (deg_to_mercator(y1) - y0_mercator)
+    scale = 2 ** shift
+
+    def pixels(line):
+        xs, ys = line.coords.xy
+        # Pixel centers are at half-integer coordinates.
+        xs = ((np.array(xs) - x0) * x_ratio - 0.5) * scale
+        ys = ((deg_to_mercator(np.array(ys)) - y0_mercator) * y_ratio_mercator - 0.5) * scale
+        return np.column_stack((xs, ys)).round().astype(np.int32)
+
+    return tile, pixels
+
+
+def label_tile(
+    gs: GeometrySet,
+    tx: int,
+    ty: int,
+    tz: int,
+    tile_width: int = 256,
+    tile_height: int = 256,
+) -> np.ndarray:
+    """A raster of the geometries of `gs` over a tile: 1 + the position
+    of the geometry covering each pixel, or 0 where there is none. Later
+    geometries are drawn over earlier ones.
+    """
+    key = ("labels", gs.key(), tx, ty, tz, tile_width, tile_height)
+    labels = LABEL_CACHE.get(key)
+    if labels is None:
+        tile, pixels = tile_to_pixels(tx, ty, tz, tile_width, tile_height, 4)
+        prepared = gs.prepared()
+        labels = np.zeros((tile_height, tile_width), np.int32)
+        for i in gs.candidates(tile):
+            if prepared[i].contains(tile):
+                labels[:] = i + 1
+            elif prepared[i].intersects(tile):
+                for p in polygons_of(tile.intersection(gs.geoms[i])):
+                    # Rings are filled together, so holes are left as
+                    # they are.
+                    rings = [pixels(p.exterior)] + [pixels(q) for q in p.interiors]
+                    cv2.fillPoly(labels, rings, i + 1, cv2.LINE_8, 4)
+        labels.flags.writeable = False
+        LABEL_CACHE.put(key, labels)
+    return labels
+
+
+def outline_tile(
+    gs: GeometrySet,
+    tx: int,
+    ty: int,
+    tz: int,
+    tile_width: int = 256,
+    tile_height: int = 256,
+    thickness: int = 1,
+) -> np.ndarray:
+    """An antialiased mask of the outlines of the geometries of `gs`
+    over a tile.
+    """
+    key = ("outlines", gs.key(), tx, ty, tz, tile_width, tile_height, thickness)
+    mask = LABEL_CACHE.get(key)
+    if mask is None:
+        tile, pixels = tile_to_pixels(tx, ty, tz, tile_width, tile_height, 4)
+        # Extend the tile so that lines along its edges are drawn.
+        margin = tile.buffer(
+            (tile.bounds[2] - tile.bounds[0]) * (thickness + 1) / tile_width,
+            join_style=2,
+        )
+        lines = [
+            pixels(line)
+            for i in gs.candidates(margin)
+            for line in lines_of(margin.intersection(gs.geoms[i].boundary))
+        ]
+        mask = np.zeros((tile_height, tile_width), np.uint8)
+        cv2.polylines(mask, lines, False, 255, thickness, cv2.LINE_AA, 4)
+        mask.flags.writeable = False
+        LABEL_CACHE.put(key, mask)
+    return mask
+
+
+def produce_choropleth_tile(
+    gs: GeometrySet,
+    colors: np.ndarray,
+    tx: int,
+    ty: int,
+    tz: int,
+    tile_width: int = 256,
+    tile_height: int = 256,
+    outline: Optional[DrawAttrs] = None,
+) -> np.ndarray:
+    """Draw the geometries of `gs` filled with `colors`, an array of one
+    BGRA color per geometry, preceded by the background color. If
+    `outline` is given, its line color and thickness are used to draw
+    the outlines over the fill.
+    """
+    labels = label_tile(gs, tx, ty, tz, tile_width, tile_height)
+    im = colors[labels]
+    if outline is not None:
+        mask = outline_tile(
+            gs, tx, ty, tz, tile_width, tile_height, outline.line_thickness
+        )
+        apply_mask(im, mask, outline.line_color, out=im)
+    return im
+
+
+# Vector tiles
+
+# Admin boundaries can be served as Mapbox Vector Tiles
+# (https://github.com/mapbox/vector-tile-spec), so that browsers only
+# load the geometry visible at the current zoom level, simplified for
+# it. Tiles are small and few fields are needed, so they are encoded
+# here rather than with a protobuf library.
+
+MVT_MIMETYPE = "application/vnd.mapbox-vector-tile"
+
+
+def _varint(n: int) -> bytes:
+    out = bytearray()
+    while n > 0x7f:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+def _zigzag(n: int) -> int:
+    return (n << 1) ^ (n >> 63)
+
+
+def _pb_varint(field: int, n: int) -> bytes:
+    return _varint(field << 3) + _varint(n)
+
+
+def _pb_bytes(field: int, data: bytes) -> bytes:
+    return _varint(field << 3 | 2) + _varint(len(data)) + data
+
+
+def _pb_packed(field: int, ns: Iterable) -> bytes:
+    return _pb_bytes(field, b"".join(_varint(n) for n in ns))
+
+
+def _mvt_command(command: int, count: int) -> int:
+    return (command & 0x7) | (count << 3)
+
+
+def _mvt_rings(p: Polygon, quantize) -> List[np.ndarray]:
+    """The rings of a polygon in tile coordinates, without repeated or
+    closing points, with the winding order required by the spec:
+    exterior rings have positive area (clockwise with y down), interior
+    rings negative. Rings that collapse once quantized are dropped,
+    along with the holes of a collapsed exterior.
+    """
+    rings = []
+    for i, ring in enumerate([p.exterior, *p.interiors]):
+        pts = quantize(ring)
+        keep = np.ones(len(pts), bool)
+        keep[1:] = (pts[1:] != pts[:-1]).any(axis=1)
+        pts = pts[keep]
+        if len(pts) > 1 and (pts[0] == pts[-1]).all():
+            pts = pts[:-1]
+        if len(pts) < 3:
+            if i == 0:
+                return []
+            continue
+        x = pts[:, 0].astype(np.int64)
+        y = pts[:, 1].astype(np.int64)
+        area = int(np.sum(x * np.roll(y, -1) - np.roll(x, -1) * y))
+        if area == 0:
+            if i == 0:
+                return []
+            continue
+        if (area > 0) != (i == 0):
+            pts = pts[::-1]
+        rings.append(pts)
+    return rings
+
+
+def _mvt_polygon_geometry(polygons: List[List[np.ndarray]]) -> List[int]:
+    commands = []
+    cx, cy = 0, 0
+    for rings in polygons:
+        for pts in rings:
+            deltas = np.diff(pts, axis=0, prepend=[[cx, cy]])
+            commands.append(_mvt_command(1, 1))
+            commands += [_zigzag(int(d)) for d in deltas[0]]
+            commands.append(_mvt_command(2, len(pts) - 1))
+            commands += [_zigzag(int(d)) for d in deltas[1:].ravel()]
+            commands.append(_mvt_command(7, 1))
+            cx, cy = (int(v) for v in pts[-1])
+    return commands
+
+
+def encode_mvt_tile(
+    gs: GeometrySet,
+    tx: int,
+    ty: int,
+    tz: int,
+    layer: str = "admin",
+    extent: int = 4096,
+    buffer: int = 64,
+) -> bytes:
+    """A Mapbox Vector Tile with one layer of the geometries of `gs`
+    that intersect tile (tx, ty, tz), simplified for its zoom level and
+    clipped to the tile plus `buffer` units. Features have the position
+    of the geometry plus one as id, and its key and label as properties.
+    """
+    (x0, x1), (y0, y1) = tile_pixel_edges(tx, ty, tz, 1, 1)
+    y0_mercator = deg_to_mercator(y0)
+    y1_mercator = deg_to_mercator(y1)
+    x_pad = (x1 - x0) * buffer / extent
+    y_pad = (y1_mercator - y0_mercator) * buffer / extent
+    clip = shapely.geometry.box(
+        x0 - x_pad,
+        min(mercator_to_deg(y0_mercator - y_pad), mercator_to_deg(y1_mercator + y_pad)),
+        x1 + x_pad,
+        max(mercator_to_deg(y0_mercator - y_pad), mercator_to_deg(y1_mercator + y_pad)),
+    )
+
+    def quantize(line):
+        xs, ys = line.coords.xy
+        xs = (np.array(xs) - x0) * extent / (x1 - x0)
+        ys = (deg_to_mercator(np.array(ys)) - y0_mercator) * extent / (y1_mercator - y0_mercator)
+        return np.column_stack((xs, ys)).round().astype(np.int64)
+
+    geoms = gs.simplified(simplify_tolerance(tz))
+    keys = ["key", "label"]
+    values = {}
+    features = []
+    for i in gs.candidates(clip):
+        polygons = [
+            rings
+            for p in polygons_of(clip.intersection(geoms[i]))
+            for rings in [_mvt_rings(p, quantize)]
+            if rings
+        ]
+        if not polygons:
+            continue
+        tags = []
+        for k, v in enumerate([str(gs.keys[i]), str(gs.labels[i])]):
+            tags += [k, values.setdefault(v, len(values))]
+        features.append(
+            _pb_varint(1, i + 1)
+            + _pb_packed(2, tags)
+            + _pb_varint(3, 3)  # POLYGON
+            + _pb_packed(4, _mvt_polygon_geometry(polygons))
+        )
+
+    data = (
+        _pb_varint(15, 2)
+        + _pb_bytes(1, layer.encode())
+        + b"".join(_pb_bytes(2, f) for f in features)
+        + b"".join(_pb_bytes(3, k.encode()) for k in keys)
+        + b"".join(_pb_bytes(4, _pb_bytes(1, v.encode())) for v in values)
+        + _pb_varint(5, extent)
+    )
+    return _pb_bytes(3, data)
+
+
+def add_mvt_route(
+    server: flask.Flask,
+    rule: str,
+    geometries: Callable[..., GeometrySet],
+    cache: Optional[TileCache] = None,
+    layer: str = "admin",
+):
+    """Add a route to `server` that serves the geometries returned by
+    `geometries` as vector tiles. `rule` must have `tz`, `tx` and `ty`
+    integer arguments; its other arguments are passed to `geometries`.
+    Tiles are cached in `cache` and versioned by the geometries.
+    """
+    def version(tz, tx, ty, **kwargs):
+        return geometries(**kwargs).key()
+
+    @cache_tile(cache, version)
+    def mvt_route(tz, tx, ty, **kwargs):
+        data = encode_mvt_tile(geometries(**kwargs), tx, ty, tz, layer)
+        return flask.Response(data, mimetype=MVT_MIMETYPE)
+
+    server.add_url_rule(rule, f"mvt:{rule}", mvt_route)
+
+
+# Database connections
+
+# Shape and vulnerability queries are run for many tiles and callbacks,
+# so connections are reused rather than opened per query. A pool
+# belongs to the process that created it: connections inherited
+# through a fork are abandoned, not closed, since closing them would
+# also end the parent's sessions.
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """A bounded, thread-safe pool of database connections.
+
+    Parameters
+    ----------
+    connect : callable
+        opens a new connection, e.g. a partial of `psycopg2.connect`.
+    max_size : int, optional
+        maximum number of connections open at once, idle or in use.
+    timeout : float, optional
+        seconds to wait for a connection when `max_size` are in use
+        before raising `PoolTimeout`.
+    check_after : float, optional
+        a connection that has been idle for more than this many
+        seconds is checked with a trivial query before it is reused,
+        and replaced if it is broken.
+    """
+
+    def __init__(self, connect, max_size=4, timeout=30.0, check_after=60.0):
+        self.connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_after = check_after
+        self._cond = threading.Condition()
+        self._idle = []
+        self._size = 0
+        self._pid = os.getpid()
+        self._inherited = []
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.created = 0
+        self.discarded = 0
+        self.timeouts = 0
+
+    def _check_pid(self):
+        if os.getpid() != self._pid:
+            self._inherited.extend(conn for conn, _ in self._idle)
+            self._idle = []
+            self._size = 0
+            self._pid = os.getpid()
+
+    def _acquire(self):
+        start = time.monotonic()
+        with self._cond:
+            self._check_pid()
+            waited = False
+            while not self._idle and self._size >= self.max_size:
+                waited = True
+                remaining = self.timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(
+                        f"no database connection available after {self.timeout}s"
+                    )
+                self._cond.wait(remaining)
+                self._check_pid()
+            self.checkouts += 1
+            if waited:
+                self.waits += 1
+                self.wait_seconds += time.monotonic() - start
+            if self._idle:
+                conn, idle_since = self._idle.pop()
+            else:
+                conn, idle_since = None, None
+                self._size += 1
+
+        if conn is not None and not self._healthy(conn, idle_since):
+            self._close(conn)
+            conn = None
+        if conn is None:
+            try:
+                conn = self.connect()
+            except BaseException:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self.created += 1
+        return conn
+
+    def _healthy(self, conn, idle_since):
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since <= self.check_after:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("select 1")
+            conn.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def _close(self, conn):
+        with self._cond:
+            self.discarded += 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _release(self, conn, discard=False):
+        with self._cond:
+            if os.getpid() != self._pid:
+                self._inherited.append(conn)
+                return
+            if discard or conn.closed:
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+        if discard and not conn.closed:
+            self._close(conn)
+
+    @contextlib.contextmanager
+    def connection(self):
+        """A context manager that checks out a connection and returns it
+        to the pool afterwards. Like `with psycopg2.connect(...) as
+        conn`, the transaction is committed on success and rolled back
+        on error. A connection that fails is discarded, and a new one
+        is opened the next time one is needed.
+        """
+        conn = self._acquire()
+        try:
+            with conn:
+                yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            self._release(conn, discard=True)
+            raise
+        except BaseException:
+            self._release(conn)
+            raise
+        self._release(conn)
+
+    def close(self):
+        """Close the idle connections."""
+        with self._cond:
+            self._check_pid()
+            idle = self._idle
+            self._idle = []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close(conn)
+
+    def stats(self):
+        with self._cond:
+            return dict(
+                size=self._size,
+                idle=len(self._idle),
+                in_use=self._size - len(self._idle),
+                max_size=self.max_size,
+                checkouts=self.checkouts,
+                waits=self.waits,
+                wait_seconds=self.wait_seconds,
+                created=self.created,
+                discarded=self.discarded,
+                timeouts=self.timeouts,
+            )
+
+
+_DB_POOLS = {}
+_DB_POOLS_LOCK = threading.Lock()
+
+
+def db_pool(db_config: dict) -> ConnectionPool:
+    """The shared connection pool of the database described by
+    `db_config`, i.e. the keyword arguments of `psycopg2.connect`,
+    plus an optional `pool` mapping of `ConnectionPool` options.
+    """
+    db_config = dict(db_config)
+    options = db_config.pop("pool", None) or {}
+    key = json.dumps([db_config, options], sort_keys=True, default=str)
+    with _DB_POOLS_LOCK:
+        pool = _DB_POOLS.get(key)
+        if pool is None:
+            pool = ConnectionPool(
+                functools.partial(psycopg2.connect, **db_config), **options
+            )
+            _DB_POOLS[key] = pool
+    return pool
+
+
 # Flask utils
 
 